@@ -0,0 +1,122 @@
+"""
+Requêtes groupées pour BaseGenspark API
+=======================================
+
+Un tour d'agent enchaîne souvent plusieurs appels (mise à jour de la
+session, planning, recherche CRM). `POST /batch` les reçoit en une seule
+requête HTTPS et les rejoue en interne contre l'application ASGI : chaque
+opération traverse les mêmes middlewares (débit, cloisonnement,
+idempotence, ETag) et la même vérification de token qu'un appel direct.
+
+- opérations indépendantes exécutées en parallèle (au plus `concurrency`)
+- `depends_on` : attendre des opérations déclarées plus haut ; si l'une
+  a échoué, l'opération n'est pas exécutée (424)
+- un statut HTTP par opération dans la réponse
+"""
+
+import asyncio
+import posixpath
+import time
+from typing import Any, Dict, Iterable, List
+from urllib.parse import unquote
+
+import httpx
+
+import metrics
+from structured_log import request_id_var
+
+# En-têtes d'authentification de la requête groupée transmis à chaque opération
+FORWARDED_HEADERS = ("x-agent-token", "x-agent-name", "authorization")
+# En-têtes de réponse utiles aux agents, recopiés dans chaque résultat
+RESULT_HEADERS = ("etag", "cache-control", "retry-after", "idempotent-replayed")
+
+
+def normalize_path(path: str) -> str:
+    """
+    Chemin tel que l'application le verra (ValueError si ambigu)
+
+    httpx résout les segments `.` / `..` avant l'envoi : `/x/../batch` serait
+    un /batch imbriqué. On refuse ces segments (y compris encodés) et les
+    chemins `//...` (lus comme un hôte).
+    """
+    raw = unquote(path.split("?", 1)[0])
+    if not raw.startswith("/") or raw.startswith("//") or "\\" in raw:
+        raise ValueError(f"Chemin non autorisé dans un lot : {path}")
+    if any(segment in (".", "..") for segment in raw.split("/")):
+        raise ValueError(f"Segments . et .. interdits dans un lot : {path}")
+    return posixpath.normpath(raw)
+
+
+def validate_operations(operations: List[Dict[str, Any]], max_operations: int, excluded_paths: Iterable[str]):
+    """ValueError si le lot est vide, trop long, ou mal formé"""
+    if not operations:
+        raise ValueError("Aucune opération")
+    if len(operations) > max_operations:
+        raise ValueError(f"Au plus {max_operations} opérations par requête")
+    excluded = tuple(excluded_paths)
+    seen = set()
+    for operation in operations:
+        if operation["id"] in seen:
+            raise ValueError(f"Identifiant d'opération en double : {operation['id']}")
+        if normalize_path(operation["path"]).startswith(excluded):
+            raise ValueError(f"Chemin non autorisé dans un lot : {operation['path']}")
+        for dependency in operation["depends_on"]:
+            if dependency not in seen:
+                raise ValueError(f"{operation['id']} dépend de {dependency}, qui doit être déclarée avant")
+        seen.add(operation["id"])
+
+
+def _result(operation_id: str, status: int, body: Any, headers: Dict[str, str], started: float) -> Dict[str, Any]:
+    return {
+        "id": operation_id,
+        "status": status,
+        "headers": headers,
+        "body": body,
+        "duration_ms": round((time.perf_counter() - started) * 1000, 1)
+    }
+
+
+async def _send(client: httpx.AsyncClient, operation: Dict[str, Any], headers: Dict[str, str], request_id: str) -> Dict[str, Any]:
+    started = time.perf_counter()
+    try:
+        response = await client.request(
+            operation["method"],
+            operation["path"],
+            params=operation.get("params"),
+            json=operation.get("body"),
+            headers={**headers, **(operation.get("headers") or {}), "x-request-id": request_id}
+        )
+    except Exception as e:
+        return _result(operation["id"], 500, {"detail": str(e)}, {}, started)
+
+    if response.headers.get("content-type", "").startswith("application/json") and response.content:
+        body = response.json()
+    else:
+        body = response.text or None
+    result_headers = {name: response.headers[name] for name in RESULT_HEADERS if name in response.headers}
+    return _result(operation["id"], response.status_code, body, result_headers, started)
+
+
+async def run_batch(app, operations: List[Dict[str, Any]], headers: Dict[str, str], concurrency: int) -> List[Dict[str, Any]]:
+    """Exécuter le lot contre `app` ; résultats dans l'ordre des opérations"""
+    semaphore = asyncio.Semaphore(concurrency)
+    parent_id = request_id_var.get() or "batch"
+    tasks: Dict[str, asyncio.Task] = {}
+
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with httpx.AsyncClient(transport=transport, base_url="http://batch") as client:
+
+        async def run(operation: Dict[str, Any]) -> Dict[str, Any]:
+            started = time.perf_counter()
+            for dependency in operation["depends_on"]:
+                if (await tasks[dependency])["status"] >= 400:
+                    metrics.incr("batch_operations_total", result="skipped")
+                    return _result(operation["id"], 424, {"detail": f"Opération {dependency} en échec"}, {}, started)
+            async with semaphore:
+                result = await _send(client, operation, headers, f"{parent_id}.{operation['id']}")
+            metrics.incr("batch_operations_total", result="ok" if result["status"] < 400 else "error")
+            return result
+
+        for operation in operations:
+            tasks[operation["id"]] = asyncio.create_task(run(operation))
+        return list(await asyncio.gather(*tasks.values()))
@@ -0,0 +1,159 @@
+"""
+Cloisonnement (bulkheads) pour BaseGenspark API
+===============================================
+
+Chaque classe de routes dispose de son propre pool de concurrence,
+de sa propre file d'attente bornée et de son propre délai d'attente.
+Une rafale de tableaux de bord CRM ne peut donc plus retarder les
+écritures des agents pédagogiques.
+
+Configuration par variable d'environnement :
+    BULKHEAD_<CLASSE>=concurrence:file:délai_secondes
+    ex. BULKHEAD_ANALYTICS=2:10:20
+
+Concurrence et file sont globales à l'instance : avec WEB_CONCURRENCY
+workers, chaque worker en reçoit une part (`per_worker_limits`, arrondie
+au supérieur pour garder au moins une place par classe).
+"""
+
+import asyncio
+import math
+import os
+from typing import Dict, List, Tuple
+
+from fastapi.responses import JSONResponse
+
+import metrics
+
+# (classe, préfixes de chemin) — la première correspondance l'emporte
+ROUTE_CLASSES: List[Tuple[str, Tuple[str, ...]]] = [
+    ("agent", ("/agent/",)),
+    ("analytics", ("/crm/pipeline", "/crm/stats", "/planning/stats", "/admin/analytics")),
+    ("planning", ("/planning/",)),
+    ("crm", ("/crm/",)),
+    ("admin", ("/admin/",)),
+]
+
+# classe → (concurrence, taille de file, délai d'attente en secondes)
+DEFAULT_LIMITS: Dict[str, Tuple[int, int, float]] = {
+    "agent": (16, 64, 10.0),
+    "planning": (8, 32, 10.0),
+    "analytics": (3, 10, 20.0),
+    "crm": (6, 32, 15.0),
+    "admin": (4, 16, 15.0),
+    "default": (6, 32, 10.0),
+}
+
+
+class BulkheadFull(Exception):
+    """Plus de place dans la file d'attente ou délai dépassé"""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class Bulkhead:
+    """Pool de concurrence borné, avec file d'attente bornée et délai max"""
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, queue_timeout: float):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.queued = 0
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+
+    async def acquire(self):
+        if self._semaphore.locked():
+            if self.queued >= self.max_queue:
+                raise BulkheadFull("queue_full")
+            self.queued += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                raise BulkheadFull("timeout")
+            finally:
+                self.queued -= 1
+        else:
+            await self._semaphore.acquire()
+        self.in_flight += 1
+
+    def release(self):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+
+def parse_limits(env=os.environ) -> Dict[str, Tuple[int, int, float]]:
+    """Limites par défaut surchargées par les variables BULKHEAD_<CLASSE>"""
+    limits = dict(DEFAULT_LIMITS)
+    for route_class in limits:
+        raw = env.get(f"BULKHEAD_{route_class.upper()}")
+        if raw:
+            concurrency, queue, timeout = raw.split(":")
+            limits[route_class] = (int(concurrency), int(queue), float(timeout))
+    return limits
+
+
+def per_worker_limits(limits: Dict[str, Tuple[int, int, float]], workers: int) -> Dict[str, Tuple[int, int, float]]:
+    """Part des limites globales revenant à un worker (le délai ne change pas)"""
+    workers = max(1, workers)
+    return {
+        route_class: (math.ceil(concurrency / workers), math.ceil(queue / workers), timeout)
+        for route_class, (concurrency, queue, timeout) in limits.items()
+    }
+
+
+def classify(path: str) -> str:
+    for route_class, prefixes in ROUTE_CLASSES:
+        if path.startswith(prefixes):
+            return route_class
+    return "default"
+
+
+class BulkheadMiddleware:
+    """Middleware ASGI : chaque requête passe par le pool de sa classe de routes"""
+
+    def __init__(self, app, limits: Dict[str, Tuple[int, int, float]], exempt_paths=()):
+        self.app = app
+        self.exempt_paths = set(exempt_paths)
+        self.bulkheads = {
+            route_class: Bulkhead(route_class, *route_limits)
+            for route_class, route_limits in limits.items()
+        }
+
+    def _publish(self, bulkhead: Bulkhead):
+        metrics.set_gauge("bulkhead_in_flight", bulkhead.in_flight, pool=bulkhead.name)
+        metrics.set_gauge("bulkhead_queued", bulkhead.queued, pool=bulkhead.name)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exempt_paths or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        bulkhead = self.bulkheads[classify(scope["path"])]
+        try:
+            await bulkhead.acquire()
+        except BulkheadFull as e:
+            metrics.incr("bulkhead_rejected_total", pool=bulkhead.name, reason=e.reason)
+            self._publish(bulkhead)
+            response = JSONResponse(
+                status_code=503,
+                content={"detail": f"Service saturé ({bulkhead.name}), réessayez plus tard"},
+                headers={"Retry-After": str(max(1, int(bulkhead.queue_timeout / 2)))}
+            )
+            await response(scope, receive, send)
+            return
+
+        self._publish(bulkhead)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            bulkhead.release()
+            self._publish(bulkhead)
+
+
+def total_capacity(limits: Dict[str, Tuple[int, int, float]]) -> int:
+    """Somme des concurrences : dimensionne le threadpool et le pool HTTP"""
+    return sum(concurrency for concurrency, _, _ in limits.values())
@@ -0,0 +1,167 @@
+"""
+Analytique CA en colonnes pour BaseGenspark API
+===============================================
+
+Les sessions d'une période sont chargées une seule fois (colonnes utiles
+uniquement) dans des tableaux `array` compacts : mois, établissement,
+module, ca_ht, ca_ttc, duree_facturee_h. Les sommes groupées de toutes
+les mesures sont ensuite calculées en un seul passage, et renvoyées sous
+forme de séries mensuelles alignées sur la même liste de périodes.
+"""
+
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from supabase_client import SUPABASE_PAGE_SIZE, supabase
+
+MEASURES = ("ca_ht", "ca_ttc", "duree_facturee_h")
+GROUPS = {"etablissement": "etablissement_id", "module": "module_id"}
+COLUMNS = "id,date,etablissement_id,module_id,ca_ht,ca_ttc,duree_facturee_h"
+NO_ID = -1
+
+
+def month_index(value: str) -> int:
+    """'2026-03' ou '2026-03-14' → indice de mois absolu"""
+    return int(value[:4]) * 12 + int(value[5:7]) - 1
+
+
+def month_label(index: int) -> str:
+    return f"{index // 12}-{index % 12 + 1:02d}"
+
+
+def month_start(index: int) -> str:
+    return f"{month_label(index)}-01"
+
+
+class SessionColumns:
+    """Colonnes des sessions planning (une entrée par session)"""
+
+    def __init__(self):
+        self.months = array("i")
+        self.etablissement_ids = array("i")
+        self.module_ids = array("i")
+        self.ca_ht = array("d")
+        self.ca_ttc = array("d")
+        self.duree_facturee_h = array("d")
+
+    def __len__(self) -> int:
+        return len(self.months)
+
+    def extend(self, rows: Iterable[Dict[str, Any]]):
+        for row in rows:
+            self.months.append(month_index(str(row["date"])))
+            self.etablissement_ids.append(row.get("etablissement_id") or NO_ID)
+            self.module_ids.append(row.get("module_id") or NO_ID)
+            self.ca_ht.append(float(row.get("ca_ht") or 0))
+            self.ca_ttc.append(float(row.get("ca_ttc") or 0))
+            self.duree_facturee_h.append(float(row.get("duree_facturee_h") or 0))
+
+    def grouped_sums(
+        self,
+        first_month: int,
+        n_months: int,
+        group_by: Tuple[str, ...]
+    ) -> Dict[Tuple[int, ...], Tuple[array, array, array]]:
+        """
+        Sommes par groupe et par mois, en un seul passage sur les colonnes
+
+        Retourne {clé de groupe: (ca_ht[mois], ca_ttc[mois], heures[mois])}.
+        Les sessions hors de [first_month, first_month + n_months[ sont ignorées.
+        """
+        key_columns = [self.etablissement_ids if g == "etablissement" else self.module_ids for g in group_by]
+        sums: Dict[Tuple[int, ...], Tuple[array, array, array]] = {}
+        zeros = array("d", [0.0]) * n_months
+        for i, month in enumerate(self.months):
+            offset = month - first_month
+            if offset < 0 or offset >= n_months:
+                continue
+            key = tuple(column[i] for column in key_columns)
+            bucket = sums.get(key)
+            if bucket is None:
+                bucket = sums[key] = (array("d", zeros), array("d", zeros), array("d", zeros))
+            bucket[0][offset] += self.ca_ht[i]
+            bucket[1][offset] += self.ca_ttc[i]
+            bucket[2][offset] += self.duree_facturee_h[i]
+        return sums
+
+
+def load_columns(date_gte: str, date_lt: str) -> SessionColumns:
+    """Charger les colonnes utiles depuis Supabase (pagination par id)"""
+    columns = SessionColumns()
+    last_id = None
+    while True:
+        query = (
+            supabase.query("planning_sessions")
+            .select(COLUMNS)
+            .gte("date", date_gte)
+            .lt("date", date_lt)
+            .order("id.asc")
+            .limit(SUPABASE_PAGE_SIZE)
+        )
+        if last_id is not None:
+            query.gt("id", last_id)
+        response = supabase.get(query)
+        response.raise_for_status()
+        page = response.json()
+        columns.extend(page)
+        if len(page) < SUPABASE_PAGE_SIZE:
+            return columns
+        last_id = page[-1]["id"]
+
+
+def _rounded(values: array) -> List[float]:
+    return [round(value, 2) for value in values]
+
+
+def build_series(
+    columns: SessionColumns,
+    first_month: int,
+    n_months: int,
+    group_by: Tuple[str, ...],
+    year_over_year: bool = False
+) -> Dict[str, Any]:
+    """Séries alignées sur les mois demandés (et l'année précédente si `year_over_year`)"""
+    current = columns.grouped_sums(first_month, n_months, group_by)
+    previous = columns.grouped_sums(first_month - 12, n_months, group_by) if year_over_year else {}
+    empty = tuple(array("d", [0.0]) * n_months for _ in MEASURES)
+
+    series = []
+    totals = [array("d", [0.0]) * n_months for _ in MEASURES]
+    for key in sorted(set(current) | set(previous)):
+        sums = current.get(key, empty)
+        entry: Dict[str, Any] = {
+            GROUPS[group]: (value if value != NO_ID else None)
+            for group, value in zip(group_by, key)
+        }
+        for index, measure in enumerate(MEASURES):
+            entry[measure] = _rounded(sums[index])
+            for offset, value in enumerate(sums[index]):
+                totals[index][offset] += value
+        if year_over_year:
+            previous_sums = previous.get(key, empty)
+            entry["previous_year"] = {
+                measure: _rounded(values) for measure, values in zip(MEASURES, previous_sums)
+            }
+            entry["yoy_ca_ht_pct"] = [
+                round((now - before) / before * 100, 1) if before else None
+                for now, before in zip(sums[0], previous_sums[0])
+            ]
+        series.append(entry)
+
+    return {
+        "periods": [month_label(first_month + offset) for offset in range(n_months)],
+        "group_by": list(group_by),
+        "series": series,
+        "totals": {measure: _rounded(values) for measure, values in zip(MEASURES, totals)}
+    }
+
+
+def parse_group_by(raw: Optional[str]) -> Tuple[str, ...]:
+    """'etablissement,module' → ('etablissement', 'module') ; ValueError si inconnu"""
+    if not raw or raw == "none":
+        return ()
+    groups = tuple(part.strip() for part in raw.split(",") if part.strip())
+    unknown = [group for group in groups if group not in GROUPS]
+    if unknown:
+        raise ValueError(f"Regroupement inconnu : {', '.join(unknown)} (attendu : {', '.join(GROUPS)})")
+    return groups
@@ -0,0 +1,141 @@
+"""
+Démarrage à froid pour BaseGenspark API
+=======================================
+
+Sur l'offre gratuite de Render le service s'endort : la première requête
+paie le démarrage de l'interpréteur, les imports, la construction des
+modèles FastAPI/pydantic et la poignée de main TLS vers Supabase.
+
+- `timer` chronomètre chaque phase du démarrage (rapport affiché au boot
+  et publié dans /metrics)
+- `ColdStartMiddleware` charge à la demande les routers différés
+  (COLD_START_MODE) et mesure le délai jusqu'à la première réponse réussie
+"""
+
+import asyncio
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional
+
+from anyio import to_thread
+
+import metrics
+from structured_log import get_logger
+
+logger = get_logger("startup")
+
+
+def _process_age() -> Optional[float]:
+    """Secondes écoulées depuis le lancement du processus (Linux uniquement)"""
+    try:
+        with open("/proc/self/stat") as f:
+            # Le nom du processus (champ 2) peut contenir des espaces : on repart de la parenthèse fermante
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return uptime - int(fields[19]) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class StartupTimer:
+    """Durées des phases de démarrage, mesurées depuis l'import de ce module"""
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.process_age = _process_age()
+        self.phases: Dict[str, float] = {}
+        self.first_response: Optional[float] = None
+        self._last_mark = self.started_at
+        self._lock = threading.Lock()
+
+    def mark(self, phase: str):
+        """Clore une phase séquentielle (durée depuis la marque précédente)"""
+        now = time.perf_counter()
+        self._record(phase, now - self._last_mark)
+        self._last_mark = now
+
+    @contextmanager
+    def phase(self, name: str):
+        """Chronométrer un bloc indépendant (peut tourner en tâche de fond)"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._record(name, time.perf_counter() - started)
+
+    def _record(self, phase: str, seconds: float):
+        with self._lock:
+            self.phases[phase] = round(seconds, 4)
+        metrics.set_gauge("startup_phase_seconds", round(seconds, 4), phase=phase)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    def record_first_response(self):
+        if self.first_response is None:
+            self.first_response = round(self.elapsed(), 4)
+            metrics.set_gauge("startup_first_response_seconds", self.first_response)
+            logger.info("Première réponse réussie", extra={"seconds_since_start": self.first_response})
+
+    def report(self) -> Dict[str, object]:
+        with self._lock:
+            phases = dict(self.phases)
+        return {
+            "interpreter_seconds": round(self.process_age, 4) if self.process_age is not None else None,
+            "phases": phases,
+            "since_import_seconds": round(self.elapsed(), 4),
+            "first_response_seconds": self.first_response
+        }
+
+    def log_report(self):
+        logger.info("Démarrage", extra=self.report())
+
+
+class ColdStartMiddleware:
+    """
+    Middleware ASGI : routers différés et délai de première réponse
+
+    `deferred` associe des préfixes de chemin à une fonction de chargement
+    (bloquante, exécutée dans le threadpool une seule fois).
+    """
+
+    def __init__(self, app, timer: StartupTimer, deferred: Iterable = ()):
+        self.app = app
+        self.timer = timer
+        self.deferred = [(tuple(prefixes), loader) for prefixes, loader in deferred]
+        self._loaded = set()
+        self._lock = asyncio.Lock()
+
+    async def _ensure_loaded(self, path: str):
+        for index, (prefixes, loader) in enumerate(self.deferred):
+            if index in self._loaded or not path.startswith(prefixes):
+                continue
+            async with self._lock:
+                if index not in self._loaded:
+                    await to_thread.run_sync(loader)
+                    self._loaded.add(index)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        if len(self._loaded) < len(self.deferred):
+            await self._ensure_loaded(scope["path"])
+
+        if self.timer.first_response is not None:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                self.timer.record_first_response()
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+
+timer = StartupTimer()
@@ -0,0 +1,118 @@
+"""
+GET conditionnels pour BaseGenspark API
+=======================================
+
+Les agents et le calendrier interrogent régulièrement les mêmes routes.
+Pour les réponses JSON 200 des GET :
+
+- ETag calculé sur le contenu (hachage BLAKE2b)
+- `If-None-Match` identique → 304 sans corps
+- `Cache-Control` selon la route (référentiels cachables quelques minutes,
+  planning et CRM toujours revalidés)
+
+Les réponses non JSON (flux SSE, exports) et les JSON envoyés en flux (sans
+Content-Length : listes admin lues ligne à ligne) passent sans être mises en
+mémoire, donc sans ETag.
+"""
+
+import hashlib
+from typing import List, Optional, Tuple
+
+import metrics
+from rate_limit import header_value
+
+
+def make_etag(body: bytes) -> str:
+    return f'W/"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Comparaison faible (RFC 9110) avec la liste de If-None-Match"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(candidate.strip().removeprefix("W/") == opaque for candidate in if_none_match.split(","))
+
+
+class ConditionalGetMiddleware:
+    """Middleware ASGI : ETag, 304 et Cache-Control sur les GET JSON"""
+
+    def __init__(self, app, rules: List[Tuple[str, str]]):
+        self.app = app
+        self.rules = rules
+
+    def _cache_control(self, path: str) -> Optional[str]:
+        for prefix, cache_control in self.rules:
+            if path.startswith(prefix):
+                return cache_control
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            await self.app(scope, receive, send)
+            return
+
+        cache_control = self._cache_control(scope["path"])
+        if cache_control is None:
+            await self.app(scope, receive, send)
+            return
+
+        if_none_match = header_value(scope, b"if-none-match")
+        start = None
+        chunks = []
+        passthrough = False
+
+        async def buffered_send(message):
+            nonlocal start, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                headers = dict(message.get("headers", []))
+                content_type = headers.get(b"content-type", b"")
+                if message["status"] != 200 or not content_type.startswith(b"application/json"):
+                    passthrough = True
+                    await send(message)
+                    return
+                if b"content-length" not in headers:
+                    # Réponse en flux : la hacher obligerait à tout garder en mémoire
+                    passthrough = True
+                    metrics.incr("conditional_get_total", result="streamed")
+                    await send({
+                        **message,
+                        "headers": [
+                            *((k, v) for k, v in message.get("headers", []) if k != b"cache-control"),
+                            (b"cache-control", cache_control.encode("latin-1"))
+                        ]
+                    })
+                    return
+                start = message
+                return
+
+            chunks.append(message.get("body", b""))
+            if message.get("more_body"):
+                return
+
+            body = b"".join(chunks)
+            etag = make_etag(body)
+            headers = [
+                (k, v) for k, v in start.get("headers", [])
+                if k not in (b"etag", b"cache-control")
+            ]
+            headers += [(b"etag", etag.encode("latin-1")), (b"cache-control", cache_control.encode("latin-1"))]
+
+            if etag_matches(if_none_match, etag):
+                metrics.incr("conditional_get_total", result="not_modified")
+                headers = [(k, v) for k, v in headers if k not in (b"content-length", b"content-type")]
+                await send({"type": "http.response.start", "status": 304, "headers": headers})
+                await send({"type": "http.response.body", "body": b""})
+                return
+
+            metrics.incr("conditional_get_total", result="modified")
+            await send({**start, "headers": headers})
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, buffered_send)
@@ -0,0 +1,141 @@
+"""
+Clés d'idempotence pour BaseGenspark API
+========================================
+
+Les agents rejouent leurs écritures après un délai dépassé. Avec un
+en-tête `Idempotency-Key`, une même écriture n'est exécutée qu'une fois :
+
+- réponse terminée → renvoyée telle quelle (en-tête `Idempotent-Replayed`),
+  sans nouvel appel à Supabase
+- requête identique en cours → on attend sa réponse
+- même clé avec un corps différent → 422
+
+Les réponses (hors erreurs 5xx, que l'on peut réessayer) sont conservées
+IDEMPOTENCY_TTL_SECONDS dans le cache partagé, donc vues par tous les workers.
+Les accès au cache (SQLite en production) passent par le threadpool pour ne
+pas bloquer la boucle asyncio.
+"""
+
+import asyncio
+import base64
+import hashlib
+import time
+from typing import Any, Dict, Optional
+
+from anyio import CancelScope, to_thread
+from fastapi.responses import JSONResponse
+
+import metrics
+import shared_cache
+from rate_limit import header_value, request_identity
+
+NAMESPACE = "idempotency"
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyMiddleware:
+    """Middleware ASGI : déduplication des écritures portant un Idempotency-Key"""
+
+    def __init__(self, app, paths, ttl: float = 86400, lock_seconds: float = 30, poll_seconds: float = 0.05,
+                 agent_tokens: Optional[Dict[str, str]] = None, agent_names=()):
+        self.app = app
+        self.agent_tokens = agent_tokens or {}
+        self.agent_names = {name.upper() for name in agent_names} | set(self.agent_tokens.values())
+        self.routes = {(method, path) for method, path in paths}
+        self.ttl = ttl
+        self.lock_seconds = lock_seconds
+        self.poll_seconds = poll_seconds
+
+    async def _read_body(self, receive) -> bytes:
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                return b"".join(chunks)
+
+    async def _replay(self, stored: Dict[str, Any], scope, receive, send):
+        headers = [(k.encode("latin-1"), v.encode("latin-1")) for k, v in stored["headers"]]
+        headers.append((b"idempotent-replayed", b"true"))
+        await send({"type": "http.response.start", "status": stored["status"], "headers": headers})
+        await send({"type": "http.response.body", "body": base64.b64decode(stored["body"])})
+
+    async def _reject(self, status: int, detail: str, scope, receive, send):
+        response = JSONResponse(status_code=status, content={"detail": detail})
+        await response(scope, receive, send)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or (scope["method"], scope["path"]) not in self.routes:
+            await self.app(scope, receive, send)
+            return
+
+        key = header_value(scope, b"idempotency-key")
+        if not key:
+            await self.app(scope, receive, send)
+            return
+        if len(key) > MAX_KEY_LENGTH:
+            await self._reject(400, "Idempotency-Key trop longue", scope, receive, send)
+            return
+
+        body = await self._read_body(receive)
+        fingerprint = hashlib.sha256(body).hexdigest()
+        identity, _ = request_identity(scope, self.agent_tokens, self.agent_names)
+        entry_key = f"{identity}:{scope['method']} {scope['path']}:{key}"
+        lock_key = await to_thread.run_sync(shared_cache.cache.versioned_key, NAMESPACE, entry_key)
+        route = scope["path"]
+
+        deadline = time.monotonic() + self.lock_seconds
+        while True:
+            stored = await to_thread.run_sync(shared_cache.cache.get, NAMESPACE, entry_key)
+            if stored is not None:
+                if stored["fingerprint"] != fingerprint:
+                    metrics.incr("idempotency_total", route=route, result="mismatch")
+                    await self._reject(422, "Idempotency-Key déjà utilisée avec un autre corps de requête", scope, receive, send)
+                    return
+                metrics.incr("idempotency_total", route=route, result="replayed")
+                await self._replay(stored, scope, receive, send)
+                return
+            if await to_thread.run_sync(shared_cache.cache.backend.try_lock, lock_key, self.lock_seconds):
+                break
+            if time.monotonic() > deadline:
+                metrics.incr("idempotency_total", route=route, result="conflict")
+                await self._reject(409, "Requête identique toujours en cours, réessayez plus tard", scope, receive, send)
+                return
+            metrics.incr("idempotency_waits_total", route=route)
+            await asyncio.sleep(self.poll_seconds)
+
+        metrics.incr("idempotency_total", route=route, result="executed")
+        response: Dict[str, Any] = {"status": None, "headers": [], "body": []}
+        body_sent = False
+
+        async def replay_receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        async def capture_send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = [
+                    (k.decode("latin-1"), v.decode("latin-1")) for k, v in message.get("headers", [])
+                ]
+            elif message["type"] == "http.response.body":
+                response["body"].append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, capture_send)
+        finally:
+            # Protégé de l'annulation : le verrou doit être rendu même si le client s'en va
+            with CancelScope(shield=True):
+                status: Optional[int] = response["status"]
+                if status is not None and status < 500:
+                    await to_thread.run_sync(shared_cache.cache.set, NAMESPACE, entry_key, {
+                        "fingerprint": fingerprint,
+                        "status": status,
+                        "headers": response["headers"],
+                        "body": base64.b64encode(b"".join(response["body"])).decode("ascii")
+                    }, self.ttl)
+                await to_thread.run_sync(shared_cache.cache.backend.unlock, lock_key)
@@ -12,43 +12,276 @@ Fonctionnalités:
 - Utilitaires (health, calendar)
 """
 
-from fastapi import FastAPI, HTTPException, Depends, Query, Header
+from cold_start import timer as startup_timer, ColdStartMiddleware
+from fastapi import FastAPI, HTTPException, Depends, Query, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
 from pydantic import BaseModel, Field
-from typing import Optional, List, Dict, Any
-from datetime import datetime, timedelta
-from routers import crm
-import httpx
+from typing import Optional, List, Dict, Any, Tuple
+from datetime import datetime, timedelta, date as date_type
+from contextlib import asynccontextmanager
+from rate_limit import RateLimiter, RateLimitMiddleware, parse_agent_tokens, per_worker
+import shared_cache
+import planning_mirror
+from supabase_client import SUPABASE_PAGE_SIZE, supabase, condition
+from bulkhead import BulkheadMiddleware, parse_limits, per_worker_limits, total_capacity
+from idempotency import IdempotencyMiddleware
+from http_cache import ConditionalGetMiddleware
+import batch
+from structured_log import RequestContextMiddleware, get_logger, setup_logging, shutdown_logging
+from anyio import to_thread
+import metrics
+import ca_analytics
+import session_analytics
+import planning_overlaps
+import planning_export
+import snapshots
+import profiler
 import os
+import json
+import math
+import time
+import asyncio
+import threading
+import base64
+import binascii
+from collections import OrderedDict
+from itertools import chain, count
 from uuid import uuid4
 
+startup_timer.mark("imports")
+
 # ========================================
 # 📌 CONFIGURATION
 # ========================================
 
-SUPABASE_URL = os.getenv("SUPABASE_URL", "https://iepvmuzfdkklysnqbvwt.supabase.co")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY", "")
+# Supabase : voir supabase_client.py (SUPABASE_URL, SUPABASE_KEY, pool HTTP)
+SUPABASE_PREWARM = os.getenv("SUPABASE_PREWARM", "true").lower() == "true"
+
+# Démarrage à froid : router CRM chargé à la première requête /crm, référentiels préchauffés
+COLD_START_MODE = os.getenv("COLD_START_MODE", "false").lower() == "true"
 AGENT_SECRET_TOKEN = os.getenv("AGENT_SECRET_TOKEN", "AGENT_TOKEN_PHOTOMENTOR_2026")
+# Tokens dédiés par agent (« PHOTOMENTOR=tok1,CALENDAR=tok2 ») : identité contrôlée par le
+# serveur pour la limitation de débit, acceptés comme AGENT_SECRET_TOKEN
+AGENT_TOKENS = parse_agent_tokens(os.getenv("AGENT_TOKENS", ""))
+# Noms X-Agent-Name reconnus avec le token partagé (les autres comptent comme « other »)
+AGENT_NAMES = [name.strip().upper() for name in os.getenv("AGENT_NAMES", "PHOTOMENTOR,COACH_RH").split(",") if name.strip()]
 
 # JWT (pas encore utilisé mais prévu)
 JWT_SECRET = os.getenv("JWT_SECRET", "basegenspark_secret_2026")
 JWT_ALGORITHM = "HS256"
 JWT_EXPIRATION_HOURS = 24
 
-# Client HTTP réutilisable
-httpx_client = httpx.Client(timeout=30.0)
+# Flux SSE planning
+PLANNING_STREAM_QUEUE_SIZE = int(os.getenv("PLANNING_STREAM_QUEUE_SIZE", "100"))
+PLANNING_STREAM_HEARTBEAT_SECONDS = float(os.getenv("PLANNING_STREAM_HEARTBEAT_SECONDS", "15"))
+
+# Limitation de débit (par token d'agent / par route). Limites globales à
+# l'instance : chaque worker en applique sa part (voir rate_limit.py)
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_RPS = float(os.getenv("RATE_LIMIT_RPS", "10"))
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "30"))
+RATE_LIMIT_ROUTE_RPS = float(os.getenv("RATE_LIMIT_ROUTE_RPS", "4"))
+RATE_LIMIT_ROUTE_BURST = float(os.getenv("RATE_LIMIT_ROUTE_BURST", "15"))
+AGENT_MAX_CONCURRENCY = int(os.getenv("AGENT_MAX_CONCURRENCY", "8"))
+
+# Cloisonnement par classe de routes (voir bulkhead.py, BULKHEAD_<CLASSE>),
+# limites globales à l'instance réparties entre les workers
+BULKHEADS_ENABLED = os.getenv("BULKHEADS_ENABLED", "true").lower() == "true"
+BULKHEAD_LIMITS = per_worker_limits(parse_limits(), shared_cache.WEB_CONCURRENCY)
+
+# Registre des sessions agents en cours (évite les relectures de user_activity)
+AGENT_SESSION_REGISTRY_SIZE = int(os.getenv("AGENT_SESSION_REGISTRY_SIZE", "5000"))
+AGENT_SESSION_REGISTRY_TTL = float(os.getenv("AGENT_SESSION_REGISTRY_TTL", "21600"))
+
+# Sessions inactives passées en "abandoned" par une tâche de fond
+AGENT_SESSION_SWEEPER_ENABLED = os.getenv("AGENT_SESSION_SWEEPER_ENABLED", "true").lower() == "true"
+AGENT_SESSION_IDLE_MINUTES = float(os.getenv("AGENT_SESSION_IDLE_MINUTES", "120"))
+AGENT_SESSION_SWEEP_SECONDS = float(os.getenv("AGENT_SESSION_SWEEP_SECONDS", "300"))
+
+# Idempotence des créations (en-tête Idempotency-Key, voir idempotency.py)
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_LOCK_SECONDS = float(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "30"))
+IDEMPOTENT_ROUTES = [
+    ("POST", "/agent/session/start"),
+    ("POST", "/admin/students"),
+    ("POST", "/planning/sessions"),
+    ("POST", "/planning/sessions/reschedule"),
+    ("POST", "/planning/sessions/series"),
+    ("POST", "/crm/prospects"),
+    ("POST", "/crm/opportunites"),
+]
+
+# Requêtes groupées (POST /batch, voir batch.py) — la concurrence du lot
+# s'ajoute à la requête /batch dans AGENT_MAX_CONCURRENCY
+BATCH_MAX_OPERATIONS = int(os.getenv("BATCH_MAX_OPERATIONS", "20"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "4"))
+BATCH_EXCLUDED_PATHS = ("/batch", "/planning/stream", "/planning/export")
+
+# Cache partagé (voir shared_cache.py : SHARED_CACHE_PATH, WEB_CONCURRENCY)
+REFERENTIELS_CACHE_TTL = float(os.getenv("REFERENTIELS_CACHE_TTL", "300"))
+STUDENTS_CACHE_TTL = float(os.getenv("STUDENTS_CACHE_TTL", "600"))
+PLANNING_WEEK_CACHE_TTL = float(os.getenv("PLANNING_WEEK_CACHE_TTL", "600"))
+PLANNING_RANGE_MAX_WEEKS = int(os.getenv("PLANNING_RANGE_MAX_WEEKS", "12"))
+CA_SERIES_MAX_MONTHS = int(os.getenv("CA_SERIES_MAX_MONTHS", "60"))
+
+# Écritures planning en masse (décalage) : plafond et taille des lots d'ids par PATCH
+PLANNING_RESCHEDULE_MAX_SESSIONS = int(os.getenv("PLANNING_RESCHEDULE_MAX_SESSIONS", "1000"))
+PLANNING_BULK_CHUNK_SIZE = int(os.getenv("PLANNING_BULK_CHUNK_SIZE", "200"))
+PLANNING_SERIES_MAX_OCCURRENCES = int(os.getenv("PLANNING_SERIES_MAX_OCCURRENCES", "200"))
+ADMIN_ANALYTICS_CACHE_TTL = float(os.getenv("ADMIN_ANALYTICS_CACHE_TTL", "60"))
+# Instantanés de /planning/stats/ca rafraîchis en fond (voir snapshots.py)
+CA_STATS_SNAPSHOT_SECONDS = float(os.getenv("CA_STATS_SNAPSHOT_SECONDS", "120"))
+
+# Profilage à la demande (voir profiler.py) — désactivé : middleware non installé
+PROFILE_ENABLED = os.getenv("PROFILE_ENABLED", "false").lower() == "true"
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "2"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "20"))
+
+# ETag / 304 : Cache-Control par préfixe de route (premier préfixe correspondant)
+HTTP_CACHE_RULES = [
+    ("/planning/etablissements", f"private, max-age={int(REFERENTIELS_CACHE_TTL)}"),
+    ("/planning/modules", f"private, max-age={int(REFERENTIELS_CACHE_TTL)}"),
+    ("/planning/stats", "private, max-age=60"),
+    ("/admin/analytics", f"private, max-age={int(ADMIN_ANALYTICS_CACHE_TTL)}"),
+    ("/planning/", "private, no-cache"),
+    ("/crm/", "private, no-cache"),
+    ("/admin/", "private, no-cache"),
+]
+
+# Journalisation JSON non bloquante (voir structured_log.py : LOG_LEVEL, LOG_SAMPLE_RATES, LOG_QUEUE_SIZE)
+setup_logging()
+logger = get_logger("api")
 
 # ========================================
 # 🚀 INITIALISATION FASTAPI
 # ========================================
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Démarrage : threadpool, miroir planning, connexion Supabase, préchauffage"""
+    configure_threadpool()
+    start_planning_mirror()
+    snapshots.scheduler.start()
+    if AGENT_SESSION_SWEEPER_ENABLED:
+        threading.Thread(target=abandoned_sessions_loop, name="agent-session-sweeper", daemon=True).start()
+    if crm_router_loaded:
+        start_crm_tasks()
+    if SUPABASE_PREWARM:
+        with startup_timer.phase("supabase_prewarm"):
+            try:
+                await to_thread.run_sync(supabase.prewarm)
+            except Exception as e:
+                logger.warning("Préchauffage Supabase impossible", extra={"error": str(e)})
+    startup_timer.mark("lifespan")
+    startup_timer.log_report()
+    if COLD_START_MODE:
+        # Les référentiels se chargent en fond : le service répond déjà
+        threading.Thread(target=prewarm_referentiels, name="prewarm-referentiels", daemon=True).start()
+    yield
+    supabase.close()
+    shutdown_logging()
+
+
 app = FastAPI(
     title="BaseGenspark API",
     version="4.0-BÉTON",
-    description="API complète pour agents pédagogiques, superviseur et planning"
+    description="API complète pour agents pédagogiques, superviseur et planning",
+    lifespan=lifespan
+)
+
+# --- Module CRM (différé en COLD_START_MODE) ---
+
+_crm_router_lock = threading.Lock()
+crm_router_loaded = False
+
+
+def load_crm_router():
+    """Importer le module CRM (construction des modèles pydantic) et monter ses routes"""
+    global crm_router_loaded
+    with _crm_router_lock:
+        if crm_router_loaded:
+            return
+        with startup_timer.phase("crm_router"):
+            from routers import crm
+            app.include_router(crm.router)
+            # Le schéma OpenAPI a pu être généré sans les routes CRM
+            app.openapi_schema = None
+        crm_router_loaded = True
+
+
+def start_crm_tasks():
+    from routers import crm
+    crm.start_alertes_precompute()
+
+
+def load_crm_on_demand():
+    """Premier appel /crm (ou /docs) en COLD_START_MODE"""
+    load_crm_router()
+    start_crm_tasks()
+
+
+if not COLD_START_MODE:
+    load_crm_router()
+
+# Profilage (au plus près des routes : seul le traitement de la requête est mesuré)
+profile_store = profiler.ProfileStore(PROFILE_KEEP)
+if PROFILE_ENABLED:
+    app.add_middleware(
+        profiler.ProfilerMiddleware,
+        tokens=[AGENT_SECRET_TOKEN, *AGENT_TOKENS],
+        store=profile_store,
+        sample_rate=PROFILE_SAMPLE_RATE,
+        interval=PROFILE_INTERVAL_MS / 1000,
+        exempt_paths=["/health", "/planning/stream", "/batch", "/admin/profiles"]
+    )
+
+# Routers différés + délai de première réponse
+app.add_middleware(
+    ColdStartMiddleware,
+    timer=startup_timer,
+    deferred=[(("/crm", "/docs", "/redoc", "/openapi.json"), load_crm_on_demand)] if COLD_START_MODE else []
+)
+
+# Cloisonnement (au plus près des routes : les refus de débit ne prennent pas de place)
+if BULKHEADS_ENABLED:
+    app.add_middleware(
+        BulkheadMiddleware,
+        limits=BULKHEAD_LIMITS,
+        exempt_paths=["/health", "/planning/stream", "/batch"]
+    )
+
+# Idempotence (hors cloisonnement : un rejeu ou une attente n'occupe pas de place)
+app.add_middleware(
+    IdempotencyMiddleware,
+    paths=IDEMPOTENT_ROUTES,
+    ttl=IDEMPOTENCY_TTL_SECONDS,
+    lock_seconds=IDEMPOTENCY_LOCK_SECONDS,
+    agent_tokens=AGENT_TOKENS,
+    agent_names=AGENT_NAMES
 )
 
+# Limitation de débit (ajoutée avant CORS pour que les 429 portent les en-têtes CORS)
+if RATE_LIMIT_ENABLED:
+    app.add_middleware(
+        RateLimitMiddleware,
+        limiter=RateLimiter(
+            rate=per_worker(RATE_LIMIT_RPS, shared_cache.WEB_CONCURRENCY, minimum=0.1),
+            burst=per_worker(RATE_LIMIT_BURST, shared_cache.WEB_CONCURRENCY),
+            route_rate=per_worker(RATE_LIMIT_ROUTE_RPS, shared_cache.WEB_CONCURRENCY, minimum=0.1),
+            route_burst=per_worker(RATE_LIMIT_ROUTE_BURST, shared_cache.WEB_CONCURRENCY),
+            max_concurrency=math.ceil(per_worker(AGENT_MAX_CONCURRENCY, shared_cache.WEB_CONCURRENCY))
+        ),
+        agent_tokens=AGENT_TOKENS,
+        agent_names=AGENT_NAMES,
+        exempt_paths=["/health"],
+        stream_paths=["/planning/stream"]
+    )
+
+# GET conditionnels (dans CORS : les 304 portent aussi les en-têtes CORS)
+app.add_middleware(ConditionalGetMiddleware, rules=HTTP_CACHE_RULES)
+
 # CORS (pour accès frontend)
 app.add_middleware(
     CORSMiddleware,
@@ -56,9 +289,27 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[
+        "ETag", "Age", "Idempotent-Replayed", "Retry-After", "X-Request-ID",
+        "Content-Disposition", "X-Profile-Id", "X-Profiled-Status", "X-Profile-Breakdown"
+    ],
 )
-# Module CRM
-app.include_router(crm.router)
+
+# Identifiant de requête + journal d'accès (le plus à l'extérieur : tout est mesuré)
+app.add_middleware(RequestContextMiddleware)
+
+
+def start_planning_mirror():
+    """Synchro du miroir SQLite planning (si PLANNING_MIRROR_PATH est défini)"""
+    if planning_mirror.mirror:
+        planning_mirror.start_sync_thread(planning_mirror.mirror)
+
+
+def configure_threadpool():
+    """Le threadpool des routes synchrones doit pouvoir servir tous les pools à la fois"""
+    if BULKHEADS_ENABLED:
+        limiter = to_thread.current_default_thread_limiter()
+        limiter.total_tokens = max(limiter.total_tokens, total_capacity(BULKHEAD_LIMITS))
 
 # ========================================
 # 🔐 SÉCURITÉ : Vérification token
@@ -72,7 +323,7 @@ def verify_agent_token(
     Vérifie le token d'authentification (header ou query param)
     """
     provided_token = x_agent_token or token
-    if not provided_token or provided_token != AGENT_SECRET_TOKEN:
+    if not provided_token or (provided_token != AGENT_SECRET_TOKEN and provided_token not in AGENT_TOKENS):
         raise HTTPException(
             status_code=401,
             detail="Token invalide ou manquant"
@@ -158,11 +409,48 @@ class SessionUpdate(BaseModel):
     annee_scolaire: Optional[str] = None
     notes: Optional[str] = None
 
+class SessionReschedule(BaseModel):
+    """Décaler toutes les sessions d'une période (filtres optionnels)"""
+    date_start: str = Field(..., description="Date début (YYYY-MM-DD)")
+    date_end: str = Field(..., description="Date fin (YYYY-MM-DD)")
+    etablissement_id: Optional[int] = None
+    module_id: Optional[int] = None
+    promotion_id: Optional[int] = None
+    shift_days: int = Field(0, description="Décalage en jours (négatif = avancer)")
+    shift_minutes: int = Field(0, description="Décalage des horaires en minutes")
+    dry_run: bool = Field(False, description="Calculer sans rien écrire")
+
+class SessionSeries(BaseModel):
+    """Créer une série récurrente à partir d'un modèle de session"""
+    template: SessionCreate = Field(..., description="Modèle ; sa date est le début de la série")
+    until: str = Field(..., description="Dernière date possible (YYYY-MM-DD, incluse)")
+    interval_weeks: int = Field(1, ge=1, description="Toutes les N semaines")
+    weekdays: List[int] = Field(default_factory=list, description="Jours (0 = lundi … 6 = dimanche), défaut : jour du modèle")
+    exclude_dates: List[str] = Field(default_factory=list, description="Dates à sauter (vacances, jours fériés)")
+    on_conflict: str = Field("report", pattern="^(report|skip|reject)$", description="report = créer et signaler, skip = sauter, reject = 409")
+    dry_run: bool = Field(False, description="Calculer sans rien écrire")
+
 class ConflictResolve(BaseModel):
     """Résoudre un conflit"""
     resolution: str
     resolved_by: str
 
+# --- Requêtes groupées ---
+
+class BatchOperation(BaseModel):
+    """Une opération d'un lot (appel à une route existante)"""
+    id: Optional[str] = Field(None, description="Identifiant dans le lot (index par défaut)")
+    method: str = Field("GET", description="GET, POST, PATCH, PUT, DELETE")
+    path: str = Field(..., description="Chemin de la route, query string comprise")
+    params: Optional[Dict[str, Any]] = None
+    body: Optional[Any] = None
+    headers: Optional[Dict[str, str]] = Field(None, description="ex. If-None-Match, Idempotency-Key")
+    depends_on: List[str] = Field(default_factory=list, description="Opérations à attendre (déclarées avant)")
+
+class BatchRequest(BaseModel):
+    """Lot d'opérations exécutées en une seule requête"""
+    operations: List[BatchOperation]
+
 
 # ========================================
 # 🏠 ENDPOINTS UTILITAIRES
@@ -183,28 +471,37 @@ def root():
         "endpoints": {
             "agents": [
                 "POST /agent/session/start",
+                "GET /agent/session/{session_id}",
                 "PATCH /agent/session/{session_id}",
                 "POST /agent/session/{session_id}/end"
             ],
             "admin": [
                 "GET /admin/students",
                 "POST /admin/students",
-                "GET /admin/sessions"
+                "GET /admin/sessions",
+                "GET /admin/analytics",
+                "GET /admin/profiles",
+                "GET /admin/profiles/{id}"
             ],
             "planning": [
                 "GET /planning/sessions",
+                "GET /planning/sessions/changes",
                 "POST /planning/sessions",
                 "PATCH /planning/sessions/{id}",
                 "DELETE /planning/sessions/{id}",
                 "GET /planning/conflicts",
                 "PATCH /planning/conflicts/{id}",
                 "GET /planning/stats/ca",
+                "GET /planning/stats/ca/series",
                 "GET /planning/weekly",
+                "GET /planning/range",
                 "GET /planning/etablissements",
-                "GET /planning/modules"
+                "GET /planning/modules",
+                "GET /planning/stream"
             ],
             "utils": [
                 "GET /health",
+                "GET /metrics",
                 "GET /planning/calendar"
             ]
         }
@@ -214,13 +511,8 @@ def root():
 def health_check():
     """Vérifier la connexion Supabase"""
     try:
-        headers = {
-            "apikey": SUPABASE_KEY,
-            "Authorization": f"Bearer {SUPABASE_KEY}"
-        }
-        response = httpx_client.get(
-            f"{SUPABASE_URL}/rest/v1/users?select=count&limit=1",
-            headers=headers
+        response = supabase.get(
+            supabase.query("users").select("count").limit(1)
         )
         if response.status_code == 200:
             return {
@@ -241,6 +533,156 @@ def health_check():
             "timestamp": datetime.utcnow().isoformat()
         }
 
+@app.get("/metrics")
+def get_metrics(_: bool = Depends(verify_agent_token)):
+    """Métriques internes (limitation de débit, caches...)"""
+    return {
+        "success": True,
+        "timestamp": datetime.utcnow().isoformat(),
+        "startup": startup_timer.report(),
+        **metrics.snapshot()
+    }
+
+
+# ========================================
+# 🧭 REGISTRE DES SESSIONS AGENTS
+# ========================================
+
+class AgentSessionRegistry:
+    """
+    Sessions agents en cours : ligne user_activity tenue à jour par /start et /update
+
+    Un seul worker : LRU en mémoire borné à `max_size`. Plusieurs workers :
+    cache partagé (une copie locale pourrait être périmée si /update est
+    passé par un autre worker). Toute absence se rattrape par une lecture
+    de user_activity.
+    """
+
+    NAMESPACE = "agent_sessions"
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._local: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        if shared_cache.cache.shared:
+            session = shared_cache.cache.get(self.NAMESPACE, session_id)
+        else:
+            with self._lock:
+                entry = self._local.get(session_id)
+                if entry and entry[0] < time.monotonic():
+                    del self._local[session_id]
+                    entry = None
+                if entry:
+                    self._local.move_to_end(session_id)
+                session = entry[1] if entry else None
+        metrics.incr("agent_session_registry_total", result="hit" if session else "miss")
+        return session
+
+    def put(self, session: Dict[str, Any]):
+        session_id = session["session_id"]
+        if shared_cache.cache.shared:
+            shared_cache.cache.set(self.NAMESPACE, session_id, session, ttl=self.ttl)
+            return
+        with self._lock:
+            self._local[session_id] = (time.monotonic() + self.ttl, session)
+            self._local.move_to_end(session_id)
+            while len(self._local) > self.max_size:
+                self._local.popitem(last=False)
+            metrics.set_gauge("agent_session_registry_size", len(self._local))
+
+    def update(self, session_id: str, fields: Dict[str, Any]):
+        """Appliquer des champs déjà écrits dans Supabase (ignoré si la session est absente)"""
+        session = self.get(session_id)
+        if session:
+            self.put({**session, **fields})
+
+    def remove(self, session_id: str):
+        if shared_cache.cache.shared:
+            shared_cache.cache.delete(self.NAMESPACE, session_id)
+            return
+        with self._lock:
+            self._local.pop(session_id, None)
+            metrics.set_gauge("agent_session_registry_size", len(self._local))
+
+
+agent_sessions = AgentSessionRegistry(AGENT_SESSION_REGISTRY_SIZE, AGENT_SESSION_REGISTRY_TTL)
+
+
+def fetch_agent_session(session_id: str) -> Optional[Dict[str, Any]]:
+    """Session depuis le registre, sinon depuis user_activity (remise au registre si en cours)"""
+    session = agent_sessions.get(session_id)
+    if session:
+        return session
+    
+    response = supabase.get(
+        supabase.query("user_activity").eq("session_id", session_id)
+    )
+    if response.status_code != 200:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Erreur récupération session : {response.text}"
+        )
+    
+    sessions = response.json()
+    if not sessions:
+        return None
+    session = sessions[0]
+    if session.get("status") == "in_progress":
+        agent_sessions.put(session)
+    return session
+
+
+def sweep_abandoned_sessions() -> int:
+    """
+    Passer en "abandoned" les sessions en cours inactives depuis AGENT_SESSION_IDLE_MINUTES
+
+    Un seul PATCH filtré : dernière activité = updated_at, ou started_at
+    si la session n'a jamais été mise à jour.
+    """
+    now = datetime.utcnow()
+    cutoff = (now - timedelta(minutes=AGENT_SESSION_IDLE_MINUTES)).isoformat()
+    query = (
+        supabase.query("user_activity")
+        .eq("status", "in_progress")
+        .or_(
+            condition("updated_at", "lt", cutoff),
+            f"and({condition('updated_at', 'is', None)},{condition('started_at', 'lt', cutoff)})"
+        )
+        .select("session_id")
+    )
+    response = supabase.update(query, {"status": "abandoned", "updated_at": now.isoformat()}, returning=True)
+    response.raise_for_status()
+    
+    abandoned = response.json()
+    for row in abandoned:
+        agent_sessions.remove(row["session_id"])
+    return len(abandoned)
+
+
+def abandoned_sessions_loop():
+    """Tâche de fond : un balayage par intervalle pour toute la machine (verrou partagé)"""
+    lock_key = "agent_session_sweeper"
+    while True:
+        if shared_cache.cache.backend.try_lock(lock_key, AGENT_SESSION_SWEEP_SECONDS):
+            started = time.monotonic()
+            try:
+                abandoned = sweep_abandoned_sessions()
+                metrics.incr("agent_session_sweeps_total", result="ok")
+                metrics.incr("agent_sessions_abandoned_total", abandoned)
+                metrics.set_gauge("agent_session_sweep_last_abandoned", abandoned)
+                if abandoned:
+                    logger.info("Sessions agents passées en abandoned", extra={"count": abandoned})
+            except Exception as e:
+                metrics.incr("agent_session_sweeps_total", result="error")
+                logger.warning("Balayage des sessions abandonnées impossible", extra={"error": str(e)})
+            metrics.set_gauge("agent_session_sweep_last_seconds", round(time.monotonic() - started, 3))
+            metrics.set_gauge("agent_session_sweep_last_run", time.time())
+            # Verrou conservé jusqu'à expiration : les autres workers sautent cet intervalle
+        time.sleep(AGENT_SESSION_SWEEP_SECONDS)
+
 
 # ========================================
 # 🤖 ENDPOINTS AGENTS PÉDAGOGIQUES
@@ -269,30 +711,26 @@ def agent_session_start(
     }
     """
     try:
-        headers = {
-            "apikey": SUPABASE_KEY,
-            "Authorization": f"Bearer {SUPABASE_KEY}",
-            "Content-Type": "application/json",
-            "Prefer": "return=representation"
-        }
-        
         # ========================================
         # ÉTAPE 1 : Vérifier si l'étudiant existe
         # ========================================
         
-        students_response = httpx_client.get(
-            f"{SUPABASE_URL}/rest/v1/students?email=eq.{data.student_email}",
-            headers=headers
-        )
-        
-        students = students_response.json()
+        cached_student = shared_cache.cache.get("students", data.student_email)
+        if cached_student:
+            students = [cached_student]
+        else:
+            students_response = supabase.get(
+                supabase.query("students").eq("email", data.student_email)
+            )
+            
+            students = students_response.json()
         
         # ========================================
         # ÉTAPE 2 : Créer l'étudiant s'il n'existe pas
         # ========================================
         
         if not students:
-            print(f"[INFO] Étudiant {data.student_email} non trouvé → Création automatique")
+            logger.info("Étudiant non trouvé → création automatique", extra={"student_email": data.student_email})
             
             new_student = {
                 "email": data.student_email,
@@ -303,11 +741,7 @@ def agent_session_start(
                 "updated_at": datetime.utcnow().isoformat()
             }
             
-            create_response = httpx_client.post(
-                f"{SUPABASE_URL}/rest/v1/students",
-                headers=headers,
-                json=new_student
-            )
+            create_response = supabase.insert("students", new_student)
             
             if create_response.status_code not in [200, 201]:
                 raise HTTPException(
@@ -322,10 +756,12 @@ def agent_session_start(
             else:
                 student = students
             
-            print(f"[SUCCESS] Étudiant créé : {student}")
+            logger.info("Étudiant créé", extra={"student_id": student.get("id"), "student_email": student.get("email")})
         else:
             student = students[0]
-            print(f"[INFO] Étudiant trouvé : {student['email']}")
+            logger.debug("Étudiant trouvé", extra={"student_email": student["email"]})
+        
+        shared_cache.cache.set("students", data.student_email, student, ttl=STUDENTS_CACHE_TTL)
         
         # ========================================
         # ÉTAPE 3 : Créer la session dans user_activity
@@ -357,11 +793,7 @@ def agent_session_start(
             "started_at": datetime.utcnow().isoformat()
         }
         
-        activity_response = httpx_client.post(
-            f"{SUPABASE_URL}/rest/v1/user_activity",
-            headers=headers,
-            json=activity_data
-        )
+        activity_response = supabase.insert("user_activity", activity_data)
         
         if activity_response.status_code not in [200, 201]:
             raise HTTPException(
@@ -373,6 +805,8 @@ def agent_session_start(
         if isinstance(activity, list):
             activity = activity[0]
         
+        agent_sessions.put({**activity_data, **activity})
+        
         return {
             "success": True,
             "message": "Session démarrée avec succès",
@@ -392,6 +826,34 @@ def agent_session_start(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/agent/session/{session_id}")
+def agent_session_get(
+    session_id: str,
+    _: bool = Depends(verify_agent_token)
+):
+    """
+    État d'une session (registre des sessions en cours, sinon Supabase)
+    
+    Exemple :
+    GET /agent/session/PHOTO-20260120-MARI-A3F2?token=AGENT_TOKEN...
+    """
+    try:
+        session = fetch_agent_session(session_id)
+        if not session:
+            raise HTTPException(status_code=404, detail="Session non trouvée")
+        
+        return {
+            "success": True,
+            "session_id": session_id,
+            "session": session
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.patch("/agent/session/{session_id}")
 def agent_session_update(
     session_id: str,
@@ -410,12 +872,6 @@ def agent_session_update(
     }
     """
     try:
-        headers = {
-            "apikey": SUPABASE_KEY,
-            "Authorization": f"Bearer {SUPABASE_KEY}",
-            "Content-Type": "application/json"
-        }
-        
         # Préparer les données à mettre à jour
         update_data = {
             "updated_at": datetime.utcnow().isoformat()
@@ -431,10 +887,9 @@ def agent_session_update(
             update_data["metadata"] = data.metadata
         
         # Mettre à jour dans Supabase
-        response = httpx_client.patch(
-            f"{SUPABASE_URL}/rest/v1/user_activity?session_id=eq.{session_id}",
-            headers=headers,
-            json=update_data
+        response = supabase.update(
+            supabase.query("user_activity").eq("session_id", session_id),
+            update_data
         )
         
         if response.status_code not in [200, 204]:
@@ -443,6 +898,8 @@ def agent_session_update(
                 detail=f"Erreur mise à jour session : {response.text}"
             )
         
+        agent_sessions.update(session_id, update_data)
+        
         return {
             "success": True,
             "message": "Session mise à jour",
@@ -475,25 +932,11 @@ def agent_session_end(
     }
     """
     try:
-        headers = {
-            "apikey": SUPABASE_KEY,
-            "Authorization": f"Bearer {SUPABASE_KEY}",
-            "Content-Type": "application/json",
-            "Prefer": "return=representation"
-        }
-        
-        # Récupérer la session pour calculer la durée
-        get_response = httpx_client.get(
-            f"{SUPABASE_URL}/rest/v1/user_activity?session_id=eq.{session_id}",
-            headers=headers
-        )
-        
-        sessions = get_response.json()
-        if not sessions:
+        # Session (registre, sinon Supabase) pour calculer la durée
+        session = fetch_agent_session(session_id)
+        if not session:
             raise HTTPException(status_code=404, detail="Session non trouvée")
         
-        session = sessions[0]
-        
         # Calculer la durée
         started_at = datetime.fromisoformat(session["started_at"].replace('Z', '+00:00'))
         completed_at = datetime.utcnow()
@@ -515,14 +958,14 @@ def agent_session_end(
             end_data["improvements"] = data.improvements
         if data.metadata is not None:
             # Fusionner avec metadata existant
-            existing_metadata = session.get("metadata", {})
+            existing_metadata = session.get("metadata") or {}
             end_data["metadata"] = {**existing_metadata, **data.metadata}
         
         # Mettre à jour dans Supabase
-        response = httpx_client.patch(
-            f"{SUPABASE_URL}/rest/v1/user_activity?session_id=eq.{session_id}",
-            headers=headers,
-            json=end_data
+        response = supabase.update(
+            supabase.query("user_activity").eq("session_id", session_id),
+            end_data,
+            returning=True
         )
         
         if response.status_code not in [200, 204]:
@@ -531,6 +974,8 @@ def agent_session_end(
                 detail=f"Erreur fin de session : {response.text}"
             )
         
+        agent_sessions.remove(session_id)
+        
         return {
             "success": True,
             "message": "Session terminée",
@@ -550,6 +995,25 @@ def agent_session_end(
 # 👨‍💼 ENDPOINTS ADMIN / SUPERVISEUR
 # ========================================
 
+def stream_json_list(envelope: Dict[str, Any], key: str, rows) -> StreamingResponse:
+    """
+    Réponse JSON écrite au fil des lignes reçues de Supabase
+
+    `{**envelope, key: [...], "count": n}` : le compte vient en dernier,
+    il n'est connu qu'à la fin du flux.
+    """
+    def body():
+        yield json.dumps(envelope, ensure_ascii=False, separators=(",", ":"))[:-1].encode("utf-8")
+        yield f',"{key}":['.encode("utf-8")
+        count = 0
+        for row in rows:
+            yield (b"," if count else b"") + json.dumps(row, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            count += 1
+        yield f'],"count":{count}}}'.encode("utf-8")
+    
+    return StreamingResponse(body(), media_type="application/json")
+
+
 @app.get("/admin/students")
 def admin_list_students(
     limit: int = Query(100, description="Nombre max d'étudiants"),
@@ -563,31 +1027,18 @@ def admin_list_students(
     GET /admin/students?limit=50&token=AGENT_TOKEN...
     """
     try:
-        headers = {
-            "apikey": SUPABASE_KEY,
-            "Authorization": f"Bearer {SUPABASE_KEY}"
-        }
-        
-        response = httpx_client.get(
-            f"{SUPABASE_URL}/rest/v1/students?select=*&order=created_at.desc&limit={limit}&offset={offset}",
-            headers=headers
+        students = supabase.stream(
+            supabase.query("students").select("*").order("created_at.desc").limit(limit).offset(offset)
         )
         
-        if response.status_code != 200:
+        if students.status_code != 200:
+            students.close()
             raise HTTPException(
                 status_code=500,
-                detail=f"Erreur récupération étudiants : {response.text}"
+                detail=f"Erreur récupération étudiants : {students.text}"
             )
         
-        students = response.json()
-        
-        return {
-            "success": True,
-            "count": len(students),
-            "limit": limit,
-            "offset": offset,
-            "students": students
-        }
+        return stream_json_list({"success": True, "limit": limit, "offset": offset}, "students", students)
         
     except HTTPException:
         raise
@@ -613,17 +1064,9 @@ def admin_create_student(
     }
     """
     try:
-        headers = {
-            "apikey": SUPABASE_KEY,
-            "Authorization": f"Bearer {SUPABASE_KEY}",
-            "Content-Type": "application/json",
-            "Prefer": "return=representation"
-        }
-        
         # Vérifier si l'email existe déjà
-        check_response = httpx_client.get(
-            f"{SUPABASE_URL}/rest/v1/students?email=eq.{data.email}",
-            headers=headers
+        check_response = supabase.get(
+            supabase.query("students").eq("email", data.email)
         )
         
         existing = check_response.json()
@@ -644,11 +1087,7 @@ def admin_create_student(
             "updated_at": datetime.utcnow().isoformat()
         }
         
-        response = httpx_client.post(
-            f"{SUPABASE_URL}/rest/v1/students",
-            headers=headers,
-            json=new_student
-        )
+        response = supabase.insert("students", new_student)
         
         if response.status_code not in [200, 201]:
             raise HTTPException(
@@ -660,6 +1099,8 @@ def admin_create_student(
         if isinstance(created, list):
             created = created[0]
         
+        shared_cache.cache.set("students", created["email"], created, ttl=STUDENTS_CACHE_TTL)
+        
         return {
             "success": True,
             "message": "Étudiant créé avec succès",
@@ -687,39 +1128,76 @@ def admin_list_sessions(
     GET /admin/sessions?status=completed&limit=50&token=AGENT_TOKEN...
     """
     try:
-        headers = {
-            "apikey": SUPABASE_KEY,
-            "Authorization": f"Bearer {SUPABASE_KEY}"
-        }
-        
         # Construire la requête avec filtres
-        query = f"{SUPABASE_URL}/rest/v1/user_activity?select=*&order=started_at.desc&limit={limit}&offset={offset}"
+        query = supabase.query("user_activity").select("*").order("started_at.desc").limit(limit).offset(offset)
         
         if status:
-            query += f"&status=eq.{status}"
+            query.eq("status", status)
         if agent_name:
-            query += f"&agent_name=eq.{agent_name}"
+            query.eq("agent_name", agent_name)
         
-        response = httpx_client.get(query, headers=headers)
+        sessions = supabase.stream(query)
         
-        if response.status_code != 200:
+        if sessions.status_code != 200:
+            sessions.close()
             raise HTTPException(
                 status_code=500,
-                detail=f"Erreur récupération sessions : {response.text}"
+                detail=f"Erreur récupération sessions : {sessions.text}"
             )
         
-        sessions = response.json()
+        return stream_json_list(
+            {
+                "success": True,
+                "limit": limit,
+                "offset": offset,
+                "filters": {
+                    "status": status,
+                    "agent_name": agent_name
+                }
+            },
+            "sessions",
+            sessions
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/admin/analytics")
+def admin_session_analytics(
+    since: Optional[str] = Query(None, description="Sessions démarrées à partir de (YYYY-MM-DD)"),
+    until: Optional[str] = Query(None, description="Sessions démarrées avant (YYYY-MM-DD)"),
+    _: bool = Depends(verify_agent_token)
+):
+    """
+    Statistiques des sessions pédagogiques, par agent et par établissement
+    
+    Statuts, taux de complétion, percentiles de durée et histogramme des
+    scores, calculés côté API (résultat mis en cache ADMIN_ANALYTICS_CACHE_TTL s).
+    
+    Exemple :
+    GET /admin/analytics?since=2026-01-01&token=AGENT_TOKEN...
+    """
+    try:
+        def compute():
+            return {
+                "computed_at": datetime.utcnow().isoformat(),
+                **session_analytics.compute_analytics(since, until)
+            }
+        
+        analytics = shared_cache.cache.get_or_compute(
+            "admin_analytics", f"{since}:{until}", compute, ttl=ADMIN_ANALYTICS_CACHE_TTL
+        )
         
         return {
             "success": True,
-            "count": len(sessions),
-            "limit": limit,
-            "offset": offset,
             "filters": {
-                "status": status,
-                "agent_name": agent_name
+                "since": since,
+                "until": until
             },
-            "sessions": sessions
+            **analytics
         }
         
     except HTTPException:
@@ -728,6 +1206,311 @@ def admin_list_sessions(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+
+@app.get("/admin/profiles")
+def admin_list_profiles(_: bool = Depends(verify_agent_token)):
+    """
+    Derniers profils enregistrés (PROFILE_ENABLED)
+    
+    Une requête est profilée avec l'en-tête `X-Profile: speedscope` (ou
+    `collapsed`) et un token d'agent, ou si elle est tirée au sort
+    (PROFILE_SAMPLE_RATE).
+    
+    Exemple :
+    GET /admin/profiles?token=AGENT_TOKEN...
+    """
+    profiles = profile_store.list()
+    return {
+        "success": True,
+        "enabled": PROFILE_ENABLED,
+        "sample_rate": PROFILE_SAMPLE_RATE,
+        "count": len(profiles),
+        "profiles": profiles
+    }
+
+
+@app.get("/admin/profiles/{profile_id}")
+def admin_download_profile(
+    profile_id: str,
+    format: str = Query("speedscope", description="speedscope ou collapsed (flamegraph.pl)"),
+    _: bool = Depends(verify_agent_token)
+):
+    """
+    Télécharger un profil (à ouvrir sur https://www.speedscope.app)
+    
+    Exemple :
+    GET /admin/profiles/3f2a9c1b7d4e?format=collapsed&token=AGENT_TOKEN...
+    """
+    if format not in profiler.FORMATS:
+        raise HTTPException(status_code=400, detail=f"Format inconnu : {', '.join(profiler.FORMATS)}")
+    profile = profile_store.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profil introuvable")
+    
+    media_type, suffix = profiler.FORMATS[format]
+    return Response(
+        content=profile.render(format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="profile-{profile.id}.{suffix}"'}
+    )
+
+# ========================================
+# 📡 ÉVÉNEMENTS PLANNING (SSE)
+# ========================================
+
+class PlanningEventBroker:
+    """
+    Diffuse les modifications du planning aux abonnés du flux SSE
+
+    Chaque abonné possède sa propre file bornée. Un abonné trop lent
+    (file pleine) perd ses événements en attente et reçoit un événement
+    `resync` : le client doit alors recharger sa vue complète.
+
+    En mode multi-workers, les événements passent aussi par le journal du
+    cache partagé : chaque worker ayant des abonnés relaie ceux publiés
+    par les autres workers.
+    """
+
+    STREAM = "planning_events"
+    RELAY_INTERVAL_SECONDS = 0.5
+
+    def __init__(self, max_queue_size: int = 100):
+        self.max_queue_size = max_queue_size
+        self.origin = uuid4().hex[:8]
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._sequence = count(1)
+        self._relay_task = None
+
+    def subscribe(self):
+        """Créer la file d'un nouvel abonné (à appeler depuis la boucle asyncio)"""
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue(maxsize=self.max_queue_size))
+        with self._lock:
+            self._subscribers.add(subscriber)
+        if shared_cache.cache.shared and self._relay_task is None:
+            self._relay_task = asyncio.create_task(self._relay())
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, event_type: str, data: Dict[str, Any]):
+        """Publier un événement (appelable depuis n'importe quel thread)"""
+        if shared_cache.cache.shared:
+            shared_cache.cache.append(self.STREAM, {"origin": self.origin, "type": event_type, "data": data})
+        self._dispatch(event_type, data)
+
+    async def _relay(self):
+        """Relayer aux abonnés locaux les événements publiés par les autres workers"""
+        seq = await asyncio.to_thread(shared_cache.cache.last_seq)
+        try:
+            while True:
+                await asyncio.sleep(self.RELAY_INTERVAL_SECONDS)
+                with self._lock:
+                    if not self._subscribers:
+                        return
+                entries, last_seq = await asyncio.to_thread(shared_cache.cache.read_since, self.STREAM, seq)
+                if entries is None:
+                    self._dispatch("resync", {})
+                    entries = []
+                for entry_seq, payload in entries:
+                    seq = max(seq, entry_seq)
+                    if payload["origin"] != self.origin:
+                        self._dispatch(payload["type"], payload["data"])
+                seq = max(seq, last_seq)
+        finally:
+            self._relay_task = None
+
+    def _dispatch(self, event_type: str, data: Dict[str, Any]):
+        event = {"id": next(self._sequence), "type": event_type, "data": data}
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._deliver, queue, event)
+            except RuntimeError:
+                # Boucle fermée : l'abonné sera retiré à la fin de son flux
+                pass
+
+    @staticmethod
+    def _deliver(queue: asyncio.Queue, event: Dict[str, Any]):
+        if queue.full():
+            # Abonné en retard → on vide sa file et on force une resynchronisation
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait({"id": event["id"], "type": "resync", "data": {}})
+            return
+        queue.put_nowait(event)
+
+
+planning_events = PlanningEventBroker(max_queue_size=PLANNING_STREAM_QUEUE_SIZE)
+
+
+def format_sse(event: Dict[str, Any]) -> str:
+    """Sérialiser un événement au format text/event-stream"""
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'], default=str)}\n\n"
+
+
+# ========================================
+# 🔄 SYNCHRO INCRÉMENTALE PLANNING
+# ========================================
+
+class SessionTombstones:
+    """
+    Journal des sessions planning supprimées via l'API
+
+    Stocké dans le journal du cache partagé : chaque suppression reçoit un
+    numéro de séquence croissant, visible par tous les workers. `epoch`
+    change quand le journal est recréé, ce qui invalide les jetons de
+    synchro émis auparavant.
+    """
+
+    STREAM = "planning_tombstones"
+
+    @property
+    def epoch(self) -> str:
+        return shared_cache.cache.epoch
+
+    @property
+    def last_seq(self) -> int:
+        return shared_cache.cache.last_seq()
+
+    def record(self, session_id: int):
+        shared_cache.cache.append(self.STREAM, {"id": session_id, "deleted_at": datetime.utcnow().isoformat()})
+
+    def since(self, seq: int) -> Tuple[Optional[List[Dict[str, Any]]], int]:
+        """
+        (suppressions après `seq` ou None si le journal ne couvre plus cette
+        période, séquence jusqu'à laquelle elles ont été lues)
+
+        La séquence renvoyée va dans le prochain jeton : une suppression
+        journalisée juste après la lecture sera vue au prochain appel.
+        """
+        entries, last_seq = shared_cache.cache.read_since(self.STREAM, seq)
+        if entries is None or seq > last_seq:
+            return None, last_seq
+        return [payload for _, payload in entries], last_seq
+
+
+planning_tombstones = SessionTombstones()
+
+
+def encode_sync_token(updated_at: Optional[str], session_id: Optional[int], tombstone_seq: int) -> str:
+    """Jeton opaque : epoch du journal + séquence des suppressions + curseur (updated_at, id)"""
+    raw = f"{planning_tombstones.epoch}|{tombstone_seq}|{session_id if session_id is not None else ''}|{updated_at or ''}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_sync_token(token: str) -> Optional[Dict[str, Any]]:
+    """Décoder un jeton de synchro (None si invalide, ancien format, ou émis par un autre processus)"""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+        epoch, seq, session_id, updated_at = raw.split("|", 3)
+        seq = int(seq)
+        session_id = int(session_id) if session_id else None
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        return None
+    if epoch != planning_tombstones.epoch:
+        return None
+    return {"tombstone_seq": seq, "updated_at": updated_at or None, "id": session_id}
+
+
+# ========================================
+# 🗄️ MIROIR LOCAL PLANNING
+# ========================================
+
+def use_planning_mirror(consistency: str) -> bool:
+    """Lire depuis le miroir SQLite sauf si la cohérence forte est demandée"""
+    mirror = planning_mirror.mirror
+    return consistency != "strong" and mirror is not None and mirror.ready
+
+
+# ========================================
+# 🗓️ CACHE PAR SEMAINE ISO
+# ========================================
+# Une semaine = un namespace du cache partagé : une écriture n'invalide
+# que la ou les semaines touchées, et un chargement en cours pendant
+# l'invalidation ne peut pas réécrire l'ancienne version.
+
+def parse_date(value) -> date_type:
+    if isinstance(value, date_type):
+        return value
+    return date_type.fromisoformat(str(value)[:10])
+
+
+def iso_week_key(day: date_type) -> str:
+    year, week, _ = day.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def iso_week_namespace(day: date_type) -> str:
+    return f"planning_week:{iso_week_key(day)}"
+
+
+def week_mondays(first: date_type, last: date_type) -> List[date_type]:
+    """Lundis des semaines ISO couvrant [first, last]"""
+    monday = first - timedelta(days=first.weekday())
+    mondays = []
+    while monday <= last:
+        mondays.append(monday)
+        monday += timedelta(days=7)
+    return mondays
+
+
+def load_planning_weeks(mondays: List[date_type]) -> Dict[date_type, List[Dict[str, Any]]]:
+    """
+    Sessions des semaines demandées, depuis le cache ou Supabase
+
+    Les semaines absentes du cache sont chargées en une seule requête
+    (du premier au dernier lundi manquant) puis mises en cache une à une.
+    """
+    weeks = {}
+    missing = []
+    for monday in mondays:
+        cached = shared_cache.cache.get(iso_week_namespace(monday), "sessions")
+        if cached is None:
+            missing.append(monday)
+        else:
+            weeks[monday] = cached
+    metrics.incr("planning_week_cache_total", len(weeks), result="hit")
+    metrics.incr("planning_week_cache_total", len(missing), result="miss")
+    if not missing:
+        return weeks
+    
+    # Clés figées avant la requête : une invalidation pendant le chargement l'emporte
+    keys = {monday: shared_cache.cache.versioned_key(iso_week_namespace(monday), "sessions") for monday in missing}
+    response = supabase.get(
+        supabase.query("planning_sessions")
+        .gte("date", missing[0])
+        .lte("date", missing[-1] + timedelta(days=6))
+        .select("*")
+        .order("date.asc", "horaire_debut.asc")
+    )
+    if response.status_code != 200:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Erreur Supabase: {response.text}"
+        )
+    
+    fetched = {monday: [] for monday in missing}
+    for session in response.json():
+        day = parse_date(session["date"])
+        monday = day - timedelta(days=day.weekday())
+        if monday in fetched:
+            fetched[monday].append(session)
+    for monday, sessions in fetched.items():
+        shared_cache.cache.backend.set(keys[monday], sessions, PLANNING_WEEK_CACHE_TTL)
+        weeks[monday] = sessions
+    return weeks
+
+
+def invalidate_planning_weeks(*days):
+    """Invalider les semaines contenant ces dates (les valeurs None sont ignorées)"""
+    for key in {iso_week_namespace(parse_date(day)) for day in days if day}:
+        shared_cache.cache.invalidate(key)
+
+
 # ========================================
 # 📅 ENDPOINTS PLANNING
 # ========================================
@@ -739,6 +1522,7 @@ def get_planning_sessions(
     date_start: str = Query(..., description="Date début (YYYY-MM-DD)"),
     date_end: str = Query(..., description="Date fin (YYYY-MM-DD)"),
     etablissement_id: Optional[int] = None,
+    consistency: str = Query("eventual", pattern="^(eventual|strong)$", description="strong = lecture directe Supabase"),
     _: bool = Depends(verify_agent_token)
 ):
     """
@@ -747,31 +1531,38 @@ def get_planning_sessions(
     GET /planning/sessions?date_start=2026-01-19&date_end=2026-01-31&token=xxx
     """
     try:
-        headers = {
-            "apikey": SUPABASE_KEY,
-            "Authorization": f"Bearer {SUPABASE_KEY}"
-        }
-        
-        query = f"{SUPABASE_URL}/rest/v1/planning_sessions?date=gte.{date_start}&date=lte.{date_end}&select=*&order=date.asc,horaire_debut.asc"
-        
-        if etablissement_id:
-            query += f"&etablissement_id=eq.{etablissement_id}"
-        
-        response = httpx_client.get(query, headers=headers)
-        
-        if response.status_code != 200:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Erreur Supabase: {response.text}"
+        if use_planning_mirror(consistency):
+            sessions = planning_mirror.mirror.sessions(date_start, date_end, etablissement_id)
+            source = "mirror"
+        else:
+            query = (
+                supabase.query("planning_sessions")
+                .gte("date", date_start)
+                .lte("date", date_end)
+                .select("*")
+                .order("date.asc", "horaire_debut.asc")
             )
-        
-        sessions = response.json()
+            
+            if etablissement_id:
+                query.eq("etablissement_id", etablissement_id)
+            
+            response = supabase.get(query)
+            
+            if response.status_code != 200:
+                raise HTTPException(
+                    status_code=500,
+                    detail=f"Erreur Supabase: {response.text}"
+                )
+            
+            sessions = response.json()
+            source = "supabase"
         
         return {
             "success": True,
             "date_start": date_start,
             "date_end": date_end,
             "count": len(sessions),
+            "source": source,
             "sessions": sessions
         }
         
@@ -781,36 +1572,123 @@ def get_planning_sessions(
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/planning/sessions")
-def create_planning_session(
-    session: SessionCreate,
+@app.get("/planning/sessions/changes")
+def get_planning_session_changes(
+    since: Optional[str] = Query(None, description="Jeton de synchro renvoyé par l'appel précédent"),
+    limit: int = Query(1000, ge=1, le=5000, description="Nombre max de sessions modifiées"),
     _: bool = Depends(verify_agent_token)
 ):
     """
-    Créer une nouvelle session planning
+    Synchro incrémentale : sessions créées, modifiées ou supprimées depuis un jeton
     
-    POST /planning/sessions?token=xxx
-    {
-        "date": "2026-01-25",
-        "horaire_debut": "09:00:00",
-        "horaire_fin": "12:30:00",
-        "etablissement_id": 1,
-        "module_id": 1,
-        ...
-    }
+    Sans jeton (ou jeton expiré), la réponse indique `full_resync: true` :
+    le client recharge ses plages via /planning/sessions puis repart du
+    `next_token` fourni.
+    
+    GET /planning/sessions/changes?since=<next_token>&token=xxx
     """
     try:
-        headers = {
-            "apikey": SUPABASE_KEY,
-            "Authorization": f"Bearer {SUPABASE_KEY}",
-            "Content-Type": "application/json",
-            "Prefer": "return=representation"
+        cursor = decode_sync_token(since) if since else None
+        deleted, tombstone_seq = planning_tombstones.since(cursor["tombstone_seq"]) if cursor else (None, None)
+        
+        if cursor is None or deleted is None:
+            # Pas de point de reprise fiable → curseur = dernière modification connue
+            tombstone_seq = planning_tombstones.last_seq
+            response = supabase.get(
+                supabase.query("planning_sessions").select("id,updated_at").order("updated_at.desc.nullslast", "id.desc").limit(1)
+            )
+            if response.status_code != 200:
+                raise HTTPException(
+                    status_code=500,
+                    detail=f"Erreur Supabase: {response.text}"
+                )
+            latest = response.json()
+            
+            return {
+                "success": True,
+                "full_resync": True,
+                "next_token": encode_sync_token(
+                    latest[0]["updated_at"] if latest else None,
+                    latest[0]["id"] if latest else None,
+                    tombstone_seq
+                ),
+                "has_more": False,
+                "inserted": [],
+                "updated": [],
+                "deleted": []
+            }
+        
+        query = supabase.query("planning_sessions").select("*").order("updated_at.asc", "id.asc").limit(limit)
+        if cursor["updated_at"]:
+            # (updated_at, id) strictement après le curseur : une page qui s'arrête au
+            # milieu de lignes de même updated_at (écriture en masse) reprend à l'id suivant
+            if cursor["id"] is not None:
+                query.or_(
+                    condition("updated_at", "gt", cursor["updated_at"]),
+                    f"and({condition('updated_at', 'eq', cursor['updated_at'])},{condition('id', 'gt', cursor['id'])})"
+                )
+            else:
+                query.gt("updated_at", cursor["updated_at"])
+        
+        response = supabase.get(query)
+        
+        if response.status_code != 200:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Erreur Supabase: {response.text}"
+            )
+        
+        changed = response.json()
+        last = changed[-1] if changed else cursor
+        
+        inserted = []
+        updated = []
+        for row in changed:
+            created_at = row.get("created_at")
+            if created_at and cursor["updated_at"] and created_at > cursor["updated_at"]:
+                inserted.append(row)
+            else:
+                updated.append(row)
+        
+        return {
+            "success": True,
+            "full_resync": False,
+            "next_token": encode_sync_token(last["updated_at"], last["id"], tombstone_seq),
+            "has_more": len(changed) == limit,
+            "inserted": inserted,
+            "updated": updated,
+            "deleted": deleted
         }
         
-        response = httpx_client.post(
-            f"{SUPABASE_URL}/rest/v1/planning_sessions",
-            headers=headers,
-            json=session.dict(exclude_none=True)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/planning/sessions")
+def create_planning_session(
+    session: SessionCreate,
+    _: bool = Depends(verify_agent_token)
+):
+    """
+    Créer une nouvelle session planning
+    
+    POST /planning/sessions?token=xxx
+    {
+        "date": "2026-01-25",
+        "horaire_debut": "09:00:00",
+        "horaire_fin": "12:30:00",
+        "etablissement_id": 1,
+        "module_id": 1,
+        ...
+    }
+    """
+    try:
+        # updated_at explicite : la session apparaît dans /planning/sessions/changes
+        response = supabase.insert(
+            "planning_sessions",
+            {**session.dict(exclude_none=True), "updated_at": datetime.utcnow().isoformat()}
         )
         
         if response.status_code not in [200, 201]:
@@ -823,6 +1701,11 @@ def create_planning_session(
         if isinstance(created, list):
             created = created[0]
         
+        if planning_mirror.mirror:
+            planning_mirror.mirror.upsert_sessions([created])
+        invalidate_planning_weeks(created.get("date"))
+        planning_events.publish("session.created", created)
+        
         return {
             "success": True,
             "message": "Session créée",
@@ -847,16 +1730,20 @@ def update_planning_session(
     PATCH /planning/sessions/123?token=xxx
     """
     try:
-        headers = {
-            "apikey": SUPABASE_KEY,
-            "Authorization": f"Bearer {SUPABASE_KEY}",
-            "Content-Type": "application/json"
-        }
-        
-        response = httpx_client.patch(
-            f"{SUPABASE_URL}/rest/v1/planning_sessions?id=eq.{session_id}",
-            headers=headers,
-            json=session.dict(exclude_none=True)
+        update_data = session.dict(exclude_none=True)
+        update_data["updated_at"] = datetime.utcnow().isoformat()
+        
+        # Session déplacée : l'ancienne semaine doit aussi être invalidée
+        previous_date = None
+        if "date" in update_data:
+            previous = supabase.get(supabase.query("planning_sessions").select("date").eq("id", session_id))
+            if previous.status_code == 200 and previous.json():
+                previous_date = previous.json()[0]["date"]
+        
+        response = supabase.update(
+            supabase.query("planning_sessions").eq("id", session_id),
+            update_data,
+            returning=True
         )
         
         if response.status_code not in [200, 204]:
@@ -865,6 +1752,15 @@ def update_planning_session(
                 detail=f"Erreur mise à jour: {response.text}"
             )
         
+        updated = response.json() if response.status_code == 200 else []
+        if isinstance(updated, list):
+            updated = updated[0] if updated else {"id": session_id, **update_data}
+        
+        if planning_mirror.mirror:
+            planning_mirror.mirror.upsert_sessions([updated])
+        invalidate_planning_weeks(previous_date, updated.get("date"))
+        planning_events.publish("session.updated", updated)
+        
         return {
             "success": True,
             "message": "Session mise à jour"
@@ -876,6 +1772,355 @@ def update_planning_session(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def fetch_planning_sessions(
+    first: date_type,
+    last: date_type,
+    slot: Optional[Tuple[str, str]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Toutes les sessions de [first, last] (lecture directe Supabase, page par page)
+
+    Une seule requête serait tronquée sans erreur par le max-rows PostgREST.
+    `slot` (début, fin) : seulement les sessions dont l'horaire chevauche ce créneau.
+    """
+    query = (
+        supabase.query("planning_sessions")
+        .gte("date", first)
+        .lte("date", last)
+        .select("*")
+        .order("date.asc", "horaire_debut.asc", "id.asc")
+    )
+    if slot:
+        query.lt("horaire_debut", slot[1]).gt("horaire_fin", slot[0])
+    sessions: Dict[Any, Dict[str, Any]] = {}
+    offset = 0
+    while True:
+        response = supabase.get(query.copy().limit(SUPABASE_PAGE_SIZE).offset(offset))
+        if response.status_code != 200:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Erreur Supabase: {response.text}"
+            )
+        page = response.json()
+        # Par id : une écriture concurrente peut faire glisser une ligne d'une page à l'autre
+        sessions.update((session["id"], session) for session in page)
+        if len(page) < SUPABASE_PAGE_SIZE:
+            return list(sessions.values())
+        offset += SUPABASE_PAGE_SIZE
+
+
+def propagate_planning_writes(saved: List[Dict[str, Any]], event: str):
+    """Répercuter des sessions écrites : miroir, semaines en cache, flux SSE"""
+    if planning_mirror.mirror:
+        planning_mirror.mirror.upsert_sessions(saved)
+    invalidate_planning_weeks(*(row.get("date") for row in saved))
+    for row in saved:
+        planning_events.publish(event, row)
+
+
+def write_planning_sessions(rows: List[Dict[str, Any]], event: str) -> List[Dict[str, Any]]:
+    """
+    Insérer des sessions par lots (un insert PostgREST par lot)
+
+    Chaque lot écrit est aussitôt propagé (miroir, semaines en cache, flux SSE) :
+    si un lot échoue, les précédents restent cohérents partout.
+    """
+    written = []
+    for offset in range(0, len(rows), PLANNING_BULK_CHUNK_SIZE):
+        chunk = rows[offset:offset + PLANNING_BULK_CHUNK_SIZE]
+        response = supabase.insert("planning_sessions", chunk)
+        if response.status_code not in [200, 201]:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Erreur écriture ({len(written)} sessions déjà écrites): {response.text}"
+            )
+        saved = response.json()
+        propagate_planning_writes(saved, event)
+        written.extend(saved)
+    return written
+
+
+def move_planning_sessions(
+    moves: Dict[Tuple[Tuple[str, str], ...], Tuple[Dict[str, Any], List[Any]]],
+    updated_at: str
+) -> List[Dict[str, Any]]:
+    """
+    Déplacer des sessions : un PATCH par valeur d'origine et par lot d'ids
+
+    `moves` : ((colonne, valeur d'origine), ...) → (nouvelles valeurs, ids).
+    Seules les colonnes décalées et updated_at sont envoyées, filtrées sur
+    l'id et sur les valeurs d'origine : une session modifiée ou supprimée
+    depuis la lecture n'est ni écrasée ni recréée (absente du résultat).
+    """
+    written = []
+    for origin, (target, ids) in moves.items():
+        for offset in range(0, len(ids), PLANNING_BULK_CHUNK_SIZE):
+            query = supabase.query("planning_sessions").in_("id", ids[offset:offset + PLANNING_BULK_CHUNK_SIZE])
+            for column, value in origin:
+                query.eq(column, value)
+            response = supabase.update(query, {**target, "updated_at": updated_at}, returning=True)
+            if response.status_code not in [200, 204]:
+                raise HTTPException(
+                    status_code=500,
+                    detail=f"Erreur écriture ({len(written)} sessions déjà déplacées): {response.text}"
+                )
+            saved = response.json() if response.content else []
+            propagate_planning_writes(saved, "session.updated")
+            written.extend(saved)
+    return written
+
+
+@app.post("/planning/sessions/reschedule")
+def reschedule_planning_sessions(
+    data: SessionReschedule,
+    _: bool = Depends(verify_agent_token)
+):
+    """
+    Décaler en une fois les sessions d'une période (changement de calendrier)
+    
+    Les chevauchements sont recalculés dans la même passe : la réponse liste
+    les sessions déplacées et les conflits créés par le décalage. Les
+    sessions modifiées ou supprimées entre-temps ne sont pas touchées
+    (`skipped`).
+    
+    POST /planning/sessions/reschedule?token=xxx
+    {
+        "date_start": "2026-03-02",
+        "date_end": "2026-03-31",
+        "etablissement_id": 1,
+        "shift_days": 7,
+        "shift_minutes": -30
+    }
+    """
+    try:
+        if not data.shift_days and not data.shift_minutes:
+            raise HTTPException(status_code=400, detail="shift_days ou shift_minutes requis")
+        try:
+            first, last = parse_date(data.date_start), parse_date(data.date_end)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="date_start / date_end : format YYYY-MM-DD attendu")
+        if last < first:
+            raise HTTPException(status_code=400, detail="date_end doit être postérieure à date_start")
+        shift = timedelta(days=data.shift_days)
+        
+        in_range = fetch_planning_sessions(first, last)
+        filters = {"etablissement_id": data.etablissement_id, "module_id": data.module_id, "promotion_id": data.promotion_id}
+        selected = [
+            session for session in in_range
+            if all(value is None or session.get(column) == value for column, value in filters.items())
+        ]
+        if len(selected) > PLANNING_RESCHEDULE_MAX_SESSIONS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"{len(selected)} sessions concernées (maximum {PLANNING_RESCHEDULE_MAX_SESSIONS})"
+            )
+        
+        invalid = [session["id"] for session in selected if not planning_overlaps.has_valid_times(session)]
+        if invalid:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Date ou horaires manquants ou invalides : sessions {invalid}"
+            )
+        
+        # Seules les colonnes décalées sont écrites : un décalage en jours fait
+        # un PATCH par date d'origine, en minutes un par créneau d'origine
+        columns = (["date"] if data.shift_days else []) + (["horaire_debut", "horaire_fin"] if data.shift_minutes else [])
+        moved = []
+        moves: Dict[Tuple[Tuple[str, str], ...], Tuple[Dict[str, Any], List[Any]]] = {}
+        out_of_day = []
+        for session in selected:
+            debut = planning_overlaps.shift_time(session["horaire_debut"], data.shift_minutes)
+            fin = planning_overlaps.shift_time(session["horaire_fin"], data.shift_minutes)
+            if debut is None or fin is None:
+                out_of_day.append(session["id"])
+                continue
+            slot = {"date": (parse_date(session["date"]) + shift).isoformat(), "horaire_debut": debut, "horaire_fin": fin}
+            moved.append({**session, **slot})
+            origin = tuple((column, str(session["date"])[:10] if column == "date" else session[column]) for column in columns)
+            moves.setdefault(origin, ({column: slot[column] for column in columns}, []))[1].append(session["id"])
+        if out_of_day:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Horaires hors de la journée après décalage : sessions {out_of_day}"
+            )
+        
+        # Chevauchements avant / après sur les sessions non déplacées des deux périodes
+        moved_ids = {session["id"] for session in moved}
+        target = fetch_planning_sessions(first + shift, last + shift) if data.shift_days else in_range
+        others = {session["id"]: session for session in [*in_range, *target] if session["id"] not in moved_ids}
+        existing = planning_overlaps.pair_keys(planning_overlaps.find_overlaps([*others.values(), *selected], moved_ids))
+        conflicts = [
+            conflict for conflict in planning_overlaps.find_overlaps([*others.values(), *moved], moved_ids)
+            if frozenset((conflict["session_id_1"], conflict["session_id_2"])) not in existing
+        ]
+        
+        skipped = []
+        if not data.dry_run and moved:
+            try:
+                written_ids = {row["id"] for row in move_planning_sessions(moves, datetime.utcnow().isoformat())}
+            finally:
+                # Semaines de départ (les semaines d'arrivée sont invalidées lot par lot)
+                invalidate_planning_weeks(*(session["date"] for session in selected))
+            # Modifiées ou supprimées entre la lecture et l'écriture : laissées telles quelles
+            skipped = [session["id"] for session in moved if session["id"] not in written_ids]
+            moved = [session for session in moved if session["id"] in written_ids]
+        metrics.incr("planning_sessions_rescheduled_total", 0 if data.dry_run else len(moved))
+        
+        previous = {session["id"]: session for session in selected}
+        return {
+            "success": True,
+            "dry_run": data.dry_run,
+            "count": len(moved),
+            "shift_days": data.shift_days,
+            "shift_minutes": data.shift_minutes,
+            "sessions": [
+                {
+                    "id": session["id"],
+                    "from": {key: previous[session["id"]][key] for key in ("date", "horaire_debut", "horaire_fin")},
+                    "to": {key: session[key] for key in ("date", "horaire_debut", "horaire_fin")}
+                }
+                for session in moved
+            ],
+            "skipped": skipped,
+            "conflicts_count": len(conflicts),
+            "conflicts": conflicts
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def expand_weekly(
+    start: date_type,
+    until: date_type,
+    interval_weeks: int,
+    weekdays: List[int],
+    exclude: set
+) -> Tuple[List[date_type], List[date_type]]:
+    """Dates de la récurrence (et dates exclues rencontrées), semaine par semaine depuis celle de `start`"""
+    dates = []
+    excluded = []
+    monday = start - timedelta(days=start.weekday())
+    while monday <= until:
+        for weekday in sorted(set(weekdays)):
+            day = monday + timedelta(days=weekday)
+            if day < start or day > until:
+                continue
+            if day in exclude:
+                excluded.append(day)
+            else:
+                dates.append(day)
+        monday += timedelta(weeks=interval_weeks)
+    return dates, excluded
+
+
+@app.post("/planning/sessions/series")
+def create_planning_session_series(
+    data: SessionSeries,
+    _: bool = Depends(verify_agent_token)
+):
+    """
+    Créer une série de sessions récurrentes en une seule écriture
+    
+    Les occurrences sont calculées en mémoire, comparées au planning existant
+    (chevauchements) puis insérées par lots.
+    
+    POST /planning/sessions/series?token=xxx
+    {
+        "template": {"date": "2026-09-07", "horaire_debut": "09:00:00", "horaire_fin": "12:00:00", ...},
+        "until": "2027-06-30",
+        "weekdays": [0, 3],
+        "exclude_dates": ["2026-11-11", "2026-12-21"],
+        "on_conflict": "skip"
+    }
+    """
+    try:
+        try:
+            start, until = parse_date(data.template.date), parse_date(data.until)
+            exclude = {parse_date(day) for day in data.exclude_dates}
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Dates : format YYYY-MM-DD attendu")
+        if not planning_overlaps.has_valid_times(data.template.dict()):
+            raise HTTPException(status_code=400, detail="Horaires du modèle manquants ou invalides")
+        if until < start:
+            raise HTTPException(status_code=400, detail="until doit être postérieure à la date du modèle")
+        if any(weekday < 0 or weekday > 6 for weekday in data.weekdays):
+            raise HTTPException(status_code=400, detail="weekdays : valeurs de 0 (lundi) à 6 (dimanche)")
+        
+        dates, excluded = expand_weekly(
+            start,
+            until,
+            data.interval_weeks,
+            data.weekdays or [start.weekday()],
+            exclude
+        )
+        if len(dates) > PLANNING_SERIES_MAX_OCCURRENCES:
+            raise HTTPException(
+                status_code=400,
+                detail=f"{len(dates)} occurrences (maximum {PLANNING_SERIES_MAX_OCCURRENCES})"
+            )
+        
+        # updated_at explicite : les sessions apparaissent dans /planning/sessions/changes
+        template = {**data.template.dict(exclude_none=True), "updated_at": datetime.utcnow().isoformat()}
+        # Identifiants provisoires pour le calcul des chevauchements
+        occurrences = {f"new:{day.isoformat()}": {**template, "date": day.isoformat()} for day in dates}
+        # Seules les sessions du créneau, les jours de la série, peuvent chevaucher
+        existing = []
+        if dates:
+            days = set(dates)
+            existing = [
+                session for session in fetch_planning_sessions(
+                    dates[0], dates[-1], (template["horaire_debut"], template["horaire_fin"])
+                )
+                if parse_date(session["date"]) in days
+            ]
+        conflicts = planning_overlaps.find_overlaps(
+            [*existing, *({**row, "id": key} for key, row in occurrences.items())],
+            set(occurrences)
+        )
+        
+        if conflicts and data.on_conflict == "reject":
+            raise HTTPException(
+                status_code=409,
+                detail={"message": f"{len(conflicts)} chevauchement(s) avec le planning existant", "conflicts": conflicts}
+            )
+        conflicting = {
+            key for conflict in conflicts
+            for key in (conflict["session_id_1"], conflict["session_id_2"])
+            if key in occurrences
+        }
+        skipped = sorted(conflicting) if data.on_conflict == "skip" else []
+        rows = [row for key, row in occurrences.items() if key not in skipped]
+        
+        created = rows
+        if not data.dry_run and rows:
+            created = write_planning_sessions(rows, "session.created")
+            # Une occurrence par date : les identifiants provisoires deviennent les vrais
+            real_ids = {f"new:{str(row['date'])[:10]}": row["id"] for row in created}
+            for conflict in conflicts:
+                for side in ("session_id_1", "session_id_2"):
+                    conflict[side] = real_ids.get(conflict[side], conflict[side])
+        metrics.incr("planning_series_sessions_created_total", 0 if data.dry_run else len(created))
+        
+        return {
+            "success": True,
+            "dry_run": data.dry_run,
+            "count": len(created),
+            "sessions": created,
+            "excluded_dates": [day.isoformat() for day in excluded],
+            "skipped_dates": [key.removeprefix("new:") for key in skipped],
+            "conflicts_count": len(conflicts),
+            "conflicts": conflicts
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.delete("/planning/sessions/{session_id}")
 def delete_planning_session(
     session_id: int,
@@ -887,15 +2132,7 @@ def delete_planning_session(
     DELETE /planning/sessions/123?token=xxx
     """
     try:
-        headers = {
-            "apikey": SUPABASE_KEY,
-            "Authorization": f"Bearer {SUPABASE_KEY}"
-        }
-        
-        response = httpx_client.delete(
-            f"{SUPABASE_URL}/rest/v1/planning_sessions?id=eq.{session_id}",
-            headers=headers
-        )
+        response = supabase.delete(supabase.query("planning_sessions").eq("id", session_id), returning=True)
         
         if response.status_code not in [200, 204]:
             raise HTTPException(
@@ -903,6 +2140,14 @@ def delete_planning_session(
                 detail=f"Erreur suppression: {response.text}"
             )
         
+        deleted = response.json() if response.status_code == 200 else []
+        
+        if planning_mirror.mirror:
+            planning_mirror.mirror.delete_session(session_id)
+        invalidate_planning_weeks(*(row.get("date") for row in deleted))
+        planning_tombstones.record(session_id)
+        planning_events.publish("session.deleted", {"id": session_id})
+        
         return {
             "success": True,
             "message": "Session supprimée"
@@ -927,17 +2172,12 @@ def get_planning_conflicts(
     GET /planning/conflicts?resolved=false&token=xxx
     """
     try:
-        headers = {
-            "apikey": SUPABASE_KEY,
-            "Authorization": f"Bearer {SUPABASE_KEY}"
-        }
-        
-        query = f"{SUPABASE_URL}/rest/v1/planning_conflicts?select=*&order=detected_at.desc"
+        query = supabase.query("planning_conflicts").select("*").order("detected_at.desc")
         
         if resolved is not None:
-            query += f"&resolved=eq.{str(resolved).lower()}"
+            query.eq("resolved", resolved)
         
-        response = httpx_client.get(query, headers=headers)
+        response = supabase.get(query)
         
         if response.status_code != 200:
             raise HTTPException(
@@ -975,12 +2215,6 @@ def resolve_planning_conflict(
     }
     """
     try:
-        headers = {
-            "apikey": SUPABASE_KEY,
-            "Authorization": f"Bearer {SUPABASE_KEY}",
-            "Content-Type": "application/json"
-        }
-        
         update_data = {
             "resolved": True,
             "resolution": data.resolution,
@@ -988,10 +2222,9 @@ def resolve_planning_conflict(
             "resolved_at": datetime.utcnow().isoformat()
         }
         
-        response = httpx_client.patch(
-            f"{SUPABASE_URL}/rest/v1/planning_conflicts?id=eq.{conflict_id}",
-            headers=headers,
-            json=update_data
+        response = supabase.update(
+            supabase.query("planning_conflicts").eq("id", conflict_id),
+            update_data
         )
         
         if response.status_code not in [200, 204]:
@@ -1000,6 +2233,8 @@ def resolve_planning_conflict(
                 detail=f"Erreur résolution: {response.text}"
             )
         
+        planning_events.publish("conflict.resolved", {"id": conflict_id, **update_data})
+        
         return {
             "success": True,
             "message": "Conflit résolu",
@@ -1012,56 +2247,190 @@ def resolve_planning_conflict(
         raise HTTPException(status_code=500, detail=str(e))
 
 
-# --- 3. STATS & ANALYTICS ---
+# --- 3. FLUX TEMPS RÉEL ---
+
+@app.get("/planning/stream")
+async def stream_planning_events(
+    request: Request,
+    _: bool = Depends(verify_agent_token)
+):
+    """
+    Flux Server-Sent Events des modifications du planning
+    
+    Événements : session.created, session.updated, session.deleted,
+    conflict.resolved, resync (le client doit tout recharger)
+    
+    GET /planning/stream?token=xxx
+    """
+    subscriber = planning_events.subscribe()
+    _, queue = subscriber
+    
+    async def event_generator():
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                if await request.is_disconnected():
+                    break
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=PLANNING_STREAM_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    # Commentaire SSE pour garder la connexion ouverte
+                    yield ": ping\n\n"
+                    continue
+                yield format_sse(event)
+        finally:
+            planning_events.unsubscribe(subscriber)
+    
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+
+# --- 4. STATS & ANALYTICS ---
+
+def compute_ca_stats(month: Optional[str], year: Optional[int], consistency: str) -> Dict[str, Any]:
+    """Totaux CA d'un mois, d'une année ou de toute la période"""
+    date_gte = None
+    date_lt = None
+    
+    if month:
+        year_val, month_val = month.split("-")
+        date_gte = f"{year_val}-{month_val}-01"
+        next_month = int(month_val) + 1 if int(month_val) < 12 else 1
+        next_year = year_val if int(month_val) < 12 else str(int(year_val) + 1)
+        date_lt = f"{next_year}-{next_month:02d}-01"
+    elif year:
+        date_gte = f"{year}-01-01"
+        date_lt = f"{year+1}-01-01"
+    
+    if use_planning_mirror(consistency):
+        sessions_count, ca_ht_total, ca_ttc_total = planning_mirror.mirror.ca_totals(date_gte, date_lt)
+        source = "mirror"
+    else:
+        query = supabase.query("planning_sessions").select("ca_ht,ca_ttc,date")
+        
+        if date_gte:
+            query.gte("date", date_gte).lt("date", date_lt)
+        
+        sessions_count = 0
+        ca_ht_total = 0.0
+        ca_ttc_total = 0.0
+        with supabase.stream(query) as sessions:
+            if sessions.status_code != 200:
+                raise HTTPException(
+                    status_code=500,
+                    detail=f"Erreur Supabase: {sessions.text}"
+                )
+            for s in sessions:
+                sessions_count += 1
+                ca_ht_total += float(s.get("ca_ht", 0) or 0)
+                ca_ttc_total += float(s.get("ca_ttc", 0) or 0)
+        source = "supabase"
+    
+    return {
+        "period": month or str(year),
+        "sessions_count": sessions_count,
+        "ca_ht": round(ca_ht_total, 2),
+        "ca_ttc": round(ca_ttc_total, 2),
+        "source": source
+    }
+
+
+snapshots.scheduler.register("planning_ca_stats", compute_ca_stats, CA_STATS_SNAPSHOT_SECONDS)
+
 
 @app.get("/planning/stats/ca")
 def get_ca_stats(
+    response: Response,
     month: Optional[str] = Query(None, description="Mois (YYYY-MM)"),
     year: Optional[int] = Query(None, description="Année (YYYY)"),
+    consistency: str = Query("eventual", pattern="^(eventual|strong)$", description="strong = lecture directe Supabase"),
+    fresh: bool = Query(False, description="Recalculer au lieu de servir l'instantané"),
     _: bool = Depends(verify_agent_token)
 ):
     """
     Statistiques de chiffre d'affaires
     
+    Servies depuis un instantané rafraîchi en fond (`generated_at`, en-tête `Age`) ;
+    `fresh=1` ou `consistency=strong` recalculent immédiatement.
+    
     GET /planning/stats/ca?month=2026-01&token=xxx
     GET /planning/stats/ca?year=2026&token=xxx
     """
     try:
-        headers = {
-            "apikey": SUPABASE_KEY,
-            "Authorization": f"Bearer {SUPABASE_KEY}"
-        }
-        
-        query = f"{SUPABASE_URL}/rest/v1/planning_sessions?select=ca_ht,ca_ttc,date"
-        
-        if month:
-            year_val, month_val = month.split("-")
-            query += f"&date=gte.{year_val}-{month_val}-01"
-            next_month = int(month_val) + 1 if int(month_val) < 12 else 1
-            next_year = year_val if int(month_val) < 12 else str(int(year_val) + 1)
-            query += f"&date=lt.{next_year}-{next_month:02d}-01"
-        elif year:
-            query += f"&date=gte.{year}-01-01&date=lt.{year+1}-01-01"
+        snapshot = snapshots.scheduler.get(
+            "planning_ca_stats",
+            {"month": month, "year": year, "consistency": consistency},
+            fresh=fresh or consistency == "strong"
+        )
+        snapshots.set_age_header(response, snapshot)
         
-        response = httpx_client.get(query, headers=headers)
+        return {
+            "success": True,
+            **snapshot["data"],
+            **snapshots.metadata(snapshot)
+        }
         
-        if response.status_code != 200:
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/planning/stats/ca/series")
+def get_ca_series(
+    start: Optional[str] = Query(None, description="Premier mois (YYYY-MM), défaut : janvier de l'année en cours"),
+    end: Optional[str] = Query(None, description="Dernier mois inclus (YYYY-MM), défaut : start + 11 mois"),
+    group_by: Optional[str] = Query(None, description="etablissement, module ou etablissement,module"),
+    yoy: bool = Query(False, description="Ajouter l'année précédente et l'évolution du CA HT"),
+    consistency: str = Query("eventual", pattern="^(eventual|strong)$", description="strong = lecture directe Supabase"),
+    _: bool = Depends(verify_agent_token)
+):
+    """
+    Séries mensuelles de CA HT / CA TTC / heures facturées, groupées à la demande
+    
+    Une seule lecture des colonnes utiles de planning_sessions, puis un seul
+    passage de calcul : tout un tableau de bord finance en une requête.
+    
+    GET /planning/stats/ca/series?start=2026-01&end=2026-12&group_by=etablissement&yoy=true&token=xxx
+    """
+    try:
+        try:
+            first_month = ca_analytics.month_index(start or f"{datetime.utcnow().year}-01")
+            last_month = ca_analytics.month_index(end) if end else first_month + 11
+            groups = ca_analytics.parse_group_by(group_by)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        n_months = last_month - first_month + 1
+        if n_months < 1 or n_months > CA_SERIES_MAX_MONTHS:
             raise HTTPException(
-                status_code=500,
-                detail=f"Erreur Supabase: {response.text}"
+                status_code=400,
+                detail=f"Période invalide (1 à {CA_SERIES_MAX_MONTHS} mois)"
             )
         
-        sessions = response.json()
+        load_from = first_month - 12 if yoy else first_month
+        date_gte = ca_analytics.month_start(load_from)
+        date_lt = ca_analytics.month_start(last_month + 1)
         
-        ca_ht_total = sum(float(s.get("ca_ht", 0) or 0) for s in sessions)
-        ca_ttc_total = sum(float(s.get("ca_ttc", 0) or 0) for s in sessions)
+        if use_planning_mirror(consistency):
+            columns = ca_analytics.SessionColumns()
+            columns.extend(planning_mirror.mirror.sessions(date_gte, date_lt))
+            source = "mirror"
+        else:
+            columns = ca_analytics.load_columns(date_gte, date_lt)
+            source = "supabase"
         
         return {
             "success": True,
-            "period": month or str(year),
-            "sessions_count": len(sessions),
-            "ca_ht": round(ca_ht_total, 2),
-            "ca_ttc": round(ca_ttc_total, 2)
+            "sessions_loaded": len(columns),
+            "source": source,
+            **ca_analytics.build_series(columns, first_month, n_months, groups, year_over_year=yoy)
         }
         
     except HTTPException:
@@ -1073,6 +2442,7 @@ def get_ca_stats(
 @app.get("/planning/weekly")
 def get_weekly_planning(
     date: str = Query(..., description="Date de référence (YYYY-MM-DD)"),
+    consistency: str = Query("eventual", pattern="^(eventual|strong)$", description="strong = lecture directe Supabase"),
     _: bool = Depends(verify_agent_token)
 ):
     """
@@ -1081,33 +2451,43 @@ def get_weekly_planning(
     GET /planning/weekly?date=2026-01-20&token=xxx
     """
     try:
-        headers = {
-            "apikey": SUPABASE_KEY,
-            "Authorization": f"Bearer {SUPABASE_KEY}"
-        }
-        
         # Calculer début et fin de semaine
         ref_date = datetime.strptime(date, "%Y-%m-%d").date()
         week_start = ref_date - timedelta(days=ref_date.weekday())
         week_end = week_start + timedelta(days=6)
         
-        query = f"{SUPABASE_URL}/rest/v1/planning_sessions?date=gte.{week_start.isoformat()}&date=lte.{week_end.isoformat()}&select=*&order=date.asc,horaire_debut.asc"
-        
-        response = httpx_client.get(query, headers=headers)
-        
-        if response.status_code != 200:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Erreur Supabase: {response.text}"
+        if use_planning_mirror(consistency):
+            sessions = planning_mirror.mirror.sessions(week_start.isoformat(), week_end.isoformat())
+            source = "mirror"
+        elif consistency == "eventual":
+            sessions = load_planning_weeks([week_start])[week_start]
+            source = "supabase"
+        else:
+            query = (
+                supabase.query("planning_sessions")
+                .gte("date", week_start)
+                .lte("date", week_end)
+                .select("*")
+                .order("date.asc", "horaire_debut.asc")
             )
-        
-        sessions = response.json()
+            
+            response = supabase.get(query)
+            
+            if response.status_code != 200:
+                raise HTTPException(
+                    status_code=500,
+                    detail=f"Erreur Supabase: {response.text}"
+                )
+            
+            sessions = response.json()
+            source = "supabase"
         
         return {
             "success": True,
             "week_start": week_start.isoformat(),
             "week_end": week_end.isoformat(),
             "sessions_count": len(sessions),
+            "source": source,
             "sessions": sessions
         }
         
@@ -1117,7 +2497,111 @@ def get_weekly_planning(
         raise HTTPException(status_code=500, detail=str(e))
 
 
-# --- 4. RÉFÉRENTIELS ---
+@app.get("/planning/range")
+def get_planning_range(
+    date_start: Optional[str] = Query(None, description="Date incluse dans la première semaine (YYYY-MM-DD)"),
+    weeks: int = Query(4, ge=1, description="Nombre de semaines à partir de date_start"),
+    month: Optional[str] = Query(None, description="Mois complet (YYYY-MM), prioritaire sur date_start"),
+    etablissement_id: Optional[int] = None,
+    consistency: str = Query("eventual", pattern="^(eventual|strong)$", description="strong = lecture directe Supabase"),
+    _: bool = Depends(verify_agent_token)
+):
+    """
+    Planning sur plusieurs semaines ou un mois, groupé par jour puis établissement
+    
+    Servi semaine ISO par semaine ISO depuis le cache (ou le miroir local) :
+    naviguer d'une période à l'autre ne recharge que les semaines manquantes.
+    
+    GET /planning/range?date_start=2026-01-19&weeks=4&token=xxx
+    GET /planning/range?month=2026-02&token=xxx
+    """
+    try:
+        if month:
+            first = datetime.strptime(month, "%Y-%m").date()
+            last = (first.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+        elif date_start:
+            if weeks > PLANNING_RANGE_MAX_WEEKS:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Au plus {PLANNING_RANGE_MAX_WEEKS} semaines"
+                )
+            ref_date = datetime.strptime(date_start, "%Y-%m-%d").date()
+            first = ref_date - timedelta(days=ref_date.weekday())
+            last = first + timedelta(days=7 * weeks - 1)
+        else:
+            raise HTTPException(status_code=400, detail="date_start ou month requis")
+        
+        mondays = week_mondays(first, last)
+        
+        if use_planning_mirror(consistency):
+            sessions = planning_mirror.mirror.sessions(first.isoformat(), last.isoformat(), etablissement_id)
+            source = "mirror"
+        elif consistency == "eventual":
+            loaded = load_planning_weeks(mondays)
+            sessions = [
+                s for monday in mondays for s in loaded[monday]
+                if first <= parse_date(s["date"]) <= last
+                and (not etablissement_id or s.get("etablissement_id") == etablissement_id)
+            ]
+            source = "supabase"
+        else:
+            query = (
+                supabase.query("planning_sessions")
+                .gte("date", first)
+                .lte("date", last)
+                .select("*")
+                .order("date.asc", "horaire_debut.asc")
+            )
+            if etablissement_id:
+                query.eq("etablissement_id", etablissement_id)
+            
+            response = supabase.get(query)
+            
+            if response.status_code != 200:
+                raise HTTPException(
+                    status_code=500,
+                    detail=f"Erreur Supabase: {response.text}"
+                )
+            
+            sessions = response.json()
+            source = "supabase"
+        
+        # Jour → établissement → sessions (les jours sans session sont présents)
+        by_day: Dict[str, Dict[Any, List[Dict[str, Any]]]] = {}
+        day = first
+        while day <= last:
+            by_day[day.isoformat()] = {}
+            day += timedelta(days=1)
+        for session in sessions:
+            by_day[str(session["date"])[:10]].setdefault(session.get("etablissement_id"), []).append(session)
+        
+        return {
+            "success": True,
+            "range_start": first.isoformat(),
+            "range_end": last.isoformat(),
+            "weeks": [iso_week_key(monday) for monday in mondays],
+            "sessions_count": len(sessions),
+            "source": source,
+            "days": [
+                {
+                    "date": day_key,
+                    "sessions_count": sum(len(group) for group in etablissements.values()),
+                    "etablissements": [
+                        {"etablissement_id": etab_id, "sessions": group}
+                        for etab_id, group in etablissements.items()
+                    ]
+                }
+                for day_key, etablissements in by_day.items()
+            ]
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# --- 5. RÉFÉRENTIELS ---
 
 @app.get("/planning/etablissements")
 def get_etablissements(
@@ -1130,25 +2614,25 @@ def get_etablissements(
     GET /planning/etablissements?actif=true&token=xxx
     """
     try:
-        headers = {
-            "apikey": SUPABASE_KEY,
-            "Authorization": f"Bearer {SUPABASE_KEY}"
-        }
-        
-        query = f"{SUPABASE_URL}/rest/v1/planning_etablissements?select=*&order=nom.asc"
+        query = supabase.query("planning_etablissements").select("*").order("nom.asc")
         
         if actif is not None:
-            query += f"&actif=eq.{str(actif).lower()}"
-        
-        response = httpx_client.get(query, headers=headers)
+            query.eq("actif", actif)
         
-        if response.status_code != 200:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Erreur Supabase: {response.text}"
-            )
+        def fetch_etablissements():
+            response = supabase.get(query)
+            
+            if response.status_code != 200:
+                raise HTTPException(
+                    status_code=500,
+                    detail=f"Erreur Supabase: {response.text}"
+                )
+            
+            return response.json()
         
-        etablissements = response.json()
+        etablissements = shared_cache.cache.get_or_compute(
+            "referentiels", f"etablissements:{actif}", fetch_etablissements, ttl=REFERENTIELS_CACHE_TTL
+        )
         
         return {
             "success": True,
@@ -1174,28 +2658,28 @@ def get_modules(
     GET /planning/modules?etablissement_id=1&actif=true&token=xxx
     """
     try:
-        headers = {
-            "apikey": SUPABASE_KEY,
-            "Authorization": f"Bearer {SUPABASE_KEY}"
-        }
-        
-        query = f"{SUPABASE_URL}/rest/v1/planning_modules?select=*&order=nom.asc"
+        query = supabase.query("planning_modules").select("*").order("nom.asc")
         
         if etablissement_id:
-            query += f"&etablissement_id=eq.{etablissement_id}"
+            query.eq("etablissement_id", etablissement_id)
         
         if actif is not None:
-            query += f"&actif=eq.{str(actif).lower()}"
+            query.eq("actif", actif)
         
-        response = httpx_client.get(query, headers=headers)
-        
-        if response.status_code != 200:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Erreur Supabase: {response.text}"
-            )
+        def fetch_modules():
+            response = supabase.get(query)
+            
+            if response.status_code != 200:
+                raise HTTPException(
+                    status_code=500,
+                    detail=f"Erreur Supabase: {response.text}"
+                )
+            
+            return response.json()
         
-        modules = response.json()
+        modules = shared_cache.cache.get_or_compute(
+            "referentiels", f"modules:{etablissement_id}:{actif}", fetch_modules, ttl=REFERENTIELS_CACHE_TTL
+        )
         
         return {
             "success": True,
@@ -1209,6 +2693,61 @@ def get_modules(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def prewarm_referentiels():
+    """Remplir le cache des référentiels demandés par le calendrier (COLD_START_MODE)"""
+    with startup_timer.phase("referentiels_prewarm"):
+        try:
+            get_etablissements(actif=True, _=True)
+            get_modules(etablissement_id=None, actif=True, _=True)
+        except Exception as e:
+            logger.warning("Préchauffage des référentiels impossible", extra={"error": str(e)})
+
+
+# --- 6. EXPORT FACTURATION ---
+
+@app.get("/planning/export")
+def export_planning_sessions(
+    date_start: date_type = Query(..., description="Date début (YYYY-MM-DD)"),
+    date_end: date_type = Query(..., description="Date fin (YYYY-MM-DD)"),
+    format: str = Query("csv", pattern="^(csv|xlsx)$"),
+    etablissement_id: Optional[int] = None,
+    _: bool = Depends(verify_agent_token)
+):
+    """
+    Export de facturation des sessions (CSV ou XLSX), en flux
+    
+    Durées, tarifs et CA de chaque session avec les noms d'établissement
+    et de module. Les pages Supabase sont converties et envoyées une à une.
+    
+    GET /planning/export?date_start=2026-01-01&date_end=2026-01-31&format=xlsx&token=xxx
+    """
+    try:
+        if date_end < date_start:
+            raise HTTPException(status_code=400, detail="date_end doit être postérieure à date_start")
+        
+        # Tous les référentiels (actifs ou non) : une session ancienne peut viser un module archivé
+        etablissements = {row["id"]: row.get("nom") for row in get_etablissements(actif=None, _=True)["etablissements"]}
+        modules = {row["id"]: row.get("nom") for row in get_modules(etablissement_id=None, actif=None, _=True)["modules"]}
+        
+        # Première page lue avant de répondre : une erreur Supabase donne encore un 500
+        pages = planning_export.stream_sessions(date_start, date_end, etablissement_id)
+        first = next(pages, None)
+        pages = chain([first], pages) if first is not None else iter(())
+        
+        metrics.incr("planning_exports_total", format=format)
+        filename = f"planning_{date_start}_{date_end}.{format}"
+        return StreamingResponse(
+            planning_export.WRITERS[format](planning_export.rows(pages, etablissements, modules)),
+            media_type=planning_export.CONTENT_TYPES[format],
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # ========================================
 # 📆 ENDPOINT CALENDAR (Vue HTML)
 # ========================================
@@ -1235,6 +2774,58 @@ def get_planning_calendar(
             status_code=404
         )
 
+# ========================================
+# 📦 REQUÊTES GROUPÉES
+# ========================================
+
+@app.post("/batch")
+async def batch_operations(
+    data: BatchRequest,
+    request: Request,
+    token: Optional[str] = Query(None),
+    _: bool = Depends(verify_agent_token)
+):
+    """
+    Exécuter plusieurs appels d'agent en une seule requête
+    
+    Les opérations indépendantes s'exécutent en parallèle ; `depends_on`
+    impose un ordre. Chaque résultat porte son propre statut HTTP.
+    
+    Exemple :
+    {
+        "operations": [
+            {"id": "maj", "method": "PATCH", "path": "/agent/session/abc", "body": {"progression_current": 3}},
+            {"id": "planning", "path": "/planning/weekly?date=2026-03-02"},
+            {"id": "fin", "method": "POST", "path": "/agent/session/abc/end", "body": {"score": 80}, "depends_on": ["maj"]}
+        ]
+    }
+    """
+    operations = []
+    for index, operation in enumerate(data.operations):
+        values = operation.dict()
+        values["id"] = values["id"] or str(index)
+        values["method"] = values["method"].upper()
+        operations.append(values)
+    try:
+        batch.validate_operations(operations, BATCH_MAX_OPERATIONS, BATCH_EXCLUDED_PATHS)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    headers = {name: request.headers[name] for name in batch.FORWARDED_HEADERS if name in request.headers}
+    if token and "x-agent-token" not in headers:
+        headers["x-agent-token"] = token
+
+    metrics.incr("batch_requests_total")
+    metrics.incr("batch_operations_requested_total", len(operations))
+    results = await batch.run_batch(app, operations, headers, BATCH_MAX_CONCURRENCY)
+    return {
+        "success": all(result["status"] < 400 for result in results),
+        "count": len(results),
+        "results": results
+    }
+
+startup_timer.mark("app")
+
 # ========================================
 # 🚀 RUN
 # ========================================
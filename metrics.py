@@ -0,0 +1,52 @@
+"""
+Métriques internes pour BaseGenspark API
+========================================
+
+Compteurs et jauges en mémoire, exposés par GET /metrics.
+Les labels sont aplatis dans la clé : `nom{label=valeur,...}`.
+"""
+
+import threading
+from collections import defaultdict
+from typing import Dict, Any
+
+_lock = threading.Lock()
+_counters = defaultdict(float)
+_gauges = {}
+
+
+def _key(name: str, labels: Dict[str, Any]) -> str:
+    if not labels:
+        return name
+    rendered = ",".join(f"{label}={value}" for label, value in sorted(labels.items()))
+    return f"{name}{{{rendered}}}"
+
+
+def incr(name: str, value: float = 1, **labels):
+    """Incrémenter un compteur"""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] += value
+
+
+def set_gauge(name: str, value: float, **labels):
+    """Fixer la valeur courante d'une jauge"""
+    key = _key(name, labels)
+    with _lock:
+        _gauges[key] = value
+
+
+def remove_gauge(name: str, **labels):
+    """Retirer une jauge devenue sans objet (label inactif)"""
+    key = _key(name, labels)
+    with _lock:
+        _gauges.pop(key, None)
+
+
+def snapshot() -> Dict[str, Dict[str, float]]:
+    """Copie de toutes les métriques"""
+    with _lock:
+        return {
+            "counters": dict(sorted(_counters.items())),
+            "gauges": dict(sorted(_gauges.items()))
+        }
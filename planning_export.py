@@ -0,0 +1,213 @@
+"""
+Export de facturation du planning
+=================================
+
+Les sessions d'une période sont lues page par page dans Supabase et
+chaque page est aussitôt convertie en lignes CSV ou XLSX puis envoyée :
+la mémoire ne dépend pas de la taille de la période et le
+téléchargement commence dès la première page.
+
+Les noms d'établissement et de module sont résolus à partir des
+référentiels (dictionnaires id → nom fournis par l'appelant).
+
+Le XLSX est écrit sans dépendance : un classeur minimal (une feuille,
+chaînes en ligne) dans une archive zip produite au fil de l'eau.
+"""
+
+import csv
+import io
+import re
+import zipfile
+from datetime import date
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+from xml.sax.saxutils import escape
+
+from supabase_client import SUPABASE_PAGE_SIZE, supabase
+
+
+# Colonnes de planning_sessions, plus les noms résolus des référentiels
+RESOLVED = ("etablissement", "module")
+COLUMNS: List[str] = [
+    "id",
+    "date",
+    "horaire_debut",
+    "horaire_fin",
+    "etablissement_id",
+    "etablissement",
+    "module_id",
+    "module",
+    "promotion_id",
+    "numero_session",
+    "annee_scolaire",
+    "statut_id",
+    "duree_reelle_h",
+    "duree_facturee_h",
+    "tarif_ht_applique",
+    "tva_pct_applique",
+    "ca_ht",
+    "ca_ttc",
+]
+SELECT = ",".join(column for column in COLUMNS if column not in RESOLVED)
+
+CONTENT_TYPES = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+def stream_sessions(
+    date_start: date,
+    date_end: date,
+    etablissement_id: Optional[int] = None
+) -> Iterator[List[Dict[str, Any]]]:
+    """Pages de sessions de la période, par date puis horaire"""
+    query = (
+        supabase.query("planning_sessions")
+        .select(SELECT)
+        .gte("date", date_start)
+        .lte("date", date_end)
+        .order("date.asc", "horaire_debut.asc", "id.asc")
+    )
+    if etablissement_id:
+        query.eq("etablissement_id", etablissement_id)
+    offset = 0
+    while True:
+        response = supabase.get(query.copy().limit(SUPABASE_PAGE_SIZE).offset(offset))
+        response.raise_for_status()
+        page = response.json()
+        if page:
+            yield page
+        if len(page) < SUPABASE_PAGE_SIZE:
+            return
+        offset += SUPABASE_PAGE_SIZE
+
+
+def rows(
+    pages: Iterable[List[Dict[str, Any]]],
+    etablissements: Dict[Any, str],
+    modules: Dict[Any, str]
+) -> Iterator[List[List[Any]]]:
+    """Pages de lignes (valeurs dans l'ordre de COLUMNS, noms résolus)"""
+    for page in pages:
+        lines = []
+        for session in page:
+            resolved = {
+                **session,
+                "etablissement": etablissements.get(session.get("etablissement_id")),
+                "module": modules.get(session.get("module_id"))
+            }
+            lines.append([resolved.get(column) for column in COLUMNS])
+        yield lines
+
+
+# ========================================
+# CSV
+# ========================================
+
+def csv_chunks(pages: Iterable[List[List[Any]]]) -> Iterator[bytes]:
+    """En-tête puis un bloc par page (BOM UTF-8 pour Excel)"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    yield ("\ufeff" + buffer.getvalue()).encode("utf-8")
+    for lines in pages:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(lines)
+        yield buffer.getvalue().encode("utf-8")
+
+
+# ========================================
+# XLSX
+# ========================================
+
+_INVALID_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+_STATIC_PARTS = {
+    "[Content_Types].xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    "_rels/.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    "xl/workbook.xml": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Sessions" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    "xl/_rels/workbook.xml.rels": (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+
+class _Pipe:
+    """Fichier en écriture seule dont on récupère le contenu au fur et à mesure"""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def _cell(value: Any) -> str:
+    if value is None:
+        return "<c/>"
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return f"<c><v>{value}</v></c>"
+    text = escape(_INVALID_XML.sub("", str(value)))
+    return f'<c t="inlineStr"><is><t>{text}</t></is></c>'
+
+
+def _row(values: Iterable[Any]) -> str:
+    return "<row>" + "".join(_cell(value) for value in values) + "</row>"
+
+
+def xlsx_chunks(pages: Iterable[List[List[Any]]]) -> Iterator[bytes]:
+    """Archive XLSX produite page par page (zip sans retour en arrière)"""
+    pipe = _Pipe()
+    with zipfile.ZipFile(pipe, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, content in _STATIC_PARTS.items():
+            archive.writestr(name, content)
+        with archive.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            sheet.write(_row(COLUMNS).encode("utf-8"))
+            yield pipe.drain()
+            for lines in pages:
+                sheet.write("".join(_row(line) for line in lines).encode("utf-8"))
+                yield pipe.drain()
+            sheet.write(b"</sheetData></worksheet>")
+    yield pipe.drain()
+
+
+WRITERS: Dict[str, Callable[[Iterable[List[List[Any]]]], Iterator[bytes]]] = {
+    "csv": csv_chunks,
+    "xlsx": xlsx_chunks,
+}
@@ -0,0 +1,291 @@
+"""
+Miroir SQLite local des tables planning
+=======================================
+
+Copie locale (optionnelle) de `planning_sessions`, `planning_etablissements`
+et `planning_modules`, indexée sur date / etablissement_id / module_id.
+Activée par PLANNING_MIRROR_PATH.
+
+Synchronisation :
+- chargement complet au démarrage, puis toutes les PLANNING_MIRROR_FULL_SYNC_SECONDS
+  (rattrape les suppressions faites hors API)
+- incrémental toutes les PLANNING_MIRROR_SYNC_SECONDS à partir du curseur
+  (updated_at, id) : les sessions de même updated_at ne sont pas sautées
+- immédiat pour les écritures faites par l'API (`upsert_sessions`, `delete_session`)
+
+Une seule synchro à la fois par machine (verrou du cache partagé).
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import shared_cache
+from structured_log import get_logger
+from supabase_client import SUPABASE_PAGE_SIZE, PostgrestQuery, condition, supabase
+
+PLANNING_MIRROR_PATH = os.getenv("PLANNING_MIRROR_PATH", "")
+PLANNING_MIRROR_SYNC_SECONDS = float(os.getenv("PLANNING_MIRROR_SYNC_SECONDS", "30"))
+PLANNING_MIRROR_FULL_SYNC_SECONDS = float(os.getenv("PLANNING_MIRROR_FULL_SYNC_SECONDS", "3600"))
+
+
+logger = get_logger("planning_mirror")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS planning_sessions (
+    id INTEGER PRIMARY KEY,
+    date TEXT NOT NULL,
+    horaire_debut TEXT,
+    etablissement_id INTEGER,
+    module_id INTEGER,
+    ca_ht REAL,
+    ca_ttc REAL,
+    updated_at TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_date ON planning_sessions (date, horaire_debut);
+CREATE INDEX IF NOT EXISTS idx_sessions_etablissement ON planning_sessions (etablissement_id, date);
+CREATE INDEX IF NOT EXISTS idx_sessions_module ON planning_sessions (module_id, date);
+CREATE INDEX IF NOT EXISTS idx_sessions_updated_at ON planning_sessions (updated_at);
+
+CREATE TABLE IF NOT EXISTS planning_etablissements (
+    id INTEGER PRIMARY KEY,
+    nom TEXT,
+    actif INTEGER,
+    data TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS planning_modules (
+    id INTEGER PRIMARY KEY,
+    etablissement_id INTEGER,
+    nom TEXT,
+    actif INTEGER,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_modules_etablissement ON planning_modules (etablissement_id);
+
+CREATE TABLE IF NOT EXISTS mirror_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def _session_row(session: Dict[str, Any]) -> Tuple:
+    return (
+        session["id"],
+        session["date"],
+        session.get("horaire_debut"),
+        session.get("etablissement_id"),
+        session.get("module_id"),
+        float(session.get("ca_ht", 0) or 0),
+        float(session.get("ca_ttc", 0) or 0),
+        session.get("updated_at"),
+        json.dumps(session, default=str)
+    )
+
+
+class PlanningMirror:
+    """Lecture locale indexée des tables planning"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # --- état ---
+
+    def _meta(self, key: str) -> Optional[str]:
+        row = self._conn().execute("SELECT value FROM mirror_meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, conn: sqlite3.Connection, key: str, value: str):
+        conn.execute("INSERT OR REPLACE INTO mirror_meta (key, value) VALUES (?, ?)", (key, value))
+
+    @property
+    def ready(self) -> bool:
+        """Miroir chargé entièrement et synchronisé récemment (sinon lecture Supabase)"""
+        last_sync = self._meta("last_sync_epoch")
+        return (
+            self._meta("last_full_sync") is not None
+            and last_sync is not None
+            and time.time() - float(last_sync) < PLANNING_MIRROR_SYNC_SECONDS * 10
+        )
+
+    # --- synchronisation ---
+
+    def _fetch_all(self, query: PostgrestQuery) -> List[Dict[str, Any]]:
+        rows = []
+        offset = 0
+        while True:
+            response = supabase.get(query.copy().limit(SUPABASE_PAGE_SIZE).offset(offset))
+            response.raise_for_status()
+            page = response.json()
+            rows.extend(page)
+            if len(page) < SUPABASE_PAGE_SIZE:
+                return rows
+            offset += SUPABASE_PAGE_SIZE
+
+    def full_sync(self):
+        """Recharger entièrement les trois tables"""
+        sessions = self._fetch_all(supabase.query("planning_sessions").select("*").order("id.asc"))
+        etablissements = self._fetch_all(supabase.query("planning_etablissements").select("*").order("id.asc"))
+        modules = self._fetch_all(supabase.query("planning_modules").select("*").order("id.asc"))
+
+        cursor = max(((s["updated_at"], s["id"]) for s in sessions if s.get("updated_at")), default=("", 0))
+        now = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM planning_sessions")
+            conn.executemany(
+                "INSERT INTO planning_sessions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [_session_row(s) for s in sessions]
+            )
+            conn.execute("DELETE FROM planning_etablissements")
+            conn.executemany(
+                "INSERT INTO planning_etablissements VALUES (?, ?, ?, ?)",
+                [(e["id"], e.get("nom"), e.get("actif"), json.dumps(e, default=str)) for e in etablissements]
+            )
+            conn.execute("DELETE FROM planning_modules")
+            conn.executemany(
+                "INSERT INTO planning_modules VALUES (?, ?, ?, ?, ?)",
+                [
+                    (m["id"], m.get("etablissement_id"), m.get("nom"), m.get("actif"), json.dumps(m, default=str))
+                    for m in modules
+                ]
+            )
+            self._set_cursor(conn, *cursor)
+            self._set_meta(conn, "last_full_sync", now)
+            self._set_meta(conn, "last_full_sync_epoch", str(time.time()))
+            self._set_meta(conn, "last_sync", now)
+            self._set_meta(conn, "last_sync_epoch", str(time.time()))
+
+    def full_sync_due(self) -> bool:
+        last = self._meta("last_full_sync_epoch")
+        return last is None or time.time() - float(last) > PLANNING_MIRROR_FULL_SYNC_SECONDS
+
+    def _set_cursor(self, conn: sqlite3.Connection, updated_at: str, session_id: Any):
+        self._set_meta(conn, "cursor", updated_at)
+        self._set_meta(conn, "cursor_id", str(session_id))
+
+    def incremental_sync(self):
+        """Appliquer les sessions modifiées après le curseur (updated_at, id), page par page"""
+        updated_at = self._meta("cursor") or ""
+        session_id = int(self._meta("cursor_id") or 0)
+        conn = self._conn()
+        while True:
+            query = (
+                supabase.query("planning_sessions")
+                .select("*")
+                .order("updated_at.asc", "id.asc")
+                .limit(SUPABASE_PAGE_SIZE)
+            )
+            if updated_at:
+                query.or_(
+                    condition("updated_at", "gt", updated_at),
+                    f"and({condition('updated_at', 'eq', updated_at)},{condition('id', 'gt', session_id)})"
+                )
+            else:
+                query.not_is("updated_at", None)
+            response = supabase.get(query)
+            response.raise_for_status()
+            changed = response.json()
+            if changed:
+                updated_at, session_id = changed[-1]["updated_at"], changed[-1]["id"]
+                with conn:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO planning_sessions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        [_session_row(s) for s in changed]
+                    )
+                    self._set_cursor(conn, updated_at, session_id)
+            if len(changed) < SUPABASE_PAGE_SIZE:
+                break
+        with conn:
+            self._set_meta(conn, "last_sync", time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()))
+            self._set_meta(conn, "last_sync_epoch", str(time.time()))
+
+    def upsert_sessions(self, sessions: List[Dict[str, Any]]):
+        """Appliquer des sessions renvoyées par nos propres écritures (fusion si partielles)"""
+        conn = self._conn()
+        with conn:
+            for session in sessions:
+                row = conn.execute("SELECT data FROM planning_sessions WHERE id = ?", (session["id"],)).fetchone()
+                merged = {**json.loads(row[0]), **session} if row else session
+                if "date" not in merged:
+                    continue
+                conn.execute(
+                    "INSERT OR REPLACE INTO planning_sessions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    _session_row(merged)
+                )
+
+    def delete_session(self, session_id: int):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM planning_sessions WHERE id = ?", (session_id,))
+
+    # --- lectures ---
+
+    def sessions(
+        self,
+        date_start: str,
+        date_end: str,
+        etablissement_id: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """Sessions entre deux dates incluses, triées par date puis horaire"""
+        query = "SELECT data FROM planning_sessions WHERE date >= ? AND date <= ?"
+        params: List[Any] = [date_start, date_end]
+        if etablissement_id:
+            query += " AND etablissement_id = ?"
+            params.append(etablissement_id)
+        query += " ORDER BY date, horaire_debut"
+        return [json.loads(row[0]) for row in self._conn().execute(query, params)]
+
+    def ca_totals(self, date_gte: Optional[str] = None, date_lt: Optional[str] = None) -> Tuple[int, float, float]:
+        """(nombre de sessions, CA HT, CA TTC) sur une période"""
+        query = "SELECT COUNT(*), COALESCE(SUM(ca_ht), 0), COALESCE(SUM(ca_ttc), 0) FROM planning_sessions WHERE 1 = 1"
+        params: List[Any] = []
+        if date_gte:
+            query += " AND date >= ?"
+            params.append(date_gte)
+        if date_lt:
+            query += " AND date < ?"
+            params.append(date_lt)
+        count, ca_ht, ca_ttc = self._conn().execute(query, params).fetchone()
+        return count, ca_ht, ca_ttc
+
+
+def sync_loop(mirror: PlanningMirror):
+    """Boucle de synchro (thread de fond)"""
+    lock_key = "planning_mirror_sync"
+    while True:
+        if shared_cache.cache.backend.try_lock(lock_key, PLANNING_MIRROR_SYNC_SECONDS * 2):
+            try:
+                if mirror.full_sync_due():
+                    mirror.full_sync()
+                else:
+                    mirror.incremental_sync()
+            except Exception as e:
+                logger.warning("Synchro miroir planning impossible", extra={"error": str(e)})
+            finally:
+                shared_cache.cache.backend.unlock(lock_key)
+        time.sleep(PLANNING_MIRROR_SYNC_SECONDS)
+
+
+def start_sync_thread(mirror: PlanningMirror):
+    threading.Thread(target=sync_loop, args=(mirror,), name="planning-mirror", daemon=True).start()
+
+
+mirror: Optional[PlanningMirror] = PlanningMirror(PLANNING_MIRROR_PATH) if PLANNING_MIRROR_PATH else None
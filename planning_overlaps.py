@@ -0,0 +1,88 @@
+"""
+Chevauchements de sessions planning
+===================================
+
+Deux sessions se chevauchent si elles ont lieu le même jour et que leurs
+plages horaires se recouvrent (un seul formateur : l'établissement ne
+compte pas). Le format des conflits reprend celui de `planning_conflicts`
+(session_id_1, session_id_2, overlap_start) pour que le calendrier puisse
+les afficher tels quels.
+"""
+
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+# Jour quelconque servant à faire l'arithmétique sur les horaires
+_REFERENCE_DAY = date(2000, 1, 1)
+
+
+def parse_time(value: str) -> time:
+    """'09:00' ou '09:00:00' → time"""
+    return time.fromisoformat(str(value))
+
+
+def format_time(value: time) -> str:
+    return value.strftime("%H:%M:%S")
+
+
+def shift_time(value: str, minutes: int) -> Optional[str]:
+    """Décaler un horaire de `minutes` ; None si le résultat sort de la journée"""
+    moved = datetime.combine(_REFERENCE_DAY, parse_time(value)) + timedelta(minutes=minutes)
+    if moved.date() != _REFERENCE_DAY:
+        return None
+    return format_time(moved.time())
+
+
+def interval(session: Dict[str, Any]) -> Tuple[datetime, datetime]:
+    day = date.fromisoformat(str(session["date"])[:10])
+    start = datetime.combine(day, parse_time(session["horaire_debut"]))
+    end = datetime.combine(day, parse_time(session["horaire_fin"]))
+    return start, max(start, end)
+
+
+def has_valid_times(session: Dict[str, Any]) -> bool:
+    """Date et horaires présents et lisibles (sinon la session n'a pas de place sur la journée)"""
+    try:
+        interval(session)
+    except (KeyError, TypeError, ValueError):
+        return False
+    return True
+
+
+def find_overlaps(
+    sessions: Iterable[Dict[str, Any]],
+    involving: Optional[Set[Any]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Paires de sessions qui se chevauchent (balayage trié par début)
+
+    `involving` : ne garder que les paires dont au moins une session
+    appartient à cet ensemble d'identifiants. Une session sans identifiant
+    (pas encore créée) doit porter une clé `id` provisoire. Les sessions
+    sans date ou horaires valides sont ignorées.
+    """
+    timed = sorted(
+        ((*interval(session), session) for session in sessions if has_valid_times(session)),
+        key=lambda item: (item[0], item[1])
+    )
+    conflicts = []
+    active: List[Tuple[datetime, datetime, Dict[str, Any]]] = []
+    for start, end, session in timed:
+        active = [item for item in active if item[1] > start]
+        for other_start, other_end, other in active:
+            if involving is not None and session["id"] not in involving and other["id"] not in involving:
+                continue
+            conflicts.append({
+                "session_id_1": other["id"],
+                "session_id_2": session["id"],
+                "date": start.date().isoformat(),
+                "overlap_start": start.isoformat(),
+                "overlap_end": min(end, other_end).isoformat()
+            })
+        if end > start:
+            active.append((start, end, session))
+    return conflicts
+
+
+def pair_keys(conflicts: Iterable[Dict[str, Any]]) -> Set[frozenset]:
+    return {frozenset((conflict["session_id_1"], conflict["session_id_2"])) for conflict in conflicts}
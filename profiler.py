@@ -0,0 +1,286 @@
+"""
+Profilage à la demande pour BaseGenspark API
+============================================
+
+Désactivé par défaut (PROFILE_ENABLED) : le middleware n'est alors même
+pas installé, le coût est nul. Activé, une requête est profilée si :
+
+- elle porte `X-Profile: speedscope` ou `X-Profile: collapsed` et un token
+  d'agent valide → la réponse est remplacée par le fichier de profil
+  (statut d'origine dans `X-Profiled-Status`)
+- ou elle est tirée au sort (PROFILE_SAMPLE_RATE) → réponse normale
+
+Un thread échantillonne les piles (`sys._current_frames`) pendant la
+requête seulement. Ne sont gardées que les piles de cette requête :
+boucle asyncio quand la pile traverse le middleware de ce profil (validation
+pydantic, encodage JSON), threads du threadpool qui exécutent dans le
+contexte copié de la requête (route, attente httpx). Les derniers profils
+sont conservés en mémoire pour /admin/profiles.
+
+Formats : speedscope (https://www.speedscope.app) et piles repliées
+(`a;b;c 12`, pour flamegraph.pl / inferno).
+"""
+
+import contextvars
+import hmac
+import json
+import random
+import sys
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+from uuid import uuid4
+
+import metrics
+from rate_limit import header_value
+
+FORMATS = {
+    "speedscope": ("application/json", "speedscope.json"),
+    "collapsed": ("text/plain", "folded.txt"),
+}
+
+# Catégorie d'un échantillon : premier module reconnu en partant de la feuille
+CATEGORIES: List[Tuple[str, Tuple[str, ...]]] = [
+    ("httpx", ("/httpx/", "/httpcore/", "/h2/", "/ssl.py", "/socket.py", "/selectors.py")),
+    ("pydantic", ("/pydantic/", "/pydantic_core/")),
+    ("json", ("/json/", "/fastapi/encoders.py")),
+]
+
+profile_var: contextvars.ContextVar[Optional["Profile"]] = contextvars.ContextVar("profile", default=None)
+
+FrameKey = Tuple[str, str, int]
+
+
+class Profile:
+    """Échantillons des piles d'une requête"""
+
+    def __init__(self, method: str, path: str, interval: float, trigger: str):
+        self.id = uuid4().hex[:12]
+        self.method = method
+        self.path = path
+        self.interval = interval
+        self.trigger = trigger
+        self.started_at = time.time()
+        self.duration: Optional[float] = None
+        self.status: Optional[int] = None
+        self.stacks: Dict[Tuple[FrameKey, ...], int] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._thread = threading.Thread(target=self._sample_loop, name=f"profiler-{self.id}", daemon=True)
+        self._thread.start()
+
+    def stop(self, status: Optional[int]):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.duration = time.perf_counter() - self._started
+        self.status = status
+
+    def _sample_loop(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = self._stack(frame)
+                if stack:
+                    self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+    def _owns(self, frame) -> bool:
+        if frame.f_code is _MIDDLEWARE_CODE:
+            return frame.f_locals.get("profile") is self
+        for value in frame.f_locals.values():
+            if isinstance(value, contextvars.Context) and value.get(profile_var) is self:
+                return True
+        return False
+
+    def _stack(self, leaf) -> Optional[Tuple[FrameKey, ...]]:
+        """Pile (racine → feuille) si elle appartient à cette requête, sinon None"""
+        frames = []
+        frame = leaf
+        while frame is not None:
+            code = frame.f_code
+            frames.append((code.co_filename, code.co_name, code.co_firstlineno))
+            if self._owns(frame):
+                return tuple(reversed(frames))
+            frame = frame.f_back
+        return None
+
+    @property
+    def samples(self) -> int:
+        return sum(self.stacks.values())
+
+    def breakdown(self) -> Dict[str, float]:
+        """Part des échantillons par catégorie (httpx, pydantic, json, app)"""
+        totals: Dict[str, int] = {}
+        for stack, count in self.stacks.items():
+            category = "app"
+            for filename, _, _ in reversed(stack):
+                match = next((name for name, markers in CATEGORIES if any(m in filename for m in markers)), None)
+                if match:
+                    category = match
+                    break
+            totals[category] = totals.get(category, 0) + count
+        samples = self.samples or 1
+        return {category: round(count / samples * 100, 1) for category, count in sorted(totals.items())}
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "trigger": self.trigger,
+            "status": self.status,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration * 1000, 1) if self.duration is not None else None,
+            "samples": self.samples,
+            "interval_ms": self.interval * 1000,
+            "breakdown_pct": self.breakdown()
+        }
+
+    # ========================================
+    # EXPORTS
+    # ========================================
+
+    def to_speedscope(self) -> Dict[str, Any]:
+        frames: List[Dict[str, Any]] = []
+        index: Dict[FrameKey, int] = {}
+        samples = []
+        weights = []
+        for stack, count in self.stacks.items():
+            ids = []
+            for key in stack:
+                if key not in index:
+                    index[key] = len(frames)
+                    frames.append({"name": key[1], "file": key[0], "line": key[2]})
+                ids.append(index[key])
+            samples.append(ids)
+            weights.append(round(count * self.interval * 1000, 3))
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": f"{self.method} {self.path}",
+            "exporter": "basegenspark-profiler",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": f"{self.method} {self.path} ({self.status})",
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights
+            }]
+        }
+
+    def to_collapsed(self) -> str:
+        lines = []
+        for stack, count in self.stacks.items():
+            names = ";".join(f"{name} ({filename.rsplit('/', 1)[-1]}:{line})" for filename, name, line in stack)
+            lines.append(f"{names} {count}")
+        return "\n".join(lines) + "\n"
+
+    def render(self, fmt: str) -> bytes:
+        if fmt == "collapsed":
+            return self.to_collapsed().encode("utf-8")
+        return json.dumps(self.to_speedscope()).encode("utf-8")
+
+
+class ProfileStore:
+    """Derniers profils en mémoire"""
+
+    def __init__(self, keep: int):
+        self._profiles: "deque[Profile]" = deque(maxlen=keep)
+        self._lock = threading.Lock()
+
+    def add(self, profile: Profile):
+        with self._lock:
+            self._profiles.append(profile)
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [profile.summary() for profile in reversed(self._profiles)]
+
+    def get(self, profile_id: str) -> Optional[Profile]:
+        with self._lock:
+            return next((profile for profile in self._profiles if profile.id == profile_id), None)
+
+
+class ProfilerMiddleware:
+    """Middleware ASGI : profile les requêtes demandées (en-tête) ou tirées au sort"""
+
+    def __init__(self, app, tokens: List[str], store: ProfileStore, sample_rate: float = 0.0,
+                 interval: float = 0.002, exempt_paths=()):
+        self.app = app
+        self.tokens = list(tokens)
+        self.store = store
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.exempt_paths = tuple(exempt_paths)
+
+    def _authorized(self, scope) -> bool:
+        provided = header_value(scope, b"x-agent-token")
+        if not provided:
+            provided = (parse_qs(scope.get("query_string", b"").decode("latin-1")).get("token") or [""])[0]
+        return bool(provided) and any(hmac.compare_digest(provided, token) for token in self.tokens)
+
+    async def _reply(self, send, status: int, body: bytes, content_type: str, extra_headers=()):
+        if content_type.startswith("text/"):
+            content_type += "; charset=utf-8"
+        headers = [(b"content-type", content_type.encode("latin-1")), (b"content-length", str(len(body)).encode("latin-1"))]
+        await send({"type": "http.response.start", "status": status, "headers": headers + list(extra_headers)})
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.exempt_paths):
+            await self.app(scope, receive, send)
+            return
+
+        fmt = header_value(scope, b"x-profile")
+        if fmt:
+            if fmt not in FORMATS:
+                await self._reply(send, 400, f"X-Profile : {', '.join(FORMATS)}".encode("utf-8"), "text/plain")
+                return
+            if not self._authorized(scope):
+                await self._reply(send, 401, "Profilage : token invalide ou manquant".encode("utf-8"), "text/plain")
+                return
+        elif not (self.sample_rate and random.random() < self.sample_rate):
+            await self.app(scope, receive, send)
+            return
+
+        profile = Profile(scope["method"], scope["path"], self.interval, "header" if fmt else "sampled")
+        status = None
+
+        async def profiled_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            if not fmt:
+                await send(message)
+
+        context_token = profile_var.set(profile)
+        profile.start()
+        try:
+            await self.app(scope, receive, profiled_send)
+        finally:
+            profile.stop(status)
+            profile_var.reset(context_token)
+            self.store.add(profile)
+            metrics.incr("profiles_total", trigger=profile.trigger)
+
+        if fmt:
+            content_type, suffix = FORMATS[fmt]
+            breakdown = ",".join(f"{name}={pct}%" for name, pct in profile.breakdown().items())
+            await self._reply(send, 200, profile.render(fmt), content_type, [
+                (b"content-disposition", f'attachment; filename="profile-{profile.id}.{suffix}"'.encode("latin-1")),
+                (b"x-profile-id", profile.id.encode("latin-1")),
+                (b"x-profiled-status", str(status).encode("latin-1")),
+                (b"x-profile-breakdown", breakdown.encode("latin-1"))
+            ])
+
+
+_MIDDLEWARE_CODE = ProfilerMiddleware.__call__.__code__
@@ -0,0 +1,253 @@
+"""
+Limitation de débit pour BaseGenspark API
+=========================================
+
+- Un seau à jetons par identité : token dédié à un agent (AGENT_TOKENS),
+  sinon token partagé + nom d'agent autorisé (X-Agent-Name), sinon « other »
+- Un seau à jetons par identité et par route
+- Un plafond de requêtes simultanées par identité
+
+Tout est vérifié en O(1) dans la boucle asyncio (pas de verrou).
+Les refus renvoient un 429 avec `Retry-After` et sont comptés
+dans les métriques.
+
+Les seaux sont locaux au processus : avec WEB_CONCURRENCY workers, les
+limites configurées (globales à l'instance) sont divisées entre les
+workers (`per_worker`). Le partage est approché : un client qui garde
+une seule connexion ouverte reste sur un worker et n'a droit qu'à sa part.
+"""
+
+import hashlib
+import math
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+from urllib.parse import parse_qs
+
+from fastapi.responses import JSONResponse
+
+import metrics
+
+# Label des appelants sans identité reconnue (nom absent ou hors liste)
+OTHER_AGENT = "other"
+ANONYMOUS = "anonymous"
+
+
+class TokenBucket:
+    """Seau à jetons : `rate` jetons/seconde, au plus `capacity` en réserve"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated_at")
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = now
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self) -> float:
+        """Secondes avant qu'un jeton soit disponible (0 s'il y en a un)"""
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """Seaux par identité / par route et compteurs de concurrence"""
+
+    def __init__(
+        self,
+        rate: float,
+        burst: float,
+        route_rate: float,
+        route_burst: float,
+        max_concurrency: int,
+        max_keys: int = 10000
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.route_rate = route_rate
+        self.route_burst = route_burst
+        self.max_concurrency = max_concurrency
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._in_flight = {}
+        # Un seau inactif depuis ce délai est de nouveau plein : l'oublier ne change rien
+        self.idle_seconds = max(burst / rate, route_burst / route_rate)
+
+    def _prune(self, now: float):
+        """Oublier les seaux inactifs (les plus anciens sont en tête)"""
+        while self._buckets:
+            key, bucket = next(iter(self._buckets.items()))
+            if now - bucket.updated_at < self.idle_seconds:
+                return
+            self._buckets.popitem(last=False)
+
+    def _bucket(self, key, rate: float, capacity: float, now: float) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            self._prune(now)
+            bucket = TokenBucket(rate, capacity, now)
+            self._buckets[key] = bucket
+            if len(self._buckets) > self.max_keys:
+                # Les seaux inactifs depuis le plus longtemps sont pleins : on peut les oublier
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket.refill(now)
+        return bucket
+
+    def check(self, identity: str, route: str, track_concurrency: bool = True) -> Tuple[Optional[str], float]:
+        """
+        Réserver une place pour une requête
+
+        Retourne (None, 0) si la requête passe, sinon (raison, retry_after).
+        Le seau de la route est vérifié avant celui de l'identité : une boucle
+        sur une seule route ne consomme pas le quota des autres routes.
+        """
+        now = time.monotonic()
+
+        route_bucket = self._bucket((identity, route), self.route_rate, self.route_burst, now)
+        wait = route_bucket.wait_time()
+        if wait:
+            return "route", wait
+
+        identity_bucket = self._bucket(identity, self.rate, self.burst, now)
+        wait = identity_bucket.wait_time()
+        if wait:
+            return "token", wait
+
+        if track_concurrency:
+            in_flight = self._in_flight.get(identity, 0)
+            if in_flight >= self.max_concurrency:
+                return "concurrency", 1.0
+            self._in_flight[identity] = in_flight + 1
+
+        route_bucket.tokens -= 1
+        identity_bucket.tokens -= 1
+        return None, 0.0
+
+    def release(self, identity: str):
+        in_flight = self._in_flight.get(identity, 0) - 1
+        if in_flight > 0:
+            self._in_flight[identity] = in_flight
+        else:
+            self._in_flight.pop(identity, None)
+
+    def in_flight(self, identity: str) -> int:
+        return self._in_flight.get(identity, 0)
+
+
+def per_worker(value: float, workers: int, minimum: float = 1) -> float:
+    """Part d'une limite globale revenant à un worker"""
+    return max(minimum, value / max(1, workers))
+
+
+def route_key(method: str, path: str) -> str:
+    """Normaliser un chemin : les segments contenant un chiffre sont des identifiants"""
+    segments = [
+        "{id}" if any(char.isdigit() for char in segment) else segment
+        for segment in path.split("/")
+    ]
+    return f"{method} {'/'.join(segments)}"
+
+
+def header_value(scope, name: bytes) -> Optional[str]:
+    for key, value in scope.get("headers", []):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def parse_agent_tokens(raw: str) -> Dict[str, str]:
+    """'PHOTOMENTOR=tok1,COACH_RH=tok2' → {token: nom d'agent}"""
+    tokens = {}
+    for item in raw.split(","):
+        name, _, token = item.strip().partition("=")
+        if name and token:
+            tokens[token.strip()] = name.strip().upper()
+    return tokens
+
+
+def request_identity(
+    scope,
+    agent_tokens: Optional[Dict[str, str]] = None,
+    agent_names: Iterable[str] = ()
+) -> Tuple[str, str]:
+    """
+    Identité de l'appelant : (clé interne, label pour les métriques)
+
+    - token dédié (AGENT_TOKENS) → l'agent de ce token, quel que soit X-Agent-Name
+    - autre token → X-Agent-Name s'il fait partie des noms autorisés, sinon « other »
+    - sans token → « anonymous » (une clé par adresse IP)
+
+    Les labels restent en nombre fini (noms configurés + other + anonymous).
+    """
+    token = header_value(scope, b"x-agent-token")
+    if not token:
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        token = query.get("token", [None])[0]
+
+    if token:
+        if agent_tokens and token in agent_tokens:
+            name = agent_tokens[token]
+            return f"agent:{name}", name
+        fingerprint = hashlib.sha256(token.encode()).hexdigest()[:8]
+        agent_name = (header_value(scope, b"x-agent-name") or "").upper()
+        label = agent_name if agent_name in agent_names else OTHER_AGENT
+        return f"token:{fingerprint}:{label}", label
+
+    client = scope.get("client") or ("inconnu", 0)
+    return f"ip:{client[0]}", ANONYMOUS
+
+
+class RateLimitMiddleware:
+    """Middleware ASGI appliquant le RateLimiter avant le routage"""
+
+    def __init__(self, app, limiter: RateLimiter, agent_tokens: Optional[Dict[str, str]] = None,
+                 agent_names: Iterable[str] = (), exempt_paths=(), stream_paths=()):
+        self.app = app
+        self.limiter = limiter
+        self.agent_tokens = agent_tokens or {}
+        self.agent_names = {name.upper() for name in agent_names} | set(self.agent_tokens.values())
+        self.exempt_paths = set(exempt_paths)
+        self.stream_paths = set(stream_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exempt_paths or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        identity, label = request_identity(scope, self.agent_tokens, self.agent_names)
+        route = route_key(scope["method"], scope["path"])
+        # Les flux longs (SSE) ne doivent pas occuper une place de concurrence
+        track_concurrency = scope["path"] not in self.stream_paths
+
+        reason, retry_after = self.limiter.check(identity, route, track_concurrency)
+        if reason:
+            metrics.incr("rate_limit_rejected_total", reason=reason, agent=label)
+            response = JSONResponse(
+                status_code=429,
+                content={"detail": "Trop de requêtes, réessayez plus tard"},
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+            )
+            await response(scope, receive, send)
+            return
+
+        if not track_concurrency:
+            await self.app(scope, receive, send)
+            return
+
+        metrics.set_gauge("agent_in_flight", self.limiter.in_flight(identity), agent=label)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.limiter.release(identity)
+            in_flight = self.limiter.in_flight(identity)
+            if in_flight:
+                metrics.set_gauge("agent_in_flight", in_flight, agent=label)
+            else:
+                metrics.remove_gauge("agent_in_flight", agent=label)
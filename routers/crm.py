@@ -9,30 +9,261 @@ Routes pour gérer:
 - Stats et alertes
 """
 
-from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
 from pydantic import BaseModel, Field, EmailStr
 from typing import Optional, List, Dict, Any
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
+from bisect import bisect_left, insort
+from collections import OrderedDict
+import threading
+import time
 import httpx
 import os
+from uuid import uuid4
+
+import metrics
+import shared_cache
+import snapshots
+from structured_log import get_logger
+from supabase_client import SUPABASE_PAGE_SIZE, supabase
 
 # ========================================
 # CONFIGURATION
 # ========================================
 
-SUPABASE_URL = os.getenv("SUPABASE_URL", "https://iepvmuzfdkklysnqbvwt.supabase.co")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY", "")
+# Index des relances (/crm/alertes)
+CRM_ALERTES_REFRESH_HOURS = float(os.getenv("CRM_ALERTES_REFRESH_HOURS", "24"))
+CRM_ALERTES_PRECOMPUTE = os.getenv("CRM_ALERTES_PRECOMPUTE", "false").lower() == "true"
+STATUTS_CLOS = ("Gagné", "Perdu")
 
-# Client HTTP
-httpx_client = httpx.Client(timeout=30.0)
+logger = get_logger("crm")
 
-# Headers Supabase
-def get_supabase_headers():
-    return {
-        "apikey": SUPABASE_KEY,
-        "Authorization": f"Bearer {SUPABASE_KEY}",
-        "Content-Type": "application/json"
-    }
+# Instantanés des tableaux de bord (voir snapshots.py) : cadence de rafraîchissement
+# Le pipeline est en plus périmé par les écritures d'opportunités
+PIPELINE_CACHE_TTL = float(os.getenv("PIPELINE_CACHE_TTL", "60"))
+CRM_STATS_SNAPSHOT_SECONDS = float(os.getenv("CRM_STATS_SNAPSHOT_SECONDS", "300"))
+
+# Fiches prospect assemblées (/crm/prospects/{id}) : LRU avec TTL
+CRM_PROSPECT_CACHE_SIZE = int(os.getenv("CRM_PROSPECT_CACHE_SIZE", "500"))
+CRM_PROSPECT_CACHE_TTL = float(os.getenv("CRM_PROSPECT_CACHE_TTL", "120"))
+
+# ========================================
+# INDEX DES RELANCES
+# ========================================
+
+class AlerteIndex:
+    """
+    Prospects ouverts triés par date_prochaine_action
+
+    Chargé une fois depuis Supabase puis tenu à jour par les routes
+    de création / modification de prospects. Rechargé entièrement
+    quand il dépasse `max_age_hours` (modifications faites hors API).
+    """
+
+    def __init__(self, max_age_hours: float = 24):
+        self.max_age_seconds = max_age_hours * 3600
+        self.loaded_at: Optional[datetime] = None
+        self._loaded_monotonic = 0.0
+        self._entries = []
+        self._prospects = {}
+        self._lock = threading.Lock()
+
+    def is_stale(self) -> bool:
+        return self.loaded_at is None or time.monotonic() - self._loaded_monotonic > self.max_age_seconds
+
+    def load(self):
+        """Recharger tous les prospects ouverts ayant une prochaine action"""
+        rows = []
+        offset = 0
+        while True:
+            query = (
+                supabase.query("crm_prospects")
+                .not_is("date_prochaine_action", None)
+                .not_in("statut", STATUTS_CLOS)
+                .select("id,entreprise,prochaine_action,date_prochaine_action,statut")
+                .order("id.asc")
+                .limit(SUPABASE_PAGE_SIZE)
+                .offset(offset)
+            )
+            response = supabase.get(query)
+            response.raise_for_status()
+            page = response.json()
+            rows.extend(page)
+            if len(page) < SUPABASE_PAGE_SIZE:
+                break
+            offset += SUPABASE_PAGE_SIZE
+
+        prospects = {}
+        for row in rows:
+            entry = self._make_entry(row)
+            if entry:
+                prospects[row["id"]] = entry
+        entries = sorted((entry[0], prospect_id) for prospect_id, entry in prospects.items())
+
+        with self._lock:
+            self._prospects = prospects
+            self._entries = entries
+            self.loaded_at = datetime.utcnow()
+            self._loaded_monotonic = time.monotonic()
+
+    def ensure_fresh(self):
+        if self.is_stale():
+            self.load()
+
+    def mark_stale(self):
+        """Un autre worker a modifié des prospects : rechargement au prochain accès"""
+        self.loaded_at = None
+
+    @staticmethod
+    def _make_entry(prospect: Dict[str, Any]):
+        raw_date = prospect.get("date_prochaine_action")
+        if not raw_date or prospect.get("statut") in STATUTS_CLOS:
+            return None
+        action_date = raw_date if isinstance(raw_date, date) else date.fromisoformat(str(raw_date)[:10])
+        return (action_date, {
+            "prospect_id": prospect["id"],
+            "entreprise": prospect.get("entreprise"),
+            "prochaine_action": prospect.get("prochaine_action"),
+            "date_prochaine_action": action_date.isoformat()
+        })
+
+    def upsert(self, prospect: Dict[str, Any]):
+        """Appliquer la représentation renvoyée par Supabase après écriture"""
+        if self.loaded_at is None or "id" not in prospect:
+            return
+        with self._lock:
+            previous = self._prospects.get(prospect["id"])
+            merged = {**previous[1], **prospect} if previous else prospect
+            if previous:
+                self._entries.remove((previous[0], prospect["id"]))
+                del self._prospects[prospect["id"]]
+            entry = self._make_entry(merged)
+            if entry:
+                self._prospects[prospect["id"]] = entry
+                insort(self._entries, (entry[0], prospect["id"]))
+
+    def buckets(self, today: date, jours: int):
+        """Découper l'index en (retard, aujourd'hui, à venir sous `jours` jours)"""
+        with self._lock:
+            entries = self._entries
+            start_today = bisect_left(entries, (today,))
+            start_tomorrow = bisect_left(entries, (today + timedelta(days=1),))
+            end_upcoming = bisect_left(entries, (today + timedelta(days=jours + 1),))
+            return tuple(
+                [(action_date, self._prospects[prospect_id][1]) for action_date, prospect_id in chunk]
+                for chunk in (
+                    entries[:start_today],
+                    entries[start_today:start_tomorrow],
+                    entries[start_tomorrow:end_upcoming]
+                )
+            )
+
+
+alerte_index = AlerteIndex(max_age_hours=CRM_ALERTES_REFRESH_HOURS)
+shared_cache.cache.on_invalidate("crm_prospects", alerte_index.mark_stale)
+
+
+def _alertes_precompute_loop():
+    """Recalcul périodique de l'index (tâche de fond optionnelle)"""
+    while True:
+        try:
+            alerte_index.load()
+        except Exception as e:
+            logger.warning("Recalcul index relances impossible", extra={"error": str(e)})
+        time.sleep(CRM_ALERTES_REFRESH_HOURS * 3600)
+
+# ========================================
+# CACHE DES FICHES PROSPECT
+# ========================================
+
+class ProspectDetailCache:
+    """
+    Fiches prospect assemblées (prospect + opportunités, interactions, RDV)
+
+    Un seul worker : LRU en mémoire borné à `max_size`. Plusieurs workers :
+    cache partagé, pour qu'une écriture passée par un autre worker retire
+    bien la fiche. Les écritures retirent la fiche du prospect concerné,
+    le TTL couvre les modifications faites hors API.
+
+    La génération est capturée avant de lire Supabase et passée à `put` :
+    une fiche lue avant une écriture concurrente n'est pas mise en cache.
+    En partagé, génération par prospect (la clé de la fiche en dépend) ; en
+    mémoire, compteur global des retraits.
+    """
+
+    NAMESPACE = "crm_prospect_detail"
+    GENERATIONS = "crm_prospect_generation"
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._local: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _record(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+            ratio = self.hits / (self.hits + self.misses)
+        metrics.incr("crm_prospect_cache_total", result="hit" if hit else "miss")
+        metrics.set_gauge("crm_prospect_cache_hit_ratio", round(ratio, 4))
+
+    def generation(self, prospect_id: str) -> Any:
+        if shared_cache.cache.shared:
+            return shared_cache.cache.get(self.GENERATIONS, str(prospect_id), 0)
+        with self._lock:
+            return self._generation
+
+    def get(self, prospect_id: str, generation: Any) -> Optional[Dict[str, Any]]:
+        if shared_cache.cache.shared:
+            detail = shared_cache.cache.get(self.NAMESPACE, f"{prospect_id}:{generation}")
+        else:
+            with self._lock:
+                entry = self._local.get(prospect_id)
+                if entry and entry[0] < time.monotonic():
+                    del self._local[prospect_id]
+                    entry = None
+                if entry:
+                    self._local.move_to_end(prospect_id)
+                detail = entry[1] if entry else None
+        self._record(detail is not None)
+        return detail
+
+    def put(self, prospect_id: str, detail: Dict[str, Any], generation: Any):
+        if shared_cache.cache.shared:
+            # Retrait entre-temps : la fiche atterrit sous une clé qui ne sera plus lue
+            shared_cache.cache.set(self.NAMESPACE, f"{prospect_id}:{generation}", detail, ttl=self.ttl)
+            return
+        with self._lock:
+            if generation != self._generation:
+                metrics.incr("crm_prospect_cache_stale_puts_total")
+                return
+            self._local[prospect_id] = (time.monotonic() + self.ttl, detail)
+            self._local.move_to_end(prospect_id)
+            while len(self._local) > self.max_size:
+                self._local.popitem(last=False)
+            metrics.set_gauge("crm_prospect_cache_size", len(self._local))
+
+    def remove(self, prospect_id: Optional[str]):
+        if not prospect_id:
+            return
+        metrics.incr("crm_prospect_cache_invalidations_total")
+        if shared_cache.cache.shared:
+            # Survit aux fiches de l'ancienne génération (TTL double)
+            shared_cache.cache.set(self.GENERATIONS, str(prospect_id), uuid4().hex, ttl=self.ttl * 2)
+            return
+        with self._lock:
+            self._generation += 1
+            self._local.pop(str(prospect_id), None)
+            metrics.set_gauge("crm_prospect_cache_size", len(self._local))
+
+
+prospect_details = ProspectDetailCache(CRM_PROSPECT_CACHE_SIZE, CRM_PROSPECT_CACHE_TTL)
 
 # ========================================
 # ROUTER
@@ -44,6 +275,11 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
+def start_alertes_precompute():
+    """Appelé au démarrage de l'application (lifespan) ou au chargement différé du router"""
+    if CRM_ALERTES_PRECOMPUTE:
+        threading.Thread(target=_alertes_precompute_loop, name="crm-alertes", daemon=True).start()
+
 # ========================================
 # MODÈLES DE DONNÉES
 # ========================================
@@ -120,7 +356,7 @@ class OpportuniteUpdate(BaseModel):
 # ========================================
 
 @router.get("/prospects")
-async def list_prospects(
+def list_prospects(
     statut: Optional[str] = Query(None, description="Filtrer par statut"),
     limit: int = Query(100, ge=1, le=500)
 ):
@@ -128,13 +364,12 @@ async def list_prospects(
     Liste tous les prospects actifs
     """
     try:
-        url = f"{SUPABASE_URL}/rest/v1/crm_v_prospects_actifs"
-        params = {"limit": limit}
+        query = supabase.query("crm_v_prospects_actifs").limit(limit)
         
         if statut:
-            params["statut"] = f"eq.{statut}"
+            query.eq("statut", statut)
         
-        response = httpx_client.get(url, headers=get_supabase_headers(), params=params)
+        response = supabase.get(query)
         response.raise_for_status()
         data = response.json()
         
@@ -148,17 +383,16 @@ async def list_prospects(
         raise HTTPException(status_code=500, detail=f"Erreur Supabase: {str(e)}")
 
 @router.get("/prospects/search")
-async def search_prospects(
+def search_prospects(
     q: str = Query(..., description="Terme de recherche")
 ):
     """
     Recherche fulltext dans les prospects
     """
     try:
-        url = f"{SUPABASE_URL}/rest/v1/rpc/crm_search_prospects"
         payload = {"query_text": q}
         
-        response = httpx_client.post(url, headers=get_supabase_headers(), json=payload)
+        response = supabase.rpc("crm_search_prospects", payload)
         response.raise_for_status()
         data = response.json()
         
@@ -172,16 +406,21 @@ async def search_prospects(
         raise HTTPException(status_code=500, detail=f"Erreur Supabase: {str(e)}")
 
 @router.get("/prospects/{prospect_id}")
-async def get_prospect(prospect_id: str):
+def get_prospect(prospect_id: str):
     """
     Détails complets d'un prospect (avec opportunités, interactions, RDV)
     """
     try:
-        # Récupérer le prospect
-        url_prospect = f"{SUPABASE_URL}/rest/v1/crm_prospects"
-        params = {"id": f"eq.{prospect_id}"}
+        generation = prospect_details.generation(prospect_id)
+        cached = prospect_details.get(prospect_id, generation)
+        if cached is not None:
+            return {
+                "success": True,
+                "prospect": cached
+            }
         
-        response = httpx_client.get(url_prospect, headers=get_supabase_headers(), params=params)
+        # Récupérer le prospect
+        response = supabase.get(supabase.query("crm_prospects").eq("id", prospect_id))
         response.raise_for_status()
         prospects = response.json()
         
@@ -191,88 +430,89 @@ async def get_prospect(prospect_id: str):
         prospect = prospects[0]
         
         # Récupérer les opportunités
-        url_opps = f"{SUPABASE_URL}/rest/v1/crm_opportunites"
-        params_opps = {"prospect_id": f"eq.{prospect_id}"}
-        response_opps = httpx_client.get(url_opps, headers=get_supabase_headers(), params=params_opps)
+        response_opps = supabase.get(supabase.query("crm_opportunites").eq("prospect_id", prospect_id))
         opportunites = response_opps.json() if response_opps.status_code == 200 else []
         
         # Récupérer les interactions
-        url_inter = f"{SUPABASE_URL}/rest/v1/crm_interactions"
-        params_inter = {"prospect_id": f"eq.{prospect_id}", "limit": "10"}
-        response_inter = httpx_client.get(url_inter, headers=get_supabase_headers(), params=params_inter)
+        response_inter = supabase.get(supabase.query("crm_interactions").eq("prospect_id", prospect_id).limit(10))
         interactions = response_inter.json() if response_inter.status_code == 200 else []
         
         # Récupérer les RDV
-        url_rdv = f"{SUPABASE_URL}/rest/v1/crm_rendez_vous"
-        params_rdv = {"prospect_id": f"eq.{prospect_id}"}
-        response_rdv = httpx_client.get(url_rdv, headers=get_supabase_headers(), params=params_rdv)
+        response_rdv = supabase.get(supabase.query("crm_rendez_vous").eq("prospect_id", prospect_id))
         rendez_vous = response_rdv.json() if response_rdv.status_code == 200 else []
         
+        detail = {
+            **prospect,
+            "opportunites": opportunites,
+            "interactions": interactions,
+            "rendez_vous": rendez_vous
+        }
+        # Fiche partielle (une sous-requête en échec) : servie mais pas mise en cache
+        if all(r.status_code == 200 for r in (response_opps, response_inter, response_rdv)):
+            prospect_details.put(prospect_id, detail, generation)
+        
         return {
             "success": True,
-            "prospect": {
-                **prospect,
-                "opportunites": opportunites,
-                "interactions": interactions,
-                "rendez_vous": rendez_vous
-            }
+            "prospect": detail
         }
     
     except httpx.HTTPError as e:
         raise HTTPException(status_code=500, detail=f"Erreur Supabase: {str(e)}")
 
 @router.post("/prospects", status_code=201)
-async def create_prospect(prospect: ProspectCreate):
+def create_prospect(prospect: ProspectCreate):
     """
     Créer un nouveau prospect
     """
     try:
-        url = f"{SUPABASE_URL}/rest/v1/crm_prospects"
-        headers = {**get_supabase_headers(), "Prefer": "return=representation"}
-        
         payload = prospect.dict(exclude_none=True)
         payload["date_dernier_echange"] = str(date.today())
         
-        response = httpx_client.post(url, headers=headers, json=payload)
+        response = supabase.insert("crm_prospects", payload)
         response.raise_for_status()
         data = response.json()
+        created = data[0] if isinstance(data, list) else data
+        
+        alerte_index.upsert(created)
+        shared_cache.cache.invalidate("crm_prospects", notify_self=False)
         
         return {
             "success": True,
             "message": "Prospect créé avec succès",
-            "prospect": data[0] if isinstance(data, list) else data
+            "prospect": created
         }
     
     except httpx.HTTPError as e:
         raise HTTPException(status_code=500, detail=f"Erreur Supabase: {str(e)}")
 
 @router.patch("/prospects/{prospect_id}")
-async def update_prospect(prospect_id: str, updates: ProspectUpdate):
+def update_prospect(prospect_id: str, updates: ProspectUpdate):
     """
     Modifier un prospect
     """
     try:
-        url = f"{SUPABASE_URL}/rest/v1/crm_prospects"
-        params = {"id": f"eq.{prospect_id}"}
-        headers = {**get_supabase_headers(), "Prefer": "return=representation"}
-        
         payload = updates.dict(exclude_none=True)
         
         # Mise à jour automatique de date_dernier_echange si statut change
         if "statut" in payload:
             payload["date_dernier_echange"] = str(date.today())
         
-        response = httpx_client.patch(url, headers=headers, params=params, json=payload)
+        response = supabase.update(supabase.query("crm_prospects").eq("id", prospect_id), payload, returning=True)
         response.raise_for_status()
         data = response.json()
         
         if not data:
             raise HTTPException(status_code=404, detail="Prospect non trouvé")
         
+        updated = data[0] if isinstance(data, list) else data
+        alerte_index.upsert(updated)
+        shared_cache.cache.invalidate("crm_prospects", notify_self=False)
+        prospect_details.remove(prospect_id)
+        
         return {
             "success": True,
             "message": "Prospect mis à jour",
-            "prospect": data[0] if isinstance(data, list) else data
+            "prospect": updated
         }
     
     except httpx.HTTPError as e:
@@ -283,20 +523,19 @@ async def update_prospect(prospect_id: str, updates: ProspectUpdate):
 # ========================================
 
 @router.get("/opportunites")
-async def list_opportunites(
+def list_opportunites(
     statut: Optional[str] = Query(None, description="Filtrer par statut")
 ):
     """
     Liste toutes les opportunités
     """
     try:
-        url = f"{SUPABASE_URL}/rest/v1/crm_v_pipeline_opportunites"
-        params = {}
+        query = supabase.query("crm_v_pipeline_opportunites")
         
         if statut:
-            params["statut"] = f"eq.{statut}"
+            query.eq("statut", statut)
         
-        response = httpx_client.get(url, headers=get_supabase_headers(), params=params)
+        response = supabase.get(query)
         response.raise_for_status()
         data = response.json()
         
@@ -309,63 +548,80 @@ async def list_opportunites(
     except httpx.HTTPError as e:
         raise HTTPException(status_code=500, detail=f"Erreur Supabase: {str(e)}")
 
-@router.get("/pipeline")
-async def get_pipeline():
-    """
-    Vue pipeline avec stats
-    """
-    try:
-        url = f"{SUPABASE_URL}/rest/v1/crm_v_pipeline_opportunites"
-        
-        response = httpx_client.get(url, headers=get_supabase_headers())
-        response.raise_for_status()
-        opportunites = response.json()
-        
-        # Calculer les stats
-        valeur_totale = sum(o.get("montant_ht", 0) for o in opportunites)
-        valeur_ponderee = sum(o.get("valeur_ponderee", 0) for o in opportunites)
-        taux_moyen = round(sum(o.get("probabilite_closing", 0) for o in opportunites) / len(opportunites)) if opportunites else 0
-        
-        # Grouper par statut
-        par_statut = {}
-        for opp in opportunites:
+def _compute_pipeline() -> Dict[str, Any]:
+    """Agréger le pipeline depuis la vue Supabase"""
+    opportunites = []
+    valeur_totale = 0
+    valeur_ponderee = 0
+    probabilites = 0
+    par_statut = {}
+    
+    # Stats calculées au fil de la lecture (une seule passe, pas de corps complet en mémoire)
+    with supabase.stream(supabase.query("crm_v_pipeline_opportunites")) as rows:
+        rows.response.raise_for_status()
+        for opp in rows:
+            opportunites.append(opp)
+            valeur_totale += opp.get("montant_ht", 0)
+            valeur_ponderee += opp.get("valeur_ponderee", 0)
+            probabilites += opp.get("probabilite_closing", 0)
+            
+            # Grouper par statut
             statut = opp.get("statut", "Non défini")
             if statut not in par_statut:
                 par_statut[statut] = {"count": 0, "valeur": 0, "valeur_ponderee": 0}
             par_statut[statut]["count"] += 1
             par_statut[statut]["valeur"] += opp.get("montant_ht", 0)
             par_statut[statut]["valeur_ponderee"] += opp.get("valeur_ponderee", 0)
+    
+    taux_moyen = round(probabilites / len(opportunites)) if opportunites else 0
+    
+    return {
+        "total_opportunites": len(opportunites),
+        "valeur_totale": valeur_totale,
+        "valeur_ponderee": valeur_ponderee,
+        "taux_conversion_moyen": taux_moyen,
+        "par_statut": par_statut,
+        "opportunites": opportunites
+    }
+
+snapshots.scheduler.register("crm_pipeline", _compute_pipeline, PIPELINE_CACHE_TTL, namespace="crm_pipeline")
+
+@router.get("/pipeline")
+def get_pipeline(
+    response: Response,
+    fresh: bool = Query(False, description="Recalculer au lieu de servir l'instantané")
+):
+    """
+    Vue pipeline avec stats
+    """
+    try:
+        snapshot = snapshots.scheduler.get("crm_pipeline", fresh=fresh)
+        snapshots.set_age_header(response, snapshot)
         
         return {
             "success": True,
-            "pipeline": {
-                "total_opportunites": len(opportunites),
-                "valeur_totale": valeur_totale,
-                "valeur_ponderee": valeur_ponderee,
-                "taux_conversion_moyen": taux_moyen,
-                "par_statut": par_statut,
-                "opportunites": opportunites
-            }
+            "pipeline": snapshot["data"],
+            **snapshots.metadata(snapshot)
         }
     
     except httpx.HTTPError as e:
         raise HTTPException(status_code=500, detail=f"Erreur Supabase: {str(e)}")
 
 @router.post("/opportunites", status_code=201)
-async def create_opportunite(opportunite: OpportuniteCreate):
+def create_opportunite(opportunite: OpportuniteCreate):
     """
     Créer une opportunité
     """
     try:
-        url = f"{SUPABASE_URL}/rest/v1/crm_opportunites"
-        headers = {**get_supabase_headers(), "Prefer": "return=representation"}
-        
         payload = opportunite.dict(exclude_none=True)
         
-        response = httpx_client.post(url, headers=headers, json=payload)
+        response = supabase.insert("crm_opportunites", payload)
         response.raise_for_status()
         data = response.json()
         
+        shared_cache.cache.invalidate("crm_pipeline")
+        prospect_details.remove(payload.get("prospect_id"))
+        
         return {
             "success": True,
             "message": "Opportunité créée",
@@ -376,28 +632,28 @@ async def create_opportunite(opportunite: OpportuniteCreate):
         raise HTTPException(status_code=500, detail=f"Erreur Supabase: {str(e)}")
 
 @router.patch("/opportunites/{opportunite_id}")
-async def update_opportunite(opportunite_id: str, updates: OpportuniteUpdate):
+def update_opportunite(opportunite_id: str, updates: OpportuniteUpdate):
     """
     Modifier une opportunité
     """
     try:
-        url = f"{SUPABASE_URL}/rest/v1/crm_opportunites"
-        params = {"id": f"eq.{opportunite_id}"}
-        headers = {**get_supabase_headers(), "Prefer": "return=representation"}
-        
         payload = updates.dict(exclude_none=True)
         
-        response = httpx_client.patch(url, headers=headers, params=params, json=payload)
+        response = supabase.update(supabase.query("crm_opportunites").eq("id", opportunite_id), payload, returning=True)
         response.raise_for_status()
         data = response.json()
         
         if not data:
             raise HTTPException(status_code=404, detail="Opportunité non trouvée")
         
+        shared_cache.cache.invalidate("crm_pipeline")
+        updated = data[0] if isinstance(data, list) else data
+        prospect_details.remove(updated.get("prospect_id"))
+        
         return {
             "success": True,
             "message": "Opportunité mise à jour",
-            "opportunite": data[0] if isinstance(data, list) else data
+            "opportunite": updated
         }
     
     except httpx.HTTPError as e:
@@ -407,89 +663,116 @@ async def update_opportunite(opportunite_id: str, updates: OpportuniteUpdate):
 # ROUTES STATS
 # ========================================
 
+def _compute_stats() -> Dict[str, Any]:
+    """Tableau de bord depuis les vues et tables CRM"""
+    # Stats depuis la vue
+    response_tableau = supabase.get(supabase.query("crm_v_tableau_bord"))
+    response_tableau.raise_for_status()
+    tableau = response_tableau.json()[0] if response_tableau.json() else {}
+
+    # Compter prospects (lecture en flux : seules les lignes en cours sont en mémoire)
+    total_prospects = 0
+    with supabase.stream(supabase.query("crm_prospects").select("id")) as prospects:
+        if prospects.status_code == 200:
+            total_prospects = sum(1 for _ in prospects)
+
+    # Stats opportunités
+    total_opportunites = 0
+    valeur_totale = 0
+    valeur_ponderee = 0
+    en_cours = 0
+    with supabase.stream(supabase.query("crm_opportunites").select("montant_ht,probabilite_closing,statut")) as opportunites:
+        if opportunites.status_code == 200:
+            for o in opportunites:
+                total_opportunites += 1
+                valeur_totale += o.get("montant_ht", 0)
+                valeur_ponderee += o.get("montant_ht", 0) * o.get("probabilite_closing", 0) / 100
+                if o.get("statut") not in ["Gagné", "Perdu"]:
+                    en_cours += 1
+
+    return {
+        "prospects": {
+            "total": total_prospects,
+            **tableau
+        },
+        "opportunites": {
+            "total": total_opportunites,
+            "en_cours": en_cours,
+            "valeur_totale": valeur_totale,
+            "valeur_ponderee": valeur_ponderee
+        },
+        "alertes": {
+            "relances_urgentes": tableau.get("nb_relances_urgentes", 0)
+        }
+    }
+
+snapshots.scheduler.register("crm_stats", _compute_stats, CRM_STATS_SNAPSHOT_SECONDS)
+
 @router.get("/stats")
-async def get_stats():
+def get_stats(
+    response: Response,
+    fresh: bool = Query(False, description="Recalculer au lieu de servir l'instantané")
+):
     """
     Tableau de bord global
     """
     try:
-        # Stats depuis la vue
-        url_tableau = f"{SUPABASE_URL}/rest/v1/crm_v_tableau_bord"
-        response_tableau = httpx_client.get(url_tableau, headers=get_supabase_headers())
-        response_tableau.raise_for_status()
-        tableau = response_tableau.json()[0] if response_tableau.json() else {}
-        
-        # Compter prospects
-        url_prospects = f"{SUPABASE_URL}/rest/v1/crm_prospects?select=id"
-        response_prospects = httpx_client.get(url_prospects, headers=get_supabase_headers())
-        total_prospects = len(response_prospects.json()) if response_prospects.status_code == 200 else 0
-        
-        # Stats opportunités
-        url_opps = f"{SUPABASE_URL}/rest/v1/crm_opportunites?select=montant_ht,probabilite_closing,statut"
-        response_opps = httpx_client.get(url_opps, headers=get_supabase_headers())
-        opportunites = response_opps.json() if response_opps.status_code == 200 else []
-        
-        valeur_totale = sum(o.get("montant_ht", 0) for o in opportunites)
-        valeur_ponderee = sum(o.get("montant_ht", 0) * o.get("probabilite_closing", 0) / 100 for o in opportunites)
-        en_cours = len([o for o in opportunites if o.get("statut") not in ["Gagné", "Perdu"]])
+        snapshot = snapshots.scheduler.get("crm_stats", fresh=fresh)
+        snapshots.set_age_header(response, snapshot)
         
         return {
             "success": True,
-            "stats": {
-                "prospects": {
-                    "total": total_prospects,
-                    **tableau
-                },
-                "opportunites": {
-                    "total": len(opportunites),
-                    "en_cours": en_cours,
-                    "valeur_totale": valeur_totale,
-                    "valeur_ponderee": valeur_ponderee
-                },
-                "alertes": {
-                    "relances_urgentes": tableau.get("nb_relances_urgentes", 0)
-                }
-            }
+            "stats": snapshot["data"],
+            **snapshots.metadata(snapshot)
         }
     
     except httpx.HTTPError as e:
         raise HTTPException(status_code=500, detail=f"Erreur Supabase: {str(e)}")
 
 @router.get("/alertes")
-async def get_alertes():
+def get_alertes(
+    jours: int = Query(7, ge=0, le=90, description="Horizon des actions à venir (jours)")
+):
     """
-    Prospects à relancer
+    Prospects à relancer (en retard, du jour, à venir)
+    
+    Servi depuis l'index en mémoire des prochaines actions
     """
     try:
-        today = str(date.today())
-        
-        # Actions en retard
-        url_retard = f"{SUPABASE_URL}/rest/v1/crm_prospects"
-        params_retard = {
-            "date_prochaine_action": f"lt.{today}",
-            "statut": f"not.in.(Gagné,Perdu)",
-            "select": "id,entreprise,prochaine_action,date_prochaine_action"
-        }
-        response_retard = httpx_client.get(url_retard, headers=get_supabase_headers(), params=params_retard)
-        actions_retard = response_retard.json() if response_retard.status_code == 200 else []
+        shared_cache.cache.poll()
+        alerte_index.ensure_fresh()
+        today = date.today()
         
-        alertes = []
-        for p in actions_retard:
-            jours_retard = (date.today() - datetime.strptime(p["date_prochaine_action"], "%Y-%m-%d").date()).days
-            alertes.append({
+        retard, aujourd_hui, a_venir = alerte_index.buckets(today, jours)
+        
+        alertes = [
+            {
                 "type": "Action en retard",
-                "prospect_id": p["id"],
-                "entreprise": p["entreprise"],
-                "prochaine_action": p["prochaine_action"],
-                "date_prochaine_action": p["date_prochaine_action"],
-                "jours_retard": jours_retard,
+                **infos,
+                "jours_retard": (today - action_date).days,
                 "priorite": "Haute"
-            })
+            }
+            for action_date, infos in retard
+        ]
         
         return {
             "success": True,
             "count": len(alertes),
-            "alertes": alertes
+            "alertes": alertes,
+            "aujourd_hui": [
+                {"type": "Action du jour", **infos, "priorite": "Moyenne"}
+                for _, infos in aujourd_hui
+            ],
+            "a_venir": [
+                {
+                    "type": "Action à venir",
+                    **infos,
+                    "jours_restants": (action_date - today).days,
+                    "priorite": "Normale"
+                }
+                for action_date, infos in a_venir
+            ],
+            "index_charge_le": alerte_index.loaded_at.isoformat()
         }
     
     except httpx.HTTPError as e:
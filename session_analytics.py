@@ -0,0 +1,133 @@
+"""
+Statistiques des sessions agents pour BaseGenspark API
+======================================================
+
+`user_activity` est parcourue page par page (pagination par id) et chaque
+page est versée dans des agrégateurs de taille fixe, puis oubliée : la
+mémoire ne dépend pas du nombre de sessions.
+
+Par agent, par établissement et au global :
+- nombre de sessions par statut et taux de complétion
+- durée moyenne et percentiles de `duration_minutes` (histogramme à la minute)
+- histogramme des scores par tranches de 10 points
+"""
+
+from array import array
+from typing import Any, Dict, Iterator, List, Optional
+
+from supabase_client import SUPABASE_PAGE_SIZE, supabase
+
+COLUMNS = "id,agent_name,status,duration_minutes,score,students(institution)"
+# Durées au-delà (en minutes) regroupées dans le dernier seau
+DURATION_MAX_MINUTES = 24 * 60
+PERCENTILES = (50, 75, 90, 95, 99)
+SCORE_BINS = 10
+
+
+class SessionStats:
+    """Agrégateur de taille fixe pour un groupe de sessions"""
+
+    __slots__ = ("total", "by_status", "durations", "duration_sum", "duration_count", "scores", "score_sum", "score_count")
+
+    def __init__(self):
+        self.total = 0
+        self.by_status: Dict[str, int] = {}
+        self.durations = array("q", [0]) * (DURATION_MAX_MINUTES + 1)
+        self.duration_sum = 0.0
+        self.duration_count = 0
+        self.scores = array("q", [0]) * SCORE_BINS
+        self.score_sum = 0.0
+        self.score_count = 0
+
+    def add(self, status: Optional[str], duration: Optional[float], score: Optional[float]):
+        self.total += 1
+        status = status or "inconnu"
+        self.by_status[status] = self.by_status.get(status, 0) + 1
+        if duration is not None and duration >= 0:
+            self.durations[min(int(duration), DURATION_MAX_MINUTES)] += 1
+            self.duration_sum += duration
+            self.duration_count += 1
+        if score is not None:
+            self.scores[min(max(int(score // SCORE_BINS), 0), SCORE_BINS - 1)] += 1
+            self.score_sum += score
+            self.score_count += 1
+
+    def percentiles(self) -> Dict[str, Optional[int]]:
+        result: Dict[str, Optional[int]] = {f"p{p}": None for p in PERCENTILES}
+        if not self.duration_count:
+            return result
+        targets = [(p, p / 100 * self.duration_count) for p in PERCENTILES]
+        seen = 0
+        index = 0
+        for minutes, count in enumerate(self.durations):
+            seen += count
+            while index < len(targets) and seen >= targets[index][1]:
+                result[f"p{targets[index][0]}"] = minutes
+                index += 1
+            if index == len(targets):
+                break
+        return result
+
+    def to_dict(self) -> Dict[str, Any]:
+        completed = self.by_status.get("completed", 0)
+        return {
+            "sessions": self.total,
+            "by_status": dict(sorted(self.by_status.items())),
+            "completion_rate": round(completed / self.total * 100, 1) if self.total else None,
+            "duration_minutes": {
+                "count": self.duration_count,
+                "avg": round(self.duration_sum / self.duration_count, 1) if self.duration_count else None,
+                **self.percentiles()
+            },
+            "score": {
+                "count": self.score_count,
+                "avg": round(self.score_sum / self.score_count, 1) if self.score_count else None,
+                "histogram": {
+                    f"{low}-{low + SCORE_BINS}": self.scores[index]
+                    for index, low in enumerate(range(0, 100, SCORE_BINS))
+                }
+            }
+        }
+
+
+def stream_activity(since: Optional[str] = None, until: Optional[str] = None) -> Iterator[List[Dict[str, Any]]]:
+    """Pages de `user_activity` (colonnes utiles uniquement), par id croissant"""
+    last_id = None
+    while True:
+        query = supabase.query("user_activity").select(COLUMNS).order("id.asc").limit(SUPABASE_PAGE_SIZE)
+        if since:
+            query.gte("started_at", since)
+        if until:
+            query.lt("started_at", until)
+        if last_id is not None:
+            query.gt("id", last_id)
+        response = supabase.get(query)
+        response.raise_for_status()
+        page = response.json()
+        if page:
+            yield page
+        if len(page) < SUPABASE_PAGE_SIZE:
+            return
+        last_id = page[-1]["id"]
+
+
+def compute_analytics(since: Optional[str] = None, until: Optional[str] = None) -> Dict[str, Any]:
+    overall = SessionStats()
+    by_agent: Dict[str, SessionStats] = {}
+    by_institution: Dict[str, SessionStats] = {}
+
+    for page in stream_activity(since, until):
+        for row in page:
+            student = row.get("students") or {}
+            values = (row.get("status"), row.get("duration_minutes"), row.get("score"))
+            overall.add(*values)
+            agent = (row.get("agent_name") or "inconnu").upper()
+            by_agent.setdefault(agent, SessionStats()).add(*values)
+            institution = student.get("institution") or "inconnu"
+            by_institution.setdefault(institution, SessionStats()).add(*values)
+
+    return {
+        "overall": overall.to_dict(),
+        "by_agent": {agent: stats.to_dict() for agent, stats in sorted(by_agent.items())},
+        "by_institution": {name: stats.to_dict() for name, stats in sorted(by_institution.items())}
+    }
@@ -0,0 +1,395 @@
+"""
+Cache partagé pour BaseGenspark API
+===================================
+
+Deux backends :
+- mémoire (défaut) : un seul worker uvicorn, LRU borné à
+  SHARED_CACHE_MEMORY_MAX_ENTRIES entrées
+- SQLite : activé par SHARED_CACHE_PATH ou WEB_CONCURRENCY > 1. Le fichier
+  (mode WAL) est partagé par tous les workers de la machine, un calcul
+  coûteux n'est donc fait qu'une fois par machine.
+
+Invalidation : chaque namespace porte un numéro de version inclus dans les
+clés. `invalidate(namespace)` incrémente la version, ce qui rend obsolètes
+les entrées de tous les workers. Les structures locales (index en mémoire...)
+s'abonnent avec `on_invalidate` ; chaque worker relit les versions au plus
+toutes les SHARED_CACHE_POLL_SECONDS.
+
+Le journal (`append` / `read_since`) est un flux d'événements ordonné,
+commun aux workers : suppressions de sessions, événements SSE... Chaque
+flux garde ses SHARED_CACHE_JOURNAL_MAX dernières entrées : un flux très
+actif (SSE) ne fait pas disparaître les entrées d'un autre (suppressions).
+"""
+
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from uuid import uuid4
+
+SHARED_CACHE_PATH = os.getenv("SHARED_CACHE_PATH", "")
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+SHARED_CACHE_POLL_SECONDS = float(os.getenv("SHARED_CACHE_POLL_SECONDS", "1"))
+# Entrées conservées par flux du journal
+SHARED_CACHE_JOURNAL_MAX = int(os.getenv("SHARED_CACHE_JOURNAL_MAX", "10000"))
+# Entrées max du backend mémoire (LRU : les moins récemment lues sont évincées)
+SHARED_CACHE_MEMORY_MAX_ENTRIES = int(os.getenv("SHARED_CACHE_MEMORY_MAX_ENTRIES", "10000"))
+# Délai max d'attente du calcul d'un autre worker avant de calculer soi-même
+COMPUTE_LOCK_SECONDS = 30.0
+
+_MISSING = object()
+
+
+class MemoryBackend:
+    """Stockage local au processus"""
+
+    shared = False
+
+    def __init__(self, journal_max: int, max_entries: int = SHARED_CACHE_MEMORY_MAX_ENTRIES):
+        self.epoch = uuid4().hex[:8]
+        self.max_entries = max(1, max_entries)
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._versions: Dict[str, int] = {}
+        self._locks: Dict[str, float] = {}
+        self.journal_max = journal_max
+        self._journals: Dict[str, deque] = {}
+        # Par flux : dernière séquence oubliée (au-delà de journal_max)
+        self._trimmed: Dict[str, int] = {}
+        self._journal_seq = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            if entry[0] < time.time():
+                del self._entries[key]
+                return _MISSING
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, value: Any, ttl: float):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            # Plafond strict : éviction O(1) de l'entrée la moins récemment utilisée
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def try_lock(self, key: str, ttl: float) -> bool:
+        # Les requêtes d'un même processus tournent dans des threads différents
+        with self._lock:
+            now = time.time()
+            if self._locks.get(key, 0) >= now:
+                return False
+            self._locks[key] = now + ttl
+            return True
+
+    def unlock(self, key: str):
+        with self._lock:
+            self._locks.pop(key, None)
+
+    def versions(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._versions)
+
+    def bump(self, namespace: str) -> int:
+        with self._lock:
+            self._versions[namespace] = self._versions.get(namespace, 0) + 1
+            return self._versions[namespace]
+
+    def append(self, stream: str, payload: Dict[str, Any]) -> int:
+        with self._lock:
+            self._journal_seq += 1
+            journal = self._journals.setdefault(stream, deque())
+            journal.append((self._journal_seq, payload))
+            if len(journal) > self.journal_max:
+                self._trimmed[stream] = journal.popleft()[0]
+            return self._journal_seq
+
+    def read_since(self, stream: str, seq: int) -> Tuple[Optional[List[Tuple[int, Dict[str, Any]]]], int]:
+        with self._lock:
+            if seq < self._trimmed.get(stream, 0):
+                return None, self._journal_seq
+            return [(s, p) for s, p in self._journals.get(stream, ()) if s > seq], self._journal_seq
+
+    def last_seq(self) -> int:
+        return self._journal_seq
+
+
+class SQLiteBackend:
+    """Stockage dans un fichier SQLite local partagé entre workers"""
+
+    shared = True
+
+    def __init__(self, path: str, journal_max: int):
+        self.path = path
+        self.journal_max = journal_max
+        self._local = threading.local()
+        conn = self._conn()
+        with conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS cache_entries (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS cache_versions (
+                    namespace TEXT PRIMARY KEY,
+                    version INTEGER NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS cache_locks (
+                    key TEXT PRIMARY KEY,
+                    expires_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS cache_journal (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    stream TEXT NOT NULL,
+                    payload TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS cache_journal_stream ON cache_journal (stream, seq);
+                CREATE TABLE IF NOT EXISTS cache_journal_trimmed (
+                    stream TEXT PRIMARY KEY,
+                    seq INTEGER NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS cache_meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                );
+            """)
+            conn.execute("INSERT OR IGNORE INTO cache_meta (key, value) VALUES ('epoch', ?)", (uuid4().hex[:8],))
+        self.epoch = conn.execute("SELECT value FROM cache_meta WHERE key = 'epoch'").fetchone()[0]
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str):
+        row = self._conn().execute(
+            "SELECT value FROM cache_entries WHERE key = ? AND expires_at >= ?",
+            (key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else _MISSING
+
+    def set(self, key: str, value: Any, ttl: float):
+        conn = self._conn()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value, default=str), now + ttl)
+        )
+        conn.execute("DELETE FROM cache_entries WHERE expires_at < ?", (now - 60,))
+
+    def delete(self, key: str):
+        self._conn().execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+
+    def try_lock(self, key: str, ttl: float) -> bool:
+        conn = self._conn()
+        now = time.time()
+        conn.execute("DELETE FROM cache_locks WHERE key = ? AND expires_at < ?", (key, now))
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO cache_locks (key, expires_at) VALUES (?, ?)",
+            (key, now + ttl)
+        )
+        return cursor.rowcount == 1
+
+    def unlock(self, key: str):
+        self._conn().execute("DELETE FROM cache_locks WHERE key = ?", (key,))
+
+    def versions(self) -> Dict[str, int]:
+        return dict(self._conn().execute("SELECT namespace, version FROM cache_versions").fetchall())
+
+    def bump(self, namespace: str) -> int:
+        return self._conn().execute(
+            "INSERT INTO cache_versions (namespace, version) VALUES (?, 1) "
+            "ON CONFLICT(namespace) DO UPDATE SET version = version + 1 RETURNING version",
+            (namespace,)
+        ).fetchone()[0]
+
+    def append(self, stream: str, payload: Dict[str, Any]) -> int:
+        conn = self._conn()
+        seq = conn.execute(
+            "INSERT INTO cache_journal (stream, payload) VALUES (?, ?)",
+            (stream, json.dumps(payload, default=str))
+        ).lastrowid
+        if seq % 100 == 0:
+            self._trim(conn)
+        return seq
+
+    def _trim(self, conn: sqlite3.Connection):
+        """Ne garder que les journal_max dernières entrées de chaque flux"""
+        for (stream,) in conn.execute("SELECT DISTINCT stream FROM cache_journal").fetchall():
+            row = conn.execute(
+                "SELECT seq FROM cache_journal WHERE stream = ? ORDER BY seq DESC LIMIT 1 OFFSET ?",
+                (stream, self.journal_max)
+            ).fetchone()
+            if row is None:
+                continue
+            conn.execute("DELETE FROM cache_journal WHERE stream = ? AND seq <= ?", (stream, row[0]))
+            conn.execute(
+                "INSERT INTO cache_journal_trimmed (stream, seq) VALUES (?, ?) "
+                "ON CONFLICT(stream) DO UPDATE SET seq = MAX(seq, excluded.seq)",
+                (stream, row[0])
+            )
+
+    def read_since(self, stream: str, seq: int) -> Tuple[Optional[List[Tuple[int, Dict[str, Any]]]], int]:
+        conn = self._conn()
+        last = conn.execute("SELECT MAX(seq) FROM cache_journal").fetchone()[0] or seq
+        trimmed = conn.execute("SELECT seq FROM cache_journal_trimmed WHERE stream = ?", (stream,)).fetchone()
+        if trimmed and seq < trimmed[0]:
+            return None, last
+        # Bornées à `last` : l'appelant reprend exactement à la séquence renvoyée
+        rows = conn.execute(
+            "SELECT seq, payload FROM cache_journal WHERE stream = ? AND seq > ? AND seq <= ? ORDER BY seq",
+            (stream, seq, last)
+        ).fetchall()
+        return [(s, json.loads(p)) for s, p in rows], last
+
+    def last_seq(self) -> int:
+        row = self._conn().execute("SELECT MAX(seq) FROM cache_journal").fetchone()
+        return row[0] or 0
+
+
+class SharedCache:
+    """Cache clé/valeur avec TTL, namespaces versionnés et journal partagé"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._versions: Dict[str, int] = {}
+        self._versions_checked_at = 0.0
+        self._listeners: Dict[str, List[Callable[[], None]]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def shared(self) -> bool:
+        return self.backend.shared
+
+    @property
+    def epoch(self) -> str:
+        return self.backend.epoch
+
+    def _refresh_versions(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._versions_checked_at < SHARED_CACHE_POLL_SECONDS:
+            return
+        versions = self.backend.versions()
+        with self._lock:
+            changed = [ns for ns, version in versions.items() if self._versions.get(ns, 0) != version]
+            self._versions = versions
+            self._versions_checked_at = now
+            callbacks = [cb for ns in changed for cb in self._listeners.get(ns, [])]
+        for callback in callbacks:
+            callback()
+
+    def poll(self):
+        """Relire les versions (à appeler périodiquement par les structures locales)"""
+        self._refresh_versions()
+
+    def _key(self, namespace: str, key: str) -> str:
+        self._refresh_versions()
+        return f"{namespace}:{self._versions.get(namespace, 0)}:{key}"
+
+    def versioned_key(self, namespace: str, key: str) -> str:
+        """
+        Clé complète à la version courante du namespace
+
+        À capturer avant un chargement long puis à remplir via `backend.set` :
+        si le namespace est invalidé entre-temps, la valeur chargée atterrit
+        sous l'ancienne version et n'est jamais relue.
+        """
+        return self._key(namespace, key)
+
+    def get(self, namespace: str, key: str, default: Any = None) -> Any:
+        value = self.backend.get(self._key(namespace, key))
+        return default if value is _MISSING else value
+
+    def set(self, namespace: str, key: str, value: Any, ttl: float):
+        self.backend.set(self._key(namespace, key), value, ttl)
+
+    def delete(self, namespace: str, key: str):
+        self.backend.delete(self._key(namespace, key))
+
+    def get_or_compute(self, namespace: str, key: str, compute: Callable[[], Any], ttl: float) -> Any:
+        """
+        Lire la valeur ou la calculer une seule fois pour toute la machine
+
+        Si un autre worker calcule déjà la même clé, on attend son résultat
+        (au plus COMPUTE_LOCK_SECONDS) plutôt que de refaire l'appel amont.
+        """
+        full_key = self._key(namespace, key)
+        value = self.backend.get(full_key)
+        if value is not _MISSING:
+            return value
+
+        deadline = time.monotonic() + COMPUTE_LOCK_SECONDS
+        while not self.backend.try_lock(full_key, COMPUTE_LOCK_SECONDS):
+            time.sleep(0.05)
+            value = self.backend.get(full_key)
+            if value is not _MISSING:
+                return value
+            if time.monotonic() > deadline:
+                break
+        try:
+            value = compute()
+            self.backend.set(full_key, value, ttl)
+            return value
+        finally:
+            self.backend.unlock(full_key)
+
+    def invalidate(self, namespace: str, notify_self: bool = True):
+        """
+        Rendre obsolètes toutes les entrées du namespace, sur tous les workers
+
+        `notify_self=False` : ce worker a déjà appliqué la modification à ses
+        structures locales, seuls les autres workers sont prévenus (sauf si
+        une autre invalidation concurrente a eu lieu entre-temps).
+        """
+        version = self.backend.bump(namespace)
+        with self._lock:
+            previous = self._versions.get(namespace, 0)
+            self._versions[namespace] = version
+            callbacks = list(self._listeners.get(namespace, []))
+        if notify_self or version != previous + 1:
+            for callback in callbacks:
+                callback()
+
+    def on_invalidate(self, namespace: str, callback: Callable[[], None]):
+        """Être prévenu quand le namespace est invalidé (par ce worker ou un autre)"""
+        with self._lock:
+            self._listeners.setdefault(namespace, []).append(callback)
+
+    def append(self, stream: str, payload: Dict[str, Any]) -> int:
+        return self.backend.append(stream, payload)
+
+    def read_since(self, stream: str, seq: int):
+        """(entrées après `seq` ou None si le journal ne couvre plus cette période, dernière séquence)"""
+        return self.backend.read_since(stream, seq)
+
+    def last_seq(self) -> int:
+        return self.backend.last_seq()
+
+
+def build_cache() -> SharedCache:
+    path = SHARED_CACHE_PATH
+    if not path and WEB_CONCURRENCY > 1:
+        path = os.path.join(tempfile.gettempdir(), "basegenspark-cache.sqlite3")
+    if path:
+        return SharedCache(SQLiteBackend(path, SHARED_CACHE_JOURNAL_MAX))
+    return SharedCache(MemoryBackend(SHARED_CACHE_JOURNAL_MAX))
+
+
+cache = build_cache()
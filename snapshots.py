@@ -0,0 +1,189 @@
+"""
+Instantanés des tableaux de bord pour BaseGenspark API
+======================================================
+
+Les tableaux de bord (/crm/stats, /crm/pipeline, /planning/stats/ca) sont
+lus bien plus souvent que les données ne changent. Chaque calcul
+enregistré est rafraîchi en tâche de fond à sa cadence et la lecture sert
+le dernier instantané, sans attendre Supabase :
+
+- instantanés rangés dans le cache partagé (un seul calcul pour tous les
+  workers, verrou par instantané, y compris au premier calcul : les
+  lectures simultanées attendent le résultat au lieu de recalculer)
+- une variante par jeu de paramètres, rafraîchie tant qu'elle est demandée
+- `fresh=True` recalcule immédiatement
+- instantané rattaché à un namespace : une invalidation (écriture) le
+  périme, la lecture suivante recalcule
+
+Chaque instantané porte `generated_at` (dans le corps : stable tant que
+l'instantané ne change pas, l'ETag reste valable) ; l'âge est envoyé dans
+l'en-tête HTTP `Age` (`set_age_header()`).
+"""
+
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import metrics
+import shared_cache
+from structured_log import get_logger
+
+SNAPSHOT_REFRESH_SECONDS = float(os.getenv("SNAPSHOT_REFRESH_SECONDS", "60"))
+SNAPSHOT_TICK_SECONDS = float(os.getenv("SNAPSHOT_TICK_SECONDS", "1"))
+# Variante non demandée depuis N cadences → plus rafraîchie (et expirée du cache)
+SNAPSHOT_IDLE_FACTOR = float(os.getenv("SNAPSHOT_IDLE_FACTOR", "10"))
+
+NAMESPACE = "snapshots"
+
+logger = get_logger("snapshots")
+
+
+class Snapshot:
+    """Calcul enregistré : fonction, cadence, namespace d'invalidation"""
+
+    __slots__ = ("name", "compute", "interval", "namespace")
+
+    def __init__(self, name: str, compute: Callable[..., Any], interval: float, namespace: str):
+        self.name = name
+        self.compute = compute
+        self.interval = interval
+        self.namespace = namespace
+
+    @property
+    def max_age(self) -> float:
+        return self.interval * SNAPSHOT_IDLE_FACTOR
+
+
+def _variant(params: Dict[str, Any]) -> str:
+    return json.dumps(params, sort_keys=True, default=str)
+
+
+def _lock_key(name: str, variant: str) -> str:
+    return f"snapshot:{name}:{variant}"
+
+
+def metadata(stored: Dict[str, Any]) -> Dict[str, Any]:
+    """Champs de fraîcheur à ajouter au corps de la réponse"""
+    return {
+        "generated_at": datetime.fromtimestamp(stored["generated_at"], timezone.utc).isoformat(timespec="seconds")
+    }
+
+
+def set_age_header(response, stored: Dict[str, Any]):
+    """En-tête `Age` (secondes entières) : hors du corps, il ne change pas l'ETag"""
+    response.headers["Age"] = str(int(max(0.0, time.time() - stored["generated_at"])))
+
+
+class SnapshotScheduler:
+    """Registre des calculs et boucle de rafraîchissement"""
+
+    def __init__(self, cache: shared_cache.SharedCache, tick_seconds: float):
+        self.cache = cache
+        self.tick_seconds = tick_seconds
+        self.snapshots: Dict[str, Snapshot] = {}
+        # (nom, variante) → (paramètres, dernière demande en temps monotone)
+        self._requested: Dict[Tuple[str, str], Tuple[Dict[str, Any], float]] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def register(
+        self,
+        name: str,
+        compute: Callable[..., Any],
+        interval: float = SNAPSHOT_REFRESH_SECONDS,
+        namespace: str = NAMESPACE
+    ):
+        self.snapshots[name] = Snapshot(name, compute, interval, namespace)
+
+    def get(self, name: str, params: Optional[Dict[str, Any]] = None, fresh: bool = False) -> Dict[str, Any]:
+        """{"generated_at": timestamp, "data": résultat} — instantané ou calcul immédiat"""
+        snapshot = self.snapshots[name]
+        params = params or {}
+        variant = _variant(params)
+        with self._lock:
+            self._requested[(name, variant)] = (params, time.monotonic())
+        if not fresh:
+            stored = self.cache.get(snapshot.namespace, f"{name}:{variant}")
+            if stored is not None:
+                metrics.incr("snapshot_reads_total", snapshot=name, result="hit")
+                return stored
+        metrics.incr("snapshot_reads_total", snapshot=name, result="fresh" if fresh else "miss")
+        if fresh:
+            return self._refresh(snapshot, variant, params)
+        return self._compute_once(snapshot, variant, params)
+
+    def _compute_once(self, snapshot: Snapshot, variant: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Calcul au premier accès, sous le verrou de l'instantané (même verrou que `refresh_due`)"""
+        lock_key = _lock_key(snapshot.name, variant)
+        deadline = time.monotonic() + shared_cache.COMPUTE_LOCK_SECONDS
+        while not self.cache.backend.try_lock(lock_key, shared_cache.COMPUTE_LOCK_SECONDS):
+            time.sleep(0.05)
+            stored = self.cache.get(snapshot.namespace, f"{snapshot.name}:{variant}")
+            if stored is not None:
+                return stored
+            if time.monotonic() > deadline:
+                return self._refresh(snapshot, variant, params)
+        try:
+            # Calculé par un autre worker entre la lecture et la prise du verrou
+            stored = self.cache.get(snapshot.namespace, f"{snapshot.name}:{variant}")
+            if stored is not None:
+                return stored
+            return self._refresh(snapshot, variant, params)
+        finally:
+            self.cache.backend.unlock(lock_key)
+
+    def _refresh(self, snapshot: Snapshot, variant: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        # Clé figée avant le calcul : une invalidation pendant le calcul l'emporte
+        key = self.cache.versioned_key(snapshot.namespace, f"{snapshot.name}:{variant}")
+        started = time.monotonic()
+        stored = {"generated_at": time.time(), "data": snapshot.compute(**params)}
+        metrics.set_gauge("snapshot_compute_seconds", round(time.monotonic() - started, 3), snapshot=snapshot.name)
+        self.cache.backend.set(key, stored, snapshot.max_age)
+        return stored
+
+    def refresh_due(self):
+        """Un passage : rafraîchir les variantes demandées dont l'instantané a fait son temps"""
+        now = time.monotonic()
+        with self._lock:
+            requested = list(self._requested.items())
+        for (name, variant), (params, last_request) in requested:
+            snapshot = self.snapshots[name]
+            if now - last_request > snapshot.max_age:
+                with self._lock:
+                    if self._requested.get((name, variant), (None, 0))[1] == last_request:
+                        del self._requested[(name, variant)]
+                continue
+            stored = self.cache.get(snapshot.namespace, f"{name}:{variant}")
+            if stored is not None and time.time() - stored["generated_at"] < snapshot.interval:
+                continue
+            lock_key = _lock_key(name, variant)
+            if not self.cache.backend.try_lock(lock_key, snapshot.interval):
+                continue
+            try:
+                self._refresh(snapshot, variant, params)
+                metrics.incr("snapshot_refreshes_total", snapshot=name, result="ok")
+            except Exception as e:
+                metrics.incr("snapshot_refreshes_total", snapshot=name, result="error")
+                logger.warning("Rafraîchissement d'instantané impossible", extra={"snapshot": name, "error": str(e)})
+            finally:
+                self.cache.backend.unlock(lock_key)
+
+    def run(self):
+        while True:
+            try:
+                self.refresh_due()
+            except Exception as e:
+                logger.warning("Boucle des instantanés interrompue", extra={"error": str(e)})
+            time.sleep(self.tick_seconds)
+
+    def start(self):
+        """Démarrer la boucle de fond (une fois par processus)"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run, name="dashboard-snapshots", daemon=True)
+            self._thread.start()
+
+
+scheduler = SnapshotScheduler(shared_cache.cache, SNAPSHOT_TICK_SECONDS)
@@ -0,0 +1,194 @@
+"""
+Journalisation structurée pour BaseGenspark API
+===============================================
+
+Les routes ne font que déposer un enregistrement dans une file bornée ;
+un thread de fond l'écrit sur stdout en JSON (une ligne par événement).
+Si la file est pleine, l'enregistrement est abandonné (et compté) :
+journaliser n'ajoute jamais de latence aux appels des agents.
+
+Chaque enregistrement porte l'identifiant de la requête en cours
+(en-tête X-Request-ID, généré sinon) et les appels Supabase de la
+requête sont chronométrés. Échantillonnage par niveau :
+    LOG_SAMPLE_RATES="DEBUG=0.05,INFO=1"
+"""
+
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from uuid import uuid4
+
+import metrics
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "DEBUG=0.05")
+
+ROOT_LOGGER = "basegenspark"
+
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+# [nombre d'appels, secondes cumulées] — liste partagée avec les threads de la requête
+upstream_var: contextvars.ContextVar[Optional[List[float]]] = contextvars.ContextVar("upstream", default=None)
+
+_STANDARD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def parse_sample_rates(raw: str) -> Dict[int, float]:
+    rates = {}
+    for part in raw.split(","):
+        if "=" in part:
+            level, rate = part.split("=", 1)
+            rates[logging.getLevelName(level.strip().upper())] = float(rate)
+    return rates
+
+
+class JsonFormatter(logging.Formatter):
+    """Une ligne JSON : horodatage, niveau, logger, message, contexte et champs `extra`"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage()
+        }
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD_ATTRS and value is not None:
+                payload[key] = value
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str, ensure_ascii=False)
+
+
+class ContextFilter(logging.Filter):
+    """Échantillonnage par niveau et contexte de requête (exécuté dans le thread appelant)"""
+
+    def __init__(self, sample_rates: Dict[int, float]):
+        super().__init__()
+        self.sample_rates = sample_rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.sample_rates.get(record.levelno, 1.0)
+        if rate < 1.0 and random.random() >= rate:
+            return False
+        if getattr(record, "request_id", None) is None:
+            record.request_id = request_id_var.get()
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler qui abandonne l'enregistrement plutôt que d'attendre"""
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.incr("log_records_dropped_total")
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def setup_logging():
+    """Brancher la file et démarrer le thread d'écriture (idempotent)"""
+    global _listener
+    if _listener is not None:
+        return
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter())
+
+    handler = DroppingQueueHandler(log_queue)
+    handler.addFilter(ContextFilter(parse_sample_rates(LOG_SAMPLE_RATES)))
+
+    logger = logging.getLogger(ROOT_LOGGER)
+    logger.setLevel(LOG_LEVEL)
+    logger.addHandler(handler)
+    logger.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, stream)
+    _listener.start()
+
+
+def shutdown_logging():
+    """Vider la file avant l'arrêt du processus"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+_upstream_logger = get_logger("upstream")
+
+
+def record_upstream(method: str, path: str, status: Optional[int], seconds: float):
+    """Chronométrage d'un appel Supabase (cumulé sur la requête en cours)"""
+    totals = upstream_var.get()
+    if totals is not None:
+        totals[0] += 1
+        totals[1] += seconds
+    _upstream_logger.debug(
+        "supabase",
+        extra={"method": method, "path": path, "status": status, "duration_ms": round(seconds * 1000, 1)}
+    )
+
+
+class RequestContextMiddleware:
+    """Middleware ASGI : identifiant de requête, temps Supabase cumulé, journal d'accès"""
+
+    def __init__(self, app):
+        self.app = app
+        self.logger = get_logger("access")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for key, value in scope.get("headers", []):
+            if key == b"x-request-id":
+                request_id = value.decode("latin-1")[:64]
+                break
+        request_id = request_id or uuid4().hex[:16]
+        request_token = request_id_var.set(request_id)
+        upstream = [0, 0.0]
+        upstream_token = upstream_var.set(upstream)
+        started = time.perf_counter()
+        status = None
+
+        async def send_with_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message = {**message, "headers": [*message.get("headers", []), (b"x-request-id", request_id.encode("latin-1"))]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            self.logger.info(
+                "request",
+                extra={
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "status": status,
+                    "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+                    "upstream_calls": upstream[0],
+                    "upstream_ms": round(upstream[1] * 1000, 1)
+                }
+            )
+            request_id_var.reset(request_token)
+            upstream_var.reset(upstream_token)
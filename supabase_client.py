@@ -0,0 +1,343 @@
+"""
+Accès Supabase (PostgREST) pour BaseGenspark API
+================================================
+
+Point d'accès unique à Supabase pour toutes les routes :
+- un seul pool de connexions (HTTP/2 multiplexé si `h2` est installé)
+- keep-alive réglable par variables d'environnement
+- connexion TLS préchauffée au démarrage (`prewarm`)
+- en-têtes d'authentification précalculés une fois pour toutes
+- construction des requêtes PostgREST avec échappement des valeurs
+- chaque appel chronométré (cumulé dans le journal de la requête)
+- lecture en flux des grandes réponses (`stream`) : tableau JSON décodé
+  ligne par ligne à la réception (corps compressé en gzip par Supabase)
+
+Exemple :
+    query = supabase.query("planning_sessions").select("*").gte("date", "2026-01-01").order("date.asc")
+    response = supabase.get(query)
+"""
+
+import codecs
+import json
+import os
+import time
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import httpx
+
+from structured_log import record_upstream
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# ========================================
+# CONFIGURATION
+# ========================================
+
+SUPABASE_URL = os.getenv("SUPABASE_URL", "https://iepvmuzfdkklysnqbvwt.supabase.co")
+SUPABASE_KEY = os.getenv("SUPABASE_KEY", "")
+
+SUPABASE_HTTP2 = os.getenv("SUPABASE_HTTP2", "true").lower() == "true"
+SUPABASE_TIMEOUT = float(os.getenv("SUPABASE_TIMEOUT", "30"))
+SUPABASE_MAX_CONNECTIONS = int(os.getenv("SUPABASE_MAX_CONNECTIONS", "100"))
+SUPABASE_MAX_KEEPALIVE = int(os.getenv("SUPABASE_MAX_KEEPALIVE", "20"))
+SUPABASE_KEEPALIVE_EXPIRY = float(os.getenv("SUPABASE_KEEPALIVE_EXPIRY", "120"))
+
+SUPABASE_STREAM_CHUNK_SIZE = int(os.getenv("SUPABASE_STREAM_CHUNK_SIZE", "65536"))
+# Lectures par pages (au plus le max-rows PostgREST, 1000 sur Supabase)
+SUPABASE_PAGE_SIZE = int(os.getenv("SUPABASE_PAGE_SIZE", "1000"))
+
+# Caractères qui obligent à mettre une valeur entre guillemets dans une liste PostgREST
+_RESERVED = set(',.:()"\\ ')
+
+
+def format_value(value: Any) -> str:
+    """Représentation PostgREST d'une valeur Python"""
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return str(value)
+
+
+def quote(value: Any) -> str:
+    """Valeur utilisable dans in.(...) / or=(...) : guillemets si caractère réservé"""
+    raw = format_value(value)
+    if raw and not any(char in _RESERVED for char in raw):
+        return raw
+    escaped = raw.replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{escaped}"'
+
+
+class PostgrestQuery:
+    """Construction d'une requête PostgREST (table + paramètres d'URL)"""
+
+    def __init__(self, table: str):
+        self.table = table
+        self._params: List[Tuple[str, str]] = []
+
+    @property
+    def params(self) -> List[Tuple[str, str]]:
+        return list(self._params)
+
+    def copy(self) -> "PostgrestQuery":
+        clone = PostgrestQuery(self.table)
+        clone._params = list(self._params)
+        return clone
+
+    def _add(self, key: str, value: str) -> "PostgrestQuery":
+        self._params.append((key, value))
+        return self
+
+    def select(self, columns: str = "*") -> "PostgrestQuery":
+        return self._add("select", columns)
+
+    def filter(self, column: str, operator: str, value: Any) -> "PostgrestQuery":
+        """Filtre générique : `column=operator.value`"""
+        return self._add(column, f"{operator}.{format_value(value)}")
+
+    def eq(self, column: str, value: Any) -> "PostgrestQuery":
+        return self.filter(column, "eq", value)
+
+    def neq(self, column: str, value: Any) -> "PostgrestQuery":
+        return self.filter(column, "neq", value)
+
+    def gt(self, column: str, value: Any) -> "PostgrestQuery":
+        return self.filter(column, "gt", value)
+
+    def gte(self, column: str, value: Any) -> "PostgrestQuery":
+        return self.filter(column, "gte", value)
+
+    def lt(self, column: str, value: Any) -> "PostgrestQuery":
+        return self.filter(column, "lt", value)
+
+    def lte(self, column: str, value: Any) -> "PostgrestQuery":
+        return self.filter(column, "lte", value)
+
+    def is_(self, column: str, value: Optional[bool]) -> "PostgrestQuery":
+        return self.filter(column, "is", value)
+
+    def not_is(self, column: str, value: Optional[bool]) -> "PostgrestQuery":
+        return self.filter(column, "not.is", value)
+
+    def in_(self, column: str, values: Iterable[Any]) -> "PostgrestQuery":
+        return self._add(column, f"in.({','.join(quote(v) for v in values)})")
+
+    def not_in(self, column: str, values: Iterable[Any]) -> "PostgrestQuery":
+        return self._add(column, f"not.in.({','.join(quote(v) for v in values)})")
+
+    def or_(self, *conditions: str) -> "PostgrestQuery":
+        """Conditions construites avec `condition()` : or=(c1,c2)"""
+        return self._add("or", f"({','.join(conditions)})")
+
+    def order(self, *clauses: str) -> "PostgrestQuery":
+        return self._add("order", ",".join(clauses))
+
+    def limit(self, count: int) -> "PostgrestQuery":
+        return self._add("limit", str(count))
+
+    def offset(self, count: int) -> "PostgrestQuery":
+        return self._add("offset", str(count))
+
+
+def condition(column: str, operator: str, value: Any) -> str:
+    """Condition pour or=(...) / and(...) : `column.operator.value`"""
+    return f"{column}.{operator}.{quote(value)}"
+
+
+# ========================================
+# LECTURE EN FLUX
+# ========================================
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\r\n"
+_SEPARATORS = _WHITESPACE + ","
+_NUMBER_CHARS = "0123456789+-.eE"
+
+
+def iter_json_array(chunks: Iterable[bytes]) -> Iterator[Any]:
+    """
+    Éléments d'un tableau JSON reçu par morceaux, au fur et à mesure
+
+    Seul l'élément en cours de réception est gardé en mémoire. Un élément
+    n'est émis qu'une fois suivi de son délimiteur (`,` ou `]`) : un nombre
+    coupé entre deux morceaux n'est pas décodé à moitié.
+    """
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    position = 0
+    opened = False
+    finished = False
+    for chunk in _with_end(chunks):
+        if chunk is None:
+            finished = True
+            buffer += text_decoder.decode(b"", final=True)
+        else:
+            buffer += text_decoder.decode(chunk)
+        while True:
+            while position < len(buffer) and buffer[position] in _SEPARATORS:
+                position += 1
+            if position == len(buffer):
+                break
+            if not opened:
+                if buffer[position] != "[":
+                    raise ValueError("Réponse PostgREST inattendue : tableau JSON attendu")
+                opened = True
+                position += 1
+                continue
+            if buffer[position] == "]":
+                return
+            try:
+                value, end = _decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if finished:
+                    raise
+                break
+            # Un élément n'est complet qu'une fois suivi de « , » ou « ] » :
+            # « 1. » ou « 2e » peuvent encore continuer au morceau suivant
+            following = end
+            while following < len(buffer) and buffer[following] in _WHITESPACE:
+                following += 1
+            if following == len(buffer):
+                break
+            if buffer[following] not in ",]":
+                tail = end
+                while tail < len(buffer) and buffer[tail] in _NUMBER_CHARS:
+                    tail += 1
+                if tail == len(buffer) and not finished:
+                    break
+                raise ValueError("Tableau JSON invalide")
+            yield value
+            position = end
+        buffer = buffer[position:]
+        position = 0
+    if opened or buffer.strip():
+        raise ValueError("Tableau JSON incomplet")
+
+
+def _with_end(chunks: Iterable[bytes]) -> Iterator[Optional[bytes]]:
+    yield from chunks
+    yield None
+
+
+class RowStream:
+    """
+    Réponse d'un GET PostgREST lue en flux
+
+    S'utilise comme une réponse (`status_code`, `text`) puis s'itère ligne
+    par ligne ; la connexion est rendue au pool à la fin de l'itération
+    ou à la sortie du bloc `with`.
+    """
+
+    def __init__(self, owner: "SupabaseClient", query: "PostgrestQuery"):
+        self.owner = owner
+        self.path = f"/{query.table}"
+        self.started = time.perf_counter()
+        self.closed = False
+        request = owner.client.build_request("GET", self.path, params=query.params)
+        self.response = owner.client.send(request, stream=True)
+        self.status_code = self.response.status_code
+        if self.status_code != 200:
+            self.response.read()
+
+    @property
+    def text(self) -> str:
+        return self.response.text
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        try:
+            yield from iter_json_array(self.response.iter_bytes(SUPABASE_STREAM_CHUNK_SIZE))
+        finally:
+            self.close()
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.response.close()
+            record_upstream("GET", self.path, self.status_code, time.perf_counter() - self.started)
+
+    def __enter__(self) -> "RowStream":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# ========================================
+# CLIENT
+# ========================================
+
+class SupabaseClient:
+    """Client PostgREST partagé (pool unique, en-têtes précalculés)"""
+
+    def __init__(self, url: str, key: str):
+        self.rest_url = f"{url}/rest/v1"
+        self.http2 = SUPABASE_HTTP2 and HTTP2_AVAILABLE
+        self.headers = httpx.Headers({
+            "apikey": key,
+            "Authorization": f"Bearer {key}"
+        })
+        self.prefer_representation = httpx.Headers({"Prefer": "return=representation"})
+        self.prefer_minimal = httpx.Headers({"Prefer": "return=minimal"})
+        self.client = httpx.Client(
+            base_url=self.rest_url,
+            headers=self.headers,
+            http2=self.http2,
+            timeout=SUPABASE_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=SUPABASE_MAX_CONNECTIONS,
+                max_keepalive_connections=SUPABASE_MAX_KEEPALIVE,
+                keepalive_expiry=SUPABASE_KEEPALIVE_EXPIRY
+            )
+        )
+
+    def query(self, table: str) -> PostgrestQuery:
+        return PostgrestQuery(table)
+
+    def _send(self, method: str, path: str, **kwargs) -> httpx.Response:
+        started = time.perf_counter()
+        status = None
+        try:
+            response = self.client.request(method, path, **kwargs)
+            status = response.status_code
+            return response
+        finally:
+            record_upstream(method, path, status, time.perf_counter() - started)
+
+    def get(self, query: PostgrestQuery) -> httpx.Response:
+        return self._send("GET", f"/{query.table}", params=query.params)
+
+    def stream(self, query: PostgrestQuery) -> RowStream:
+        """GET décodé ligne par ligne (mémoire constante sur les grandes tables)"""
+        return RowStream(self, query)
+
+    def insert(self, table: str, payload: Any, returning: bool = True) -> httpx.Response:
+        headers = self.prefer_representation if returning else self.prefer_minimal
+        return self._send("POST", f"/{table}", json=payload, headers=headers)
+
+    def update(self, query: PostgrestQuery, payload: Dict[str, Any], returning: bool = False) -> httpx.Response:
+        headers = self.prefer_representation if returning else self.prefer_minimal
+        return self._send("PATCH", f"/{query.table}", params=query.params, json=payload, headers=headers)
+
+    def delete(self, query: PostgrestQuery, returning: bool = False) -> httpx.Response:
+        headers = self.prefer_representation if returning else self.prefer_minimal
+        return self._send("DELETE", f"/{query.table}", params=query.params, headers=headers)
+
+    def rpc(self, function: str, payload: Dict[str, Any]) -> httpx.Response:
+        return self._send("POST", f"/rpc/{function}", json=payload)
+
+    def prewarm(self):
+        """Ouvrir la connexion TLS (et la session HTTP/2) avant la première requête"""
+        self._send("HEAD", "/")
+
+    def close(self):
+        self.client.close()
+
+
+supabase = SupabaseClient(SUPABASE_URL, SUPABASE_KEY)
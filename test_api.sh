@@ -1,9 +1,12 @@
 #!/bin/bash
 
 # Script de test pour l'API BaseGenspark
-# Usage: ./test_api.sh https://votre-api.onrender.com
+# Usage: ./test_api.sh https://votre-api.onrender.com [token_agent]
+# Les tests 11 à 19 (planning, lots, exports, analytics) demandent un token
+# d'agent : second argument ou variable AGENT_TOKEN.
 
 API_URL="${1:-http://localhost:8000}"
+TOKEN="${2:-$AGENT_TOKEN}"
 
 echo "🧪 Tests de l'API BaseGenspark"
 echo "================================"
@@ -177,6 +180,79 @@ if [ -n "$log_id" ]; then
     echo ""
 fi
 
+# Tests 11 à 19 : routes planning / agents (token requis)
+check() {
+    # check <libellé> <code attendu> <code obtenu>
+    if [ "$3" = "$2" ]; then
+        echo -e "${GREEN}✓ PASS${NC} - $1"
+    else
+        echo -e "${RED}✗ FAIL${NC} - $1 : HTTP $3 (attendu $2)"
+    fi
+    echo ""
+}
+
+if [ -z "$TOKEN" ]; then
+    echo "Tests 11 à 19 ignorés : token d'agent manquant"
+    echo ""
+else
+    AUTH="X-Agent-Token: $TOKEN"
+    month=$(date -u +%Y-%m)
+
+    echo "Test 11: Synchro incrémentale (jeton initial puis delta)"
+    body=$(curl -s -H "$AUTH" "$API_URL/planning/sessions/changes")
+    next_token=$(echo "$body" | grep -o '"next_token":"[^"]*"' | cut -d'"' -f4)
+    http_code=$(curl -s -o /dev/null -w "%{http_code}" -H "$AUTH" "$API_URL/planning/sessions/changes?since=$next_token")
+    if [ -n "$next_token" ]; then
+        check "Delta depuis le jeton" 200 "$http_code"
+    else
+        check "Jeton de synchro" "next_token" "absent"
+    fi
+
+    echo "Test 12: Planning sur plusieurs semaines"
+    http_code=$(curl -s -o /dev/null -w "%{http_code}" -H "$AUTH" "$API_URL/planning/range?month=$month")
+    check "GET /planning/range" 200 "$http_code"
+
+    echo "Test 13: GET conditionnel (ETag puis 304)"
+    etag=$(curl -s -D - -o /dev/null -H "$AUTH" "$API_URL/planning/etablissements" | grep -i '^etag:' | cut -d' ' -f2 | tr -d '\r')
+    http_code=$(curl -s -o /dev/null -w "%{http_code}" -H "$AUTH" -H "If-None-Match: $etag" "$API_URL/planning/etablissements")
+    check "If-None-Match $etag" 304 "$http_code"
+
+    echo "Test 14: Requête groupée"
+    response=$(curl -s -w "\n%{http_code}" -X POST "$API_URL/batch" \
+        -H "$AUTH" -H "Content-Type: application/json" \
+        -d '{"operations": [
+            {"id": "etablissements", "path": "/planning/etablissements"},
+            {"id": "modules", "path": "/planning/modules", "depends_on": ["etablissements"]}
+        ]}')
+    check "POST /batch" 200 "$(echo "$response" | tail -n1)"
+
+    echo "Test 15: Lot refusé (route exclue)"
+    http_code=$(curl -s -o /dev/null -w "%{http_code}" -X POST "$API_URL/batch" \
+        -H "$AUTH" -H "Content-Type: application/json" \
+        -d '{"operations": [{"path": "/planning/../batch"}]}')
+    check "Chemin ambigu dans un lot" 400 "$http_code"
+
+    echo "Test 16: Export CSV du mois"
+    http_code=$(curl -s -o /dev/null -w "%{http_code}" -H "$AUTH" \
+        "$API_URL/planning/export?date_start=$month-01&date_end=$month-28&format=csv")
+    check "GET /planning/export" 200 "$http_code"
+
+    echo "Test 17: Séries de CA"
+    http_code=$(curl -s -o /dev/null -w "%{http_code}" -H "$AUTH" "$API_URL/planning/stats/ca/series?group_by=etablissement&yoy=true")
+    check "GET /planning/stats/ca/series" 200 "$http_code"
+
+    echo "Test 18: Analytics des sessions agents"
+    http_code=$(curl -s -o /dev/null -w "%{http_code}" -H "$AUTH" "$API_URL/admin/analytics")
+    check "GET /admin/analytics" 200 "$http_code"
+
+    echo "Test 19: Flux SSE du planning (3 secondes)"
+    content_type=$(curl -s -N --max-time 3 -D - -o /dev/null -H "$AUTH" "$API_URL/planning/stream" | grep -i '^content-type:' | tr -d '\r')
+    case "$content_type" in
+        *text/event-stream*) check "GET /planning/stream" ok ok ;;
+        *) check "GET /planning/stream ($content_type)" text/event-stream autre ;;
+    esac
+fi
+
 echo "================================"
 echo "Tests terminés !"
 echo ""
@@ -0,0 +1,12 @@
+"""
+Configuration commune des tests
+"""
+
+import os
+import sys
+
+# Pas de connexion à Supabase à l'import des modules
+os.environ.setdefault("SUPABASE_PREWARM", "false")
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
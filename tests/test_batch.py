@@ -0,0 +1,53 @@
+"""
+Tests de la validation des requêtes groupées
+"""
+
+import pytest
+
+from batch import normalize_path, validate_operations
+
+EXCLUDED = ("/batch", "/planning/stream", "/planning/export")
+
+
+def operation(operation_id, path, depends_on=()):
+    return {"id": operation_id, "method": "GET", "path": path, "depends_on": list(depends_on)}
+
+
+def test_normalize_path_keeps_plain_paths():
+    assert normalize_path("/planning/sessions?date=2026-01-01") == "/planning/sessions"
+    assert normalize_path("/crm/prospects/12/") == "/crm/prospects/12"
+
+
+@pytest.mark.parametrize("path", [
+    "planning/sessions",
+    "//evil.example/batch",
+    "/planning/../batch",
+    "/planning/%2e%2e/batch",
+    "/planning/./stream",
+    "/planning\\..\\batch",
+])
+def test_normalize_path_rejects_ambiguous_paths(path):
+    with pytest.raises(ValueError):
+        normalize_path(path)
+
+
+def test_validate_operations_excluded_paths():
+    with pytest.raises(ValueError):
+        validate_operations([operation("a", "/batch")], 20, EXCLUDED)
+    with pytest.raises(ValueError):
+        validate_operations([operation("a", "/planning/export?date_start=2026-01-01")], 20, EXCLUDED)
+
+
+def test_validate_operations_dependencies_and_ids():
+    validate_operations([operation("a", "/health"), operation("b", "/metrics", ["a"])], 20, EXCLUDED)
+    with pytest.raises(ValueError):
+        validate_operations([operation("b", "/metrics", ["a"]), operation("a", "/health")], 20, EXCLUDED)
+    with pytest.raises(ValueError):
+        validate_operations([operation("a", "/health"), operation("a", "/metrics")], 20, EXCLUDED)
+
+
+def test_validate_operations_limits():
+    with pytest.raises(ValueError):
+        validate_operations([], 20, EXCLUDED)
+    with pytest.raises(ValueError):
+        validate_operations([operation(str(i), "/health") for i in range(3)], 2, EXCLUDED)
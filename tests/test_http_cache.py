@@ -0,0 +1,88 @@
+"""
+Tests des GET conditionnels (ETag, 304, Cache-Control)
+"""
+
+import json
+
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.testclient import TestClient
+
+from http_cache import ConditionalGetMiddleware, etag_matches, make_etag
+
+app = FastAPI()
+state = {"value": 1}
+
+
+@app.get("/planning/data")
+def data():
+    return {"value": state["value"]}
+
+
+@app.post("/planning/data")
+def write():
+    state["value"] += 1
+    return {"value": state["value"]}
+
+
+@app.get("/planning/text")
+def text():
+    return PlainTextResponse("bonjour")
+
+
+@app.get("/planning/stream")
+def stream():
+    return StreamingResponse(iter([b"[", json.dumps({"id": 1}).encode(), b"]"]), media_type="application/json")
+
+
+@app.get("/other")
+def other():
+    return {"ok": True}
+
+
+app.add_middleware(ConditionalGetMiddleware, rules=[("/planning/", "private, no-cache")])
+client = TestClient(app)
+
+
+def test_etag_and_not_modified():
+    response = client.get("/planning/data")
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+    assert etag == make_etag(response.content)
+    assert response.headers["cache-control"] == "private, no-cache"
+
+    cached = client.get("/planning/data", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+    assert cached.headers["etag"] == etag
+
+
+def test_changed_content_changes_etag():
+    etag = client.get("/planning/data").headers["etag"]
+    client.post("/planning/data")
+    response = client.get("/planning/data", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+
+def test_weak_comparison_and_lists():
+    etag = 'W/"abc"'
+    assert etag_matches('"abc"', etag)
+    assert etag_matches('W/"x", W/"abc"', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"abd"', etag)
+    assert not etag_matches(None, etag)
+
+
+def test_non_json_and_unruled_paths_pass_through():
+    assert "etag" not in client.get("/planning/text").headers
+    assert "etag" not in client.get("/other").headers
+    assert "etag" not in client.post("/planning/data").headers
+
+
+def test_streamed_json_is_not_buffered():
+    response = client.get("/planning/stream")
+    assert response.status_code == 200
+    assert response.json() == [{"id": 1}]
+    assert "etag" not in response.headers
+    assert response.headers["cache-control"] == "private, no-cache"
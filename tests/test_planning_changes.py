@@ -0,0 +1,108 @@
+"""
+Tests de la synchro incrémentale du planning (jeton, curseur, suppressions)
+"""
+
+import re
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from supabase_client import supabase
+
+STAMP = "2026-03-01T10:00:00"
+
+
+class FakePlanning:
+    """Table planning_sessions simulée derrière l'API PostgREST"""
+
+    def __init__(self):
+        self.rows = {}
+
+    def handler(self, request: httpx.Request) -> httpx.Response:
+        params = request.url.params
+        if request.method == "DELETE":
+            row = self.rows.pop(int(params["id"][3:]), None)
+            return httpx.Response(200, json=[row] if row else [])
+        rows = sorted(self.rows.values(), key=lambda row: (row["updated_at"], row["id"]))
+        if params.get("order", "").startswith("updated_at.desc"):
+            rows.reverse()
+        if "or" in params:
+            stamp = re.search(r'updated_at\.gt\."?([^",)]+)', params["or"]).group(1)
+            after_id = int(re.search(r"id\.gt\.(\d+)", params["or"]).group(1))
+            rows = [row for row in rows if (row["updated_at"], row["id"]) > (stamp, after_id)]
+        return httpx.Response(200, json=rows[:int(params.get("limit", len(rows) or 1))])
+
+
+@pytest.fixture
+def planning(monkeypatch):
+    fake = FakePlanning()
+    monkeypatch.setattr(supabase, "client", httpx.Client(base_url=supabase.rest_url, transport=httpx.MockTransport(fake.handler)))
+    return fake
+
+
+@pytest.fixture
+def client():
+    return TestClient(main.app, headers={"X-Agent-Token": main.AGENT_SECRET_TOKEN})
+
+
+def add_rows(planning, ids, updated_at=STAMP):
+    for session_id in ids:
+        planning.rows[session_id] = {"id": session_id, "date": "2026-03-02", "updated_at": updated_at}
+
+
+def changes(client, token=None, limit=1000):
+    params = {"limit": limit}
+    if token:
+        params["since"] = token
+    response = client.get("/planning/sessions/changes", params=params)
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_token_round_trip():
+    token = main.encode_sync_token(STAMP, 42, 7)
+    assert main.decode_sync_token(token) == {"tombstone_seq": 7, "updated_at": STAMP, "id": 42}
+    assert main.decode_sync_token("pas-un-jeton") is None
+
+
+def test_invalid_token_asks_for_full_resync(planning, client):
+    add_rows(planning, [1])
+    body = changes(client, token="pas-un-jeton")
+    assert body["full_resync"] is True
+    assert main.decode_sync_token(body["next_token"])["id"] == 1
+
+
+def test_pages_do_not_skip_rows_with_the_same_updated_at(planning, client):
+    token = changes(client)["next_token"]
+    add_rows(planning, [1, 2, 3, 4, 5])
+    seen = []
+    while True:
+        body = changes(client, token, limit=2)
+        seen += [row["id"] for row in body["inserted"] + body["updated"]]
+        token = body["next_token"]
+        if not body["has_more"]:
+            break
+    assert seen == [1, 2, 3, 4, 5]
+    assert changes(client, token)["updated"] == []
+
+
+def test_deletions_are_reported_once(planning, client):
+    add_rows(planning, [1, 2])
+    token = changes(client)["next_token"]
+    assert client.delete("/planning/sessions/2").status_code == 200
+    body = changes(client, token)
+    assert [entry["id"] for entry in body["deleted"]] == [2]
+    assert changes(client, body["next_token"])["deleted"] == []
+
+
+def test_tombstone_cursor_stops_at_the_read_position():
+    tombstones = main.SessionTombstones()
+    start = tombstones.last_seq
+    tombstones.record(101)
+    entries, seq = tombstones.since(start)
+    assert [entry["id"] for entry in entries] == [101]
+    tombstones.record(102)
+    entries, _ = tombstones.since(seq)
+    assert [entry["id"] for entry in entries] == [102]
@@ -0,0 +1,65 @@
+"""
+Tests des backends du cache partagé (mémoire et SQLite)
+"""
+
+import pytest
+
+from shared_cache import _MISSING, MemoryBackend, SharedCache, SQLiteBackend
+
+JOURNAL_MAX = 50
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryBackend(JOURNAL_MAX)
+    return SQLiteBackend(str(tmp_path / "cache.sqlite3"), JOURNAL_MAX)
+
+
+def test_versioned_invalidation(backend):
+    cache = SharedCache(backend)
+    cache.set("ns", "k", {"v": 1}, ttl=60)
+    assert cache.get("ns", "k") == {"v": 1}
+    cache.invalidate("ns")
+    assert cache.get("ns", "k") is None
+
+
+def test_lock_is_exclusive(backend):
+    assert backend.try_lock("job", 30)
+    assert not backend.try_lock("job", 30)
+    backend.unlock("job")
+    assert backend.try_lock("job", 30)
+
+
+def test_journal_read_since(backend):
+    first = backend.append("deletions", {"id": 1})
+    backend.append("events", {"type": "x"})
+    entries, last = backend.read_since("deletions", 0)
+    assert entries == [(first, {"id": 1})]
+    assert last == backend.last_seq()
+    entries, _ = backend.read_since("deletions", last)
+    assert entries == []
+
+
+def test_journal_retention_is_per_stream(backend):
+    kept = backend.append("deletions", {"id": 1})
+    for i in range(300):
+        backend.append("events", {"i": i})
+    # Le flux très actif est tronqué sans faire disparaître l'autre
+    entries, _ = backend.read_since("deletions", kept - 1)
+    assert entries == [(kept, {"id": 1})]
+    entries, _ = backend.read_since("events", kept)
+    assert entries is None
+    entries, last = backend.read_since("events", backend.last_seq() - 10)
+    assert len(entries) == 10
+
+
+def test_memory_backend_is_a_bounded_lru():
+    backend = MemoryBackend(JOURNAL_MAX, max_entries=3)
+    for key in "abc":
+        backend.set(key, key, 60)
+    backend.get("a")
+    backend.set("d", "d", 60)
+    # « b » est le moins récemment utilisé : évincé à l'insertion de « d »
+    assert backend.get("b") is _MISSING
+    assert [backend.get(key) for key in "acd"] == ["a", "c", "d"]
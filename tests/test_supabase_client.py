@@ -0,0 +1,65 @@
+"""
+Tests de la lecture en flux des réponses PostgREST
+"""
+
+import json
+
+import pytest
+
+from supabase_client import iter_json_array
+
+ROWS = [
+    {"id": 1, "nom": "Élise", "tags": ["a", "b"], "note": 12.5},
+    1.5,
+    2e3,
+    -7,
+    "texte, avec ] et [",
+    None,
+    True,
+    [],
+    {"imbriqué": {"x": [1, 2, {"y": None}]}},
+    0,
+]
+
+
+def test_whole_body():
+    assert list(iter_json_array([json.dumps(ROWS).encode("utf-8")])) == ROWS
+
+
+def test_empty_array():
+    assert list(iter_json_array([b" [ ] "])) == []
+
+
+@pytest.mark.parametrize("body", [
+    b"[1.5, 2e3]",
+    b'[{"id": 1}, 12, "deux"]',
+    json.dumps(ROWS, ensure_ascii=False).encode("utf-8"),
+])
+def test_split_at_every_offset(body):
+    expected = json.loads(body)
+    for offset in range(len(body) + 1):
+        assert list(iter_json_array([body[:offset], body[offset:]])) == expected, offset
+
+
+def test_byte_by_byte():
+    body = json.dumps(ROWS, ensure_ascii=False).encode("utf-8")
+    assert list(iter_json_array(body[i:i + 1] for i in range(len(body)))) == ROWS
+
+
+def test_number_split_across_chunks():
+    assert list(iter_json_array([b"[1.", b"5, 2e", b"3]"])) == [1.5, 2000.0]
+
+
+def test_truncated_body():
+    with pytest.raises(ValueError):
+        list(iter_json_array([b'[{"id": 1}, 2']))
+
+
+def test_not_an_array():
+    with pytest.raises(ValueError):
+        list(iter_json_array([b'{"id": 1}']))
+
+
+def test_invalid_element():
+    with pytest.raises(ValueError):
+        list(iter_json_array([b"[1.x]"]))